@@ -1,7 +1,17 @@
-"""Agents package initialization"""
-from .classification_agent import get_classification_agent, ClassificationAgent
+"""Agents package initialization
+
+Agents are imported on first access, so importing a single agent module
+(e.g. agents.rule_classifier) does not pull in the LLM and HTTP clients.
+"""
+import importlib
+
 #from .task_creation_agent import get_task_creation_agent, TaskCreationAgent
-from .task_execution_agent import get_task_execution_agent, TaskExecution
+_EXPORTS = {
+    "get_classification_agent": ".classification_agent",
+    "ClassificationAgent": ".classification_agent",
+    "get_task_execution_agent": ".task_execution_agent",
+    "TaskExecution": ".task_execution_agent",
+}
 
 __all__ = [
     "get_classification_agent",
@@ -11,3 +21,15 @@ __all__ = [
     "get_task_execution_agent",
     "TaskExecution",
 ]
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -1,25 +1,44 @@
 """
 Simple AI Agent with LLM
 """
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, Tuple
+import hashlib
 import json
 import re
+import threading
 from services.api_utils import get_api_utils
-from openai import AzureOpenAI
+from services.classification_cache import get_classification_cache
+from agents.rule_classifier import get_rule_classifier, RuleClassifier, RuleVerdict, UPDATE_INTENT_PATTERN
+from agents.classification_batcher import ClassificationBatcher
+from services.llm_client import get_llm_client
+from services.model_router import get_model_router
+from services.json_stream import IncrementalJSONParser, parse_first_json_object
+from services.metrics import get_metrics
 from config.settings import settings
 
+NOT_CLASSIFIED_PREFIX = re.compile(r'\{\s*"result"\s*:\s*"Not classified"')
+
+
 class ClassificationAgent:
     """
     Simple AI Agent with Azure OpenAI integration
     """
 
     def __init__(self):
-        self.client = AzureOpenAI(
-            api_key="",
-            api_version="2024-02-01",
-            azure_endpoint="https://moshe-m6dfn51l-eastus2.services.ai.azure.com"
-        )
-        self.deployment_name = "gpt-4o"
+        self.client = get_llm_client()
+        self.router = get_model_router()
+        self.cache = get_classification_cache()
+        self.rule_classifier = get_rule_classifier() if settings.app.enable_rule_classifier else None
+        self.streaming = settings.app.enable_streaming_classification
+        self.prompt_version = self._build_prompt_version()
+        self.cache.purge_stale(self.prompt_version)
+        self.batcher = None
+        if settings.app.enable_classification_batching:
+            self.batcher = ClassificationBatcher(
+                self,
+                max_batch_size=settings.app.classification_batch_size,
+                max_wait_ms=settings.app.classification_batch_wait_ms,
+            )
 
     async def generate_response(self, prompt: str, context: Dict[str, Any] = None) -> str:
         """
@@ -27,54 +46,248 @@ class ClassificationAgent:
 
         Args:
             prompt: The prompt/question to send to LLM
-            context: Additional context data
+            context: Additional context data; context["email"] holds the email to classify
 
         Returns:
             Generated response text
         """
         try:
-            # Build the full prompt with context
-            valid_user_msg = self._get_email_message()
-            unvalid_user_msg = self._build_unvalid_user_msg()
-            system_msg = self._build_system_msg()
-             # Call Azure OpenAI
-            response = self.client.chat.completions.create(
-                model=self.deployment_name,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": system_msg
-                    },
-                    {
-                        "role": "user",
-                        "content": valid_user_msg
-                    }
-                ],
-                temperature=0.7,
-                max_tokens=800
-            )
-
-            # Extract the response
-            result = response.choices[0].message.content
-            
-            # Extract only JSON from the response
-            print(f"LLM Response generated successfully")
-            json_result = self._extract_json(result)
-            url = "https://core-trunk-ci-qa.idit.sapiens.com:443/idit-web/api/workflow/createTask"
+            email = (context or {}).get("email") or json.loads(self._get_email_message(), strict=False)
+            json_result = await self.classify_email(email)
             if(self.is_valid_classification(json_result)):
                 print(f"Yes, valid classification create me task ! ")
-                response = get_api_utils().post_api(url, json_result)
+                response = await self.create_task(json_result)
             else:
                 print(f"No, invalid classification, do not create task ! ")
 
             return json_result
 
-
-
         except Exception as e:
             print(f"Error generating LLM response: {str(e)}")
             return "Sorry, I couldn't process your request at this time."
 
+    async def create_task(self, task_data: Dict[str, Any], idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Create the IDIT workflow task for a valid classification.
+
+        The request carries an Idempotency-Key so a retried POST cannot create
+        the task twice.
+
+        Args:
+            task_data: Task JSON produced by classification
+            idempotency_key: Key identifying this task, defaults to a hash of task_data
+
+        Returns:
+            IDIT createTask response
+        """
+        if idempotency_key is None:
+            canonical = json.dumps(task_data, sort_keys=True, ensure_ascii=False)
+            idempotency_key = "createTask-" + hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32]
+        return await get_api_utils().post_api_async("workflow/createTask", task_data, idempotency_key=idempotency_key)
+
+    async def classify_email(self, email: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Classify an email. Confident rule-based verdicts and cached results for
+        identical content are returned without calling the LLM.
+
+        Args:
+            email: Email dictionary with from/subject/body
+
+        Returns:
+            Task JSON if classified, otherwise {"result": "Not classified", ...}
+        """
+        metrics = get_metrics()
+        with metrics.span("agent.classification") as span:
+            source, result = await self._classify_email(email)
+            span.set("source", source)
+        metrics.inc("classifications_total", source=source)
+        return result
+
+    async def _classify_email(self, email: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        if self.rule_classifier is not None:
+            rule_result = self.rule_classifier.classify(email)
+            if rule_result.verdict == RuleVerdict.CLASSIFIED:
+                print(f"Classified by rule {rule_result.rule}")
+                return "rule", rule_result.task
+            if rule_result.verdict == RuleVerdict.NOT_CLASSIFIED:
+                print(f"Not classified by rule {rule_result.rule}")
+                return "rule", {"result": "Not classified", "rule": rule_result.rule}
+
+        key = self.cache.make_key(email, self.prompt_version)
+        cached = self.cache.get(key)
+        if cached is not None:
+            print(f"Classification served from cache")
+            return "cache", cached
+
+        if self.batcher is not None:
+            return "batch", await self.batcher.submit(email)
+        return "llm", await self.classify_with_llm(email)
+
+    async def classify_with_llm(self, email: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Classify a single email with Azure OpenAI and cache the result.
+
+        The email goes to the first healthy deployment of the "classify"
+        route, and is escalated to a larger deployment if the result is
+        malformed or not confident (see _is_confident).
+
+        Args:
+            email: Email dictionary with from/subject/body
+
+        Returns:
+            Task JSON if classified, otherwise {"result": "Not classified", ...}
+        """
+        messages = [
+            {
+                "role": "system",
+                "content": self._build_system_msg()
+            },
+            {
+                "role": "user",
+                "content": json.dumps(email, ensure_ascii=False, indent=2)
+            }
+        ]
+
+        async def classify(deployment: str) -> Dict[str, Any]:
+            if self.streaming:
+                return await self._classify_streaming(messages, deployment)
+            # Call Azure OpenAI
+            result = await self.client.chat_completion(
+                model=deployment,
+                messages=messages,
+                temperature=0,
+                max_tokens=800
+            )
+
+            # Extract only JSON from the response
+            print(f"LLM Response generated successfully by {deployment}")
+            return self._extract_json(result)
+
+        json_result = await self.router.run("classify", classify, lambda result: self._is_confident(email, result))
+        self._remember(email, json_result)
+        return json_result
+
+    @staticmethod
+    def _is_confident(email: Dict[str, Any], json_result: Dict[str, Any]) -> bool:
+        """
+        Whether a classification can be trusted without asking a larger model:
+        it parsed, a classified task names a contact that appears in the email
+        and a queue, and a "Not classified" answer is not contradicted by an
+        explicit contact id next to update wording.
+        """
+        if "error" in json_result:
+            return False
+        text = "\n".join(str(email.get(field) or "") for field in ("from", "subject", "body"))
+        if json_result.get("result") == "Not classified":
+            return not (RuleClassifier.extract_contact_ids(text) and UPDATE_INTENT_PATTERN.search(text))
+        contact = str(json_result.get("contactExtId") or "").strip()
+        return bool(json_result.get("queueId")) and bool(contact) and contact.casefold() in text.casefold()
+
+    async def _classify_streaming(self, messages: List[Dict[str, str]], deployment: str) -> Dict[str, Any]:
+        """
+        Stream the completion and stop as soon as the decision is known: either
+        a complete JSON object has been parsed, or the object being received
+        has started with {"result": "Not classified".
+        """
+        parser = IncrementalJSONParser()
+        not_classified = False
+
+        def on_chunk(chunk: str) -> bool:
+            nonlocal not_classified
+            if parser.feed(chunk) is not None:
+                return True
+            not_classified = NOT_CLASSIFIED_PREFIX.match(parser.partial) is not None
+            return not_classified
+
+        text = await self.client.stream_chat_completion(
+            messages,
+            on_chunk,
+            model=deployment,
+            temperature=0,
+            max_tokens=800
+        )
+        print(f"LLM streamed response decided after {len(text)} characters")
+        if parser.result is not None:
+            return parser.result
+        if not_classified:
+            return {"result": "Not classified"}
+        return {"result": "Not classified", "error": "No valid JSON found in response"}
+
+    async def classify_batch_with_llm(self, emails: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """
+        Classify several emails with one Azure OpenAI request.
+
+        Args:
+            emails: Emails keyed by message id
+
+        Returns:
+            Classification results keyed by message id. Ids missing from the
+            model output (or with a malformed entry) are absent.
+        """
+        batch = [
+            {"id": message_id, "from": email.get("from"), "subject": email.get("subject"), "body": email.get("body")}
+            for message_id, email in emails.items()
+        ]
+        result = await self.router.chat_completion(
+            "classify",
+            validate=lambda text: bool(self._extract_json_array(text)),
+            messages=[
+                {
+                    "role": "system",
+                    "content": self._build_system_msg() + self._build_batch_instructions()
+                },
+                {
+                    "role": "user",
+                    "content": json.dumps(batch, ensure_ascii=False)
+                }
+            ],
+            temperature=0,
+            max_tokens=min(400 * len(batch) + 400, 4096)
+        )
+        print(f"LLM batch response generated successfully for {len(batch)} emails")
+
+        results = {}
+        for item in self._extract_json_array(result):
+            if not isinstance(item, dict) or not isinstance(item.get("classification"), dict):
+                continue
+            message_id = str(item.get("id"))
+            if message_id in emails:
+                results[message_id] = item["classification"]
+                self._remember(emails[message_id], item["classification"])
+        return results
+
+    def _remember(self, email: Dict[str, Any], json_result: Dict[str, Any]):
+        """Cache a successfully parsed classification"""
+        if "error" not in json_result:
+            self.cache.set(self.cache.make_key(email, self.prompt_version), json_result, self.prompt_version)
+
+    @staticmethod
+    def _build_batch_instructions() -> str:
+        return """
+Batch Mode:
+The user message is a JSON array of emails. Each email has an "id" plus from, subject and body.
+Classify every email independently using the rules above.
+Respond with ONLY a JSON array containing one object per email, in this form:
+[{"id": "<email id>", "classification": <the JSON object you would return for that email>}]
+"""
+
+    @staticmethod
+    def _extract_json_array(text: str) -> List[Any]:
+        """Parse the JSON array in a batch response; returns [] if it is malformed"""
+        start, end = text.find("["), text.rfind("]")
+        if start == -1 or end <= start:
+            return []
+        try:
+            parsed = json.loads(text[start:end + 1])
+        except json.JSONDecodeError:
+            return []
+        return parsed if isinstance(parsed, list) else []
+
+    def _build_prompt_version(self) -> str:
+        """Hash of everything that shapes the classification output, used to version cached results"""
+        fingerprint = f"{'>'.join(self.router.deployments_for('classify'))}\x1f{self._build_system_msg()}"
+        return hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()[:16]
+
     def _build_prompt(self, prompt: str, context: Dict[str, Any] = None) -> str:
         """Build the full prompt with context"""
         if not context:
@@ -105,17 +318,12 @@ Please provide a helpful response."""
             return json.loads(text)
         except json.JSONDecodeError:
             pass
-        
-        # Look for JSON patterns in the text
-        json_pattern = r'\{(?:[^{}]|(?:\{[^{}]*\}))*\}'
-        matches = re.findall(json_pattern, text)
-        
-        for match in matches:
-            try:
-                return json.loads(match)
-            except json.JSONDecodeError:
-                continue
-        
+
+        # Single pass over the text for the first complete JSON object
+        json_result = parse_first_json_object(text)
+        if json_result is not None:
+            return json_result
+
         # If no JSON found, return error message
         return {"result": "Not classified", "error": "No valid JSON found in response"}
 
@@ -203,6 +411,7 @@ Extract the contact reference in this order:
 1. From the subject
 2. If not found, from the body
 3. If still not found, use the from field
+If the email also refers to a specific policy, claim or accounting record by its id, append each one as type:'id', e.g. "Contact: 415089 policy:'POL-123'"
 
 Remarks Logic:
 Set remarks to the actual request found in the email body — ideally the sentence or paragraph that describes what the sender wants done.
@@ -236,11 +445,14 @@ Return ONLY: {"result": "Not classified"}
         }"""
 # Singleton
 _classification_agent = None
+_classification_agent_lock = threading.Lock()
 
 
 def get_classification_agent() -> ClassificationAgent:
-    """Get or create classification AI agent singleton"""
+    """Get or create classification AI agent singleton (thread-safe, built on first use)"""
     global _classification_agent
     if _classification_agent is None:
-        _classification_agent = ClassificationAgent()
+        with _classification_agent_lock:
+            if _classification_agent is None:
+                _classification_agent = ClassificationAgent()
     return _classification_agent
@@ -0,0 +1,109 @@
+"""
+Classification Batcher
+Groups concurrent classification requests into multi-email LLM calls
+"""
+import asyncio
+import itertools
+from typing import Dict, Any, List, Optional, Tuple
+
+
+class ClassificationBatcher:
+    """
+    Collects emails until max_batch_size is reached or max_wait_ms has passed
+    since the first one arrived, then classifies the whole batch with one LLM
+    request and resolves each caller's awaitable with its own result.
+    Emails whose entry in the batch output is missing or malformed are
+    re-classified individually.
+    """
+
+    def __init__(self, agent, max_batch_size: int = 10, max_wait_ms: int = 200):
+        """
+        Args:
+            agent: ClassificationAgent providing classify_batch_with_llm/classify_with_llm
+            max_batch_size: Number of emails that triggers an immediate flush
+            max_wait_ms: Maximum time the first email of a batch waits for others
+        """
+        self.agent = agent
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._pending: List[Tuple[str, Dict[str, Any], asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._ids = itertools.count(1)
+        self._tasks = set()
+        self.batches = 0
+        self.fallbacks = 0
+
+    async def submit(self, email: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Queue an email for the next batch and wait for its classification.
+
+        Args:
+            email: Email dictionary with from/subject/body
+
+        Returns:
+            Task JSON if classified, otherwise {"result": "Not classified", ...}
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((self._message_id(email), email, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _message_id(self, email: Dict[str, Any]) -> str:
+        message_id = str(email.get("message_id") or f"m{next(self._ids)}")
+        if any(pending_id == message_id for pending_id, _, _ in self._pending):
+            message_id = f"{message_id}-{next(self._ids)}"
+        return message_id
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: List[Tuple[str, Dict[str, Any], asyncio.Future]]):
+        live = [(message_id, email, future) for message_id, email, future in batch if not future.done()]
+        if not live:
+            return
+        self.batches += 1
+        try:
+            try:
+                results = await self.agent.classify_batch_with_llm({message_id: email for message_id, email, _ in live})
+            except Exception as e:
+                print(f"Batch classification failed, falling back to single calls: {str(e)}")
+                results = {}
+
+            fallbacks = []
+            for message_id, email, future in live:
+                if future.done():
+                    continue
+                if message_id in results:
+                    future.set_result(results[message_id])
+                else:
+                    fallbacks.append(self._classify_single(email, future))
+            if fallbacks:
+                self.fallbacks += len(fallbacks)
+                await asyncio.gather(*fallbacks)
+        finally:
+            # If the batch was cancelled (shutdown, timeout) its callers must not wait forever
+            for _, _, future in live:
+                if not future.done():
+                    future.cancel()
+
+    async def _classify_single(self, email: Dict[str, Any], future: asyncio.Future):
+        try:
+            result = await self.agent.classify_with_llm(email)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(result)
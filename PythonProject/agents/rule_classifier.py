@@ -0,0 +1,213 @@
+"""
+Rule-based Pre-classifier
+Deterministic fast path run before the LLM classification
+"""
+import re
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Dict, Any, Optional, List
+
+
+class RuleVerdict(str, Enum):
+    CLASSIFIED = "classified"
+    NOT_CLASSIFIED = "not_classified"
+    UNCERTAIN = "uncertain"
+
+
+@dataclass
+class RuleResult:
+    verdict: RuleVerdict
+    rule: str
+    task: Optional[Dict[str, Any]] = None
+
+
+# Task fields the classification prompt asks the LLM to emit verbatim
+DEFAULT_TASK_FIELDS = {
+    "queueId": 10886,
+    "updateVersion": 0,
+    "priority": 1,
+    "followUpSuperType": 0,
+    "consequences": 0,
+    "id": 0,
+    "taskCategory": 0,
+}
+
+# Explicit contact markers listed in the classification prompt:
+# "Contact ID:", "contactExtId =", "contact #", "contact id", "contact number"
+CONTACT_ID_PATTERN = re.compile(
+    r"\bcontact(?:\s*ext\s*id|\s*id|\s*#|\s*number|\s*no\.?)\s*[:=#]?\s*#?\s*(\d{3,})\b"
+    r"|\bcontactExtId\s*[:=]\s*[\"']?(\w+)",
+    re.IGNORECASE
+)
+UPDATE_INTENT_PATTERN = re.compile(
+    r"\b(update|updating|change|changing|correct|correction|modify|amend|replace|moved|new address|new phone|new email|wrong)\b"
+    r"|עדכ|לשנות|שינוי|תיקון|לתקן|עברתי|כתובת חדשה",
+    re.IGNORECASE
+)
+CONTACT_DETAIL_PATTERN = re.compile(
+    r"\b(address|street|phone|mobile|e-?mail|name|zip|postal|contact (?:details|information|info))\b"
+    r"|כתובת|רחוב|טלפון|נייד|מייל|דוא\"ל",
+    re.IGNORECASE
+)
+IRRELEVANT_PATTERN = re.compile(
+    r"\b(meeting|reschedule|invitation|calendar|webinar|newsletter|unsubscribe|out of office|automatic reply|lunch|product launch)\b",
+    re.IGNORECASE
+)
+# "please do not update", "don't change", "no need to correct", "לא לעדכן", "אין צורך לשנות"
+NEGATION_PATTERN = re.compile(
+    r"\b(not|don'?t|doesn'?t|never|no need|cancel|ignore|disregard)\b|\bלא\b|\bאל\b|אין צורך|בטל",
+    re.IGNORECASE
+)
+# A request sentence: an imperative ("Update my phone..."), a polite request or a first-person change
+REQUEST_PATTERN = re.compile(
+    r"^\W*(?:please\s+|kindly\s+)?(update|change|correct|modify|amend|replace)\b"
+    r"|\b(please|kindly|i(?:'d| would) like to|i (?:want|need|wish) to|i(?:'ve| have)? moved"
+    r"|my new (?:address|phone|mobile|e-?mail|number) is)\b"
+    r"|\bנא\b|בבקשה|אבקש|ברצוני|אני רוצה|הייתי רוצה|עברתי",
+    re.IGNORECASE
+)
+# "How do I change...", "Can I update...", "איך משנים", "האם אפשר"
+QUESTION_PATTERN = re.compile(
+    r"\?|^\W*(how|what|when|where|why|can i|could i|is it possible|do i|should i)\b|\bאיך\b|\bהאם\b|\bמתי\b",
+    re.IGNORECASE
+)
+# Past-tense confirmations: "your request was completed", "has been updated", "עודכנה"
+CONFIRMATION_PATTERN = re.compile(
+    r"\b(?:has|have|had) been\b|\b(?:was|were) (?:\w+ )?(?:updated|changed|completed|processed|corrected|received|done)\b"
+    r"|\b(successfully|confirmation|we (?:have )?(?:updated|changed|corrected))\b|עודכנ|שונתה|בוצע",
+    re.IGNORECASE
+)
+# Reply and forward subject prefixes, and quoted earlier messages
+THREAD_PATTERN = re.compile(
+    r"^\s*(re|fwd?|aw|tr|sv)\s*:|^\s*(השב|הועבר)\s*:|^-+\s*original message|^>|^on .+ wrote:$",
+    re.IGNORECASE | re.MULTILINE
+)
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+class RuleClassifier:
+    """
+    Precompiled pattern/keyword classifier.
+
+    Returns CLASSIFIED (with the task JSON built directly) when an email has an
+    explicit contact id and a contact-update request phrased as one (an
+    imperative, "please...", "I moved..."), NOT_CLASSIFIED for obviously
+    unrelated mail, and UNCERTAIN for everything else, which is left to the
+    LLM: questions, replies and forwards, confirmations of earlier changes,
+    negated requests and mail that also matches an unrelated topic.
+    """
+
+    def __init__(self):
+        self.hits: Counter = Counter()
+
+    def classify(self, email: Dict[str, Any]) -> RuleResult:
+        """
+        Pre-classify an email.
+
+        Args:
+            email: Email dictionary with from/subject/body
+
+        Returns:
+            RuleResult with the verdict, the rule that decided it, and the task for CLASSIFIED
+        """
+        result = self._classify(email)
+        self.hits[result.rule] += 1
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        """Per-rule hit counts"""
+        return dict(self.hits)
+
+    def _classify(self, email: Dict[str, Any]) -> RuleResult:
+        subject = email.get("subject") or ""
+        body = email.get("body") or ""
+        text = f"{subject}\n{body}"
+
+        contact_ids = self.extract_contact_ids(text)
+        has_intent = UPDATE_INTENT_PATTERN.search(text) is not None
+        has_detail = CONTACT_DETAIL_PATTERN.search(text) is not None
+
+        if len(contact_ids) == 1 and has_intent and has_detail:
+            unclear = self._unclear_request(subject, body)
+            if unclear is not None:
+                return RuleResult(RuleVerdict.UNCERTAIN, unclear)
+            contact_id = contact_ids[0]
+            return RuleResult(RuleVerdict.CLASSIFIED, "explicit_contact_update",
+                              self._build_task(contact_id, subject, body))
+        if len(contact_ids) > 1:
+            return RuleResult(RuleVerdict.UNCERTAIN, "ambiguous_contact_ids")
+        if not contact_ids and not has_intent and not has_detail and IRRELEVANT_PATTERN.search(text):
+            return RuleResult(RuleVerdict.NOT_CLASSIFIED, "irrelevant_topic")
+        return RuleResult(RuleVerdict.UNCERTAIN, "no_rule_matched")
+
+    @staticmethod
+    def extract_contact_ids(text: str) -> List[str]:
+        """Distinct explicit contact ids in order of appearance"""
+        ids = []
+        for match in CONTACT_ID_PATTERN.finditer(text):
+            contact_id = match.group(1) or match.group(2)
+            if contact_id not in ids:
+                ids.append(contact_id)
+        return ids
+
+    @staticmethod
+    def _unclear_request(subject: str, body: str) -> Optional[str]:
+        """
+        The rule leaving an email with update keywords to the LLM, or None if
+        it is a plain update request.
+        """
+        text = f"{subject}\n{body}"
+        if THREAD_PATTERN.search(text):
+            return "reply_or_forward"
+        if IRRELEVANT_PATTERN.search(text):
+            return "mixed_topic"
+        sentences = [s.strip() for s in SENTENCE_SPLIT.split(text) if s.strip()]
+        if any(UPDATE_INTENT_PATTERN.search(s) and NEGATION_PATTERN.search(s) for s in sentences):
+            return "negated_request"
+        if CONFIRMATION_PATTERN.search(text):
+            return "confirmation"
+        if any(QUESTION_PATTERN.search(s) for s in sentences):
+            return "question"
+        if not any(REQUEST_PATTERN.search(s) for s in sentences):
+            return "no_request_phrasing"
+        return None
+
+    @staticmethod
+    def _build_task(contact_id: str, subject: str, body: str) -> Dict[str, Any]:
+        now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+        return {
+            **DEFAULT_TASK_FIELDS,
+            "contactExtId": contact_id,
+            "dueOn": now,
+            "startHandlingOn": now,
+            "taskDescription": f"Contact: {contact_id}",
+            "remarks": RuleClassifier._extract_request(subject, body),
+        }
+
+    @staticmethod
+    def _extract_request(subject: str, body: str) -> str:
+        """
+        The sentences of the subject and body that describe the requested
+        change; the whole body when none of its sentences does (it then
+        carries the new value, e.g. "My new number is 050-1234567").
+        """
+        def requests(text: str) -> List[str]:
+            sentences = [s.strip() for s in SENTENCE_SPLIT.split(text) if s.strip()]
+            return [s for s in sentences if UPDATE_INTENT_PATTERN.search(s) or CONTACT_DETAIL_PATTERN.search(s)]
+
+        body_requests = requests(body) or ([body.strip()] if body.strip() else [])
+        return " ".join(requests(subject) + body_requests)
+
+
+# Singleton
+_rule_classifier = None
+
+
+def get_rule_classifier() -> RuleClassifier:
+    """Get or create rule classifier singleton"""
+    global _rule_classifier
+    if _rule_classifier is None:
+        _rule_classifier = RuleClassifier()
+    return _rule_classifier
@@ -1,8 +1,10 @@
 """
 Simple AI Agent with LLM
 """
-from typing import Dict, Any
-from openai import AzureOpenAI
+import threading
+from typing import Dict, Any, Callable, Optional
+from services.metrics import get_metrics
+from services.model_router import get_model_router
 
 
 class SimpleAIAgent:
@@ -11,32 +13,42 @@ class SimpleAIAgent:
     """
 
     def __init__(self):
-        self.client = AzureOpenAI(
-            api_key="",
-            api_version="2024-02-01",
-            azure_endpoint="https://moshe-m6dfn51l-eastus2.services.ai.azure.com"
-        )
-        self.deployment_name = "gpt-4o"
-
-    async def generate_response(self, prompt: str, context: Dict[str, Any] = None) -> str:
+        self.router = get_model_router()
+
+    async def generate_response(self, prompt: str, context: Dict[str, Any] = None,
+                                temperature: float = 0.7, max_tokens: int = 800, task: str = "rewrite",
+                                validate: Optional[Callable[[str], bool]] = None) -> str:
         """
         Generate response using LLM
 
         Args:
             prompt: The prompt/question to send to LLM
             context: Additional context data
+            temperature: Sampling temperature
+            max_tokens: Maximum number of tokens to generate
+            task: Model router task deciding which deployments answer
+            validate: Returns False for responses that should be escalated to a larger deployment
 
         Returns:
             Generated response text
+
+        Raises:
+            Exception: The LLM error once retries are exhausted, so callers can fail the message
         """
         print("Generating LLM response...")
+        with get_metrics().span("agent.simple_ai"):
+            return await self._generate_response(prompt, context, temperature, max_tokens, task, validate)
+
+    async def _generate_response(self, prompt: str, context: Dict[str, Any], temperature: float, max_tokens: int,
+                                 task: str, validate: Optional[Callable[[str], bool]]) -> str:
         try:
             # Build the full prompt with context
             full_prompt = self._build_prompt(prompt, context)
 
             # Call Azure OpenAI
-            response = self.client.chat.completions.create(
-                model=self.deployment_name,
+            result = await self.router.chat_completion(
+                task,
+                validate=validate,
                 messages=[
                     {
                         "role": "system",
@@ -47,13 +59,10 @@ class SimpleAIAgent:
                         "content": full_prompt
                     }
                 ],
-                temperature=0.7,
-                max_tokens=800
+                temperature=temperature,
+                max_tokens=max_tokens
             )
 
-            # Extract the response
-            result = response.choices[0].message.content
-
             print(f"LLM Response generated successfully")
              #describe LLM abilities
             print("this agent get message as input, and performing all the required changes. if updates: it support impot transalation from different languages,and in case of address update, it calculate the ZIP code.")
@@ -61,7 +70,7 @@ class SimpleAIAgent:
 
         except Exception as e:
             print(f"Error generating LLM response: {str(e)}")
-            return "Sorry, I couldn't process your request at this time."
+            raise
 
     def _build_prompt(self, prompt: str, context: Dict[str, Any] = None) -> str:
         """Build the full prompt with context"""
@@ -81,11 +90,14 @@ Please provide a helpful response."""
 
 # Singleton
 _simple_ai_agent = None
+_simple_ai_agent_lock = threading.Lock()
 
 
 def get_simple_ai_agent() -> SimpleAIAgent:
-    """Get or create simple AI agent singleton"""
+    """Get or create simple AI agent singleton (thread-safe, built on first use)"""
     global _simple_ai_agent
     if _simple_ai_agent is None:
-        _simple_ai_agent = SimpleAIAgent()
+        with _simple_ai_agent_lock:
+            if _simple_ai_agent is None:
+                _simple_ai_agent = SimpleAIAgent()
     return _simple_ai_agent
@@ -2,10 +2,35 @@
 Task Execution Agent
 Executes tasks by calling IDIT API and manages response handling
 """
+from typing import Dict, Any, List, Optional, Tuple
+import asyncio
+import threading
+import httpx
 from services.api_utils import get_api_utils
+from services.entity_cache import get_entity_cache
+from services.entity_registry import EntitySpec, get_entity_spec, parse_entity_references
+from services.json_patch import JsonPatchError, apply_patch, compact_json, parse_patch
+from services.metrics import get_metrics
+from services.transliteration import get_transliterator
+from services.zip_lookup import get_zip_lookup
 from agents.simple_ai_agent import get_simple_ai_agent
+from agents.update_coalescer import UpdateCoalescer
+from config.settings import settings
 import json
 
+# IDIT rejects a PUT whose updateVersion is no longer current with one of these
+VERSION_CONFLICT_STATUS_CODES = (409, 412)
+MAX_CONFLICT_RETRIES = 3
+
+FULL_OBJECT_PROMPT = "You are a JSON-processing assistant for API tasks. Your input includes a task type, a category, a free-text instruction, and a JSON object. Your job is to: Interpret the free text. Identify entities (such as name, city, street, number, phone, email, etc.) even if not explicitly labeled. Update or extract data in the JSON object accordingly.Output a valid JSON object — nothing else.Use common sense and linguistic cues to understand context. For example, detect that city name, street name, and number refers to a house number. make sure to put all fields in english if required translate the input."
+
+JSON_PATCH_PROMPT = "You are a JSON-processing assistant for API tasks. Your input includes a free-text instruction and the updatable fields of an entity as a JSON object. Interpret the free text and identify entities (such as name, city, street, house number, phone, email, etc.) even if not explicitly labeled. If the instruction is a numbered list, apply every item in order, later items overriding earlier ones. Output ONLY an RFC 6902 JSON Patch array with the operations needed to apply the instruction, e.g. [{\"op\":\"replace\",\"path\":\"/address/city\",\"value\":\"Haifa\"}]. Only use paths of fields in the object, do not repeat unchanged values, and output [] if nothing should change. Make sure to put all values in english, if required translate the input."
+
+# Appended to the prompts depending on whether ZIP codes come from the local index or from the LLM
+COMPUTE_ZIP_CODE_PROMPT = " Based on the exact address modify the zip code."
+KEEP_ZIP_CODE_PROMPT = " Do not change zip codes unless the instruction gives one, they are filled in from the address automatically."
+USE_TRANSLITERATIONS_PROMPT = " When a name, street or city you write in English is one of the given Hebrew words, spell it as in the given transliterations."
+
 
 class TaskExecution:
     """
@@ -13,53 +38,381 @@ class TaskExecution:
     Handles API calls, response processing, and reply generation
     """
 
-    updateContactUrl = ""
-
     def __init__(self):
-        self.updateContactUrl = ""
+        self.coalescer = None
+        if settings.app.enable_update_coalescing:
+            self.coalescer = UpdateCoalescer(
+                self,
+                window_ms=settings.app.update_coalescing_window_ms,
+                max_instructions=settings.app.update_coalescing_max_instructions,
+            )
+
+    async def get_task_data(self, task_data, sequence: Optional[int] = None):
+        """
+        Execute a classified task against IDIT.
 
-    async def get_task_data(self, task_data):
-        #category = task_data.get('category')  # entity in IDIT e.g. contact , policy, claim , accounting
+        Args:
+            task_data: Task JSON from the classification agent
+            sequence: Arrival order of the originating message, used to order coalesced instructions
+
+        Returns:
+            The updated entity as JSON text; for a task referencing several
+            entities, a JSON object of the results keyed by "type:id"
+        """
+        with get_metrics().span("agent.task_execution", contact=task_data.get('contactExtId')):
+            return await self._execute_task(task_data, sequence)
+
+    async def _execute_task(self, task_data, sequence: Optional[int] = None):
         #task_type = task_data.get('taskType')  # update/get/remove/create
-        entity_description = task_data.get('taskDescription')  # json from classification agent, in format entity:id
-        entity = entity_description.split(":")[
-            0]  # in case of more than one entity , it will keep the same format, e.g. contact:123 policy: 'abc'
-        entity_id = task_data.get('contactExtId')
-
-        entityDetails = get_api_utils().get_api(f"https://core-trunk-ci-qa.idit.sapiens.com:443/idit-web/api/contact/{entity_id}")
-        # for k, v in entityDetails.items():
-        # print(f"{k}:{v}")
+        references = self.entity_references(task_data)
+        if not references:
+            raise ValueError(f"Task does not reference any entity: {task_data.get('taskDescription')!r}")
+        instruction = task_data.get('remarks')
+
+        if settings.app.task_execution_mode == "full":
+            entities = await self.fetch_entities(references)
+            responses = await asyncio.gather(*(
+                self._rewrite_full_object(task_data, entities[reference]) for reference in references
+            ))
+            return self._combine_results(references, responses)
+        if references == [("contact", references[0][1])]:
+            entity_id = references[0][1]
+            if self.coalescer is not None:
+                return await self.coalescer.submit(entity_id, instruction, sequence)
+            return await self.apply_contact_instructions(entity_id, [instruction])
+        entities = await self.fetch_entities(references)
+        responses = await asyncio.gather(*(
+            self.apply_entity_instructions(entity_type, entity_id, [instruction], entities[(entity_type, entity_id)])
+            for entity_type, entity_id in references
+        ))
+        return self._combine_results(references, responses)
+
+    @staticmethod
+    def entity_references(task_data: Dict[str, Any]) -> List[Tuple[str, str]]:
+        """
+        Entities a task refers to, from its taskDescription ("contact:123 policy:'abc'").
+        The classified contactExtId comes first and replaces any contact
+        reference in the description, which may be a name rather than an id.
+        """
+        references = parse_entity_references(task_data.get('taskDescription'))
+        contact_id = task_data.get('contactExtId')
+        if contact_id:
+            references = [("contact", str(contact_id))] + [
+                reference for reference in references if reference[0] != "contact"
+            ]
+        return references
+
+    @staticmethod
+    def _combine_results(references: List[Tuple[str, str]], responses: List[str]) -> str:
+        if len(responses) == 1:
+            return responses[0]
+        combined = {}
+        for (entity_type, entity_id), response in zip(references, responses):
+            try:
+                combined[f"{entity_type}:{entity_id}"] = json.loads(response)
+            except json.JSONDecodeError:
+                combined[f"{entity_type}:{entity_id}"] = response
+        return compact_json(combined)
+
+    async def _rewrite_full_object(self, task_data: Dict[str, Any], entity: Dict[str, Any]) -> str:
+        """Ask the LLM to regenerate the whole entity with the instruction applied"""
         agent = get_simple_ai_agent()
+        prompt, extra_context = await self._prompt_with_context(FULL_OBJECT_PROMPT, task_data.get('remarks'))
 
         # שלח prompt ל-LLM
         response = await agent.generate_response(
-            prompt="You are a JSON-processing assistant for API tasks. Your input includes a task type, a category, a free-text instruction, and a JSON object. Your job is to: Interpret the free text. Identify entities (such as name, city, street, number, phone, email, etc.) even if not explicitly labeled. Update or extract data in the JSON object accordingly.Output a valid JSON object — nothing else.Use common sense and linguistic cues to understand context. For example, detect that city name, street name, and number refers to a house number. based on the exact address modify the zip code,make sure to put all fields in english if required translate the input",
+            prompt=prompt,
             context={
                 'task_type': "PUT",
-                'massage': "Update my name to  מלכה ברויאר and i moved apartment to '8 בעל התניא street Bnei Brak.",
-                'JSON': json.dumps(entityDetails, indent=2)
-            }
+                **extra_context,
+                'massage': task_data.get('remarks'),
+                'JSON': json.dumps(entity, indent=2)
+            },
+            task="rewrite",
+            validate=self._is_json_object
         )
 
         print(response)
+        if get_zip_lookup() is not None:
+            try:
+                updated = json.loads(response)
+            except json.JSONDecodeError:
+                return response
+            if isinstance(updated, dict):
+                self._fill_zip_codes(entity, updated)
+                return json.dumps(updated, indent=2, ensure_ascii=False)
+        return response
+
+    async def apply_contact_instructions(self, entity_id: str, instructions: List[str]) -> str:
+        """Apply free-text instructions to a contact, see apply_entity_instructions"""
+        return await self.apply_entity_instructions("contact", entity_id, instructions)
+
+    async def apply_entity_instructions(self, entity_type: str, entity_id: str, instructions: List[str],
+                                        entity: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Apply one or more free-text instructions to an entity with a single
+        fetch, LLM call and PUT.
+
+        The PUT is only sent when AppSettings.enable_entity_updates is set;
+        otherwise the patched entity is computed and returned without
+        writing it to IDIT. The PUT carries the fetched updateVersion, so IDIT rejects it if the
+        entity changed in the meantime; the entity is then re-fetched and
+        the same patch re-applied (asking the LLM again only if the patch no
+        longer applies), up to MAX_CONFLICT_RETRIES times.
+
+        Args:
+            entity_type: Registered entity type, e.g. "contact"
+            entity_id: Id of the entity (contactExtId for contacts)
+            instructions: Instructions in the order they should be applied
+            entity: The entity if it was already fetched
+
+        Returns:
+            The updated entity as compact JSON
+
+        Raises:
+            KeyError: If the entity type is not registered
+            JsonPatchError: If the model output is not a valid patch for this entity
+            httpx.HTTPError: If the update failed, or still conflicted after the retries
+        """
+        spec = get_entity_spec(entity_type)
+        if entity is None:
+            entity = await self.fetch_entity(entity_type, entity_id)
+        patch = await self._propose_patch(spec, instructions, entity)
+        for attempt in range(MAX_CONFLICT_RETRIES + 1):
+            try:
+                updated = self._apply_entity_patch(spec, entity, patch)
+            except JsonPatchError:
+                if attempt == 0:
+                    raise
+                # The concurrent change invalidated the patch, derive a new one from the fresh entity
+                patch = await self._propose_patch(spec, instructions, entity)
+                updated = self._apply_entity_patch(spec, entity, patch)
+            self._fill_zip_codes(entity, updated)
+            print(f"Applying {len(patch)} patch operation(s) to {entity_type} {entity_id}: {compact_json(patch)}")
+            if updated == entity:
+                return compact_json(updated)
+            if not settings.app.enable_entity_updates:
+                print(f"IDIT updates are disabled (ENABLE_ENTITY_UPDATES=false), not updating {entity_type} {entity_id}")
+                return compact_json(updated)
+            try:
+                await self.update_entity(entity_type, entity_id, updated)
+                return compact_json(updated)
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code not in VERSION_CONFLICT_STATUS_CODES or attempt == MAX_CONFLICT_RETRIES:
+                    raise
+                current_version = self._conflict_version(e.response)
+            get_metrics().inc("contact_update_conflicts_total", entity=entity_type)
+            print(f"updateVersion {entity.get('updateVersion')} of {entity_type} {entity_id} is stale, re-fetching")
+            entity = await self.fetch_entity(entity_type, entity_id, update_version=current_version)
+
+    async def _propose_patch(self, spec: EntitySpec, instructions: List[str],
+                             entity: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Ask the LLM for a JSON Patch against the updatable fields only, so
+        generated tokens scale with the size of the change rather than the
+        size of the entity.
+
+        A response that is not a patch applicable to the entity is escalated
+        to a larger deployment by the model router.
+
+        Raises:
+            JsonPatchError: If the model output is not a JSON Patch
+        """
+        editable = {field: entity[field] for field in spec.updatable_fields if field in entity}
+        if len(instructions) == 1:
+            instruction = instructions[0]
+        else:
+            instruction = "\n".join(f"{number}. {text}" for number, text in enumerate(instructions, 1))
+        agent = get_simple_ai_agent()
+        prompt, extra_context = await self._prompt_with_context(JSON_PATCH_PROMPT, instruction)
+        response = await agent.generate_response(
+            prompt=prompt,
+            context={
+                'task_type': "PATCH",
+                **extra_context,
+                'massage': instruction,
+                'JSON': compact_json(editable)
+            },
+            temperature=0,
+            max_tokens=400,
+            task="rewrite",
+            validate=lambda text: self._applies_to(spec, entity, text)
+        )
+
+        patch = parse_patch(response)
+        get_metrics().inc("json_patch_operations_total", len(patch))
+        return patch
+
+    @staticmethod
+    async def _prompt_with_context(prompt: str, instruction: Optional[str]) -> Tuple[str, Dict[str, Any]]:
+        """
+        Complete a prompt for the configured ZIP handling, and look up the
+        cached transliterations of the Hebrew words in the instruction.
+
+        Returns:
+            The prompt, and extra context entries for the LLM call
+        """
+        prompt += KEEP_ZIP_CODE_PROMPT if get_zip_lookup() is not None else COMPUTE_ZIP_CODE_PROMPT
+        if not settings.app.enable_transliteration:
+            return prompt, {}
+        try:
+            transliterations = await get_transliterator().transliterate_text(instruction)
+        except Exception as e:
+            print(f"Error transliterating instruction: {str(e)}")
+            return prompt, {}
+        if not transliterations:
+            return prompt, {}
+        return prompt + USE_TRANSLITERATIONS_PROMPT, {'transliterations': compact_json(transliterations)}
+
+    @staticmethod
+    def _fill_zip_codes(original: Dict[str, Any], updated: Dict[str, Any]):
+        """
+        Look up the ZIP code of every address that differs from the original
+        contact; on a miss, a ZIP code left over from the old address is cleared
+        """
+        zip_lookup = get_zip_lookup()
+        if zip_lookup is None:
+            return
+        if isinstance(updated.get("address"), dict) and updated["address"] != original.get("address"):
+            previous = original.get("address") if isinstance(original.get("address"), dict) else None
+            zip_lookup.fill_zip_code(updated["address"], previous)
+        if isinstance(updated.get("addresses"), list):
+            previous = original.get("addresses") if isinstance(original.get("addresses"), list) else []
+            for position, address in enumerate(updated["addresses"]):
+                if isinstance(address, dict) and (position >= len(previous) or address != previous[position]):
+                    replaced = previous[position] if position < len(previous) else None
+                    zip_lookup.fill_zip_code(address, replaced if isinstance(replaced, dict) else None)
+
+    @classmethod
+    def _applies_to(cls, spec: EntitySpec, entity: Dict[str, Any], text: str) -> bool:
+        """Whether an LLM response is a JSON Patch that applies to the entity"""
+        try:
+            cls._apply_entity_patch(spec, entity, parse_patch(text))
+        except JsonPatchError:
+            return False
+        return True
+
+    @staticmethod
+    def _conflict_version(response: httpx.Response) -> Optional[int]:
+        """Current updateVersion reported in a 409/412 response body, if IDIT included one"""
+        try:
+            body = response.json()
+        except ValueError:
+            return None
+        if isinstance(body, dict) and isinstance(body.get("updateVersion"), int):
+            return body["updateVersion"]
+        return None
+
+    @staticmethod
+    def _is_json_object(text: str) -> bool:
+        try:
+            return isinstance(json.loads(text), dict)
+        except json.JSONDecodeError:
+            return False
+
+    @staticmethod
+    def _apply_entity_patch(spec: EntitySpec, entity: Dict[str, Any], patch: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return apply_patch(entity, patch, allowed_paths=spec.allowed_paths())
+
+    async def fetch_entities(self, references: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """
+        Fetch several entities concurrently, so a multi-entity task waits for
+        its slowest fetch rather than the sum of all of them.
+
+        Args:
+            references: (entity type, id) pairs
+
+        Returns:
+            Entity dictionaries keyed by reference
+        """
+        with get_metrics().span("agent.fetch_entities", count=len(references)):
+            entities = await asyncio.gather(*(
+                self.fetch_entity(entity_type, entity_id) for entity_type, entity_id in references
+            ))
+        return dict(zip(references, entities))
+
+    async def fetch_entity(self, entity_type: str, entity_id: str,
+                           update_version: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Fetch an IDIT entity through the entity cache.
+
+        Args:
+            entity_type: Registered entity type, e.g. "policy"
+            entity_id: Id of the entity
+            update_version: Known current updateVersion; forces a re-fetch if the cached copy differs
+
+        Returns:
+            Entity dictionary
+
+        Raises:
+            KeyError: If the entity type is not registered
+        """
+        spec = get_entity_spec(entity_type)
+        url = spec.get_endpoint(entity_id)
+        return await get_entity_cache().get(
+            spec.cache_key(entity_id),
+            lambda: get_api_utils().get_api_async(url),
+            update_version=update_version
+        )
+
+    async def fetch_contact(self, entity_id: str, update_version: Optional[int] = None) -> Dict[str, Any]:
+        """Fetch an IDIT contact by contactExtId through the entity cache"""
+        return await self.fetch_entity("contact", entity_id, update_version)
+
+    async def update_entity(self, entity_type: str, entity_id: str, entity: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        PUT an updated entity to IDIT and refresh its cached copy.
+
+        When IDIT answers with the stored entity (a newer updateVersion than
+        the one sent) it replaces the cached copy; otherwise, and when the
+        PUT fails (e.g. a 409/412 conflict), the cached copy is invalidated
+        so the next read fetches the current entity.
+
+        Args:
+            entity_type: Registered entity type, e.g. "contact"
+            entity_id: Id of the entity
+            entity: Full updated entity, including the updateVersion it was based on
+
+        Returns:
+            IDIT response
 
-    # getEntityBiId - decide which entity to fetch from DB (using api data list - in future MCP, Example below)
+        Raises:
+            httpx.HTTPError: If the update failed after retries (409/412 if updateVersion is stale)
+        """
+        spec = get_entity_spec(entity_type)
+        url = spec.put_endpoint(entity_id)
+        cache = get_entity_cache()
+        key = spec.cache_key(entity_id)
+        try:
+            response = await get_api_utils().put_api_async(url, entity)
+        except BaseException:
+            cache.invalidate(key)
+            raise
+        sent_version = entity.get("updateVersion")
+        stored_version = response.get("updateVersion") if isinstance(response, dict) else None
+        if isinstance(sent_version, int) and isinstance(stored_version, int) and stored_version > sent_version:
+            cache.put(key, response)
+        else:
+            cache.invalidate(key)
+        return response
 
-    # Api data list / MCP example
-    # list = {
-    #     "category": "contact", { }
-    #     {"api": 'api/updateContact', {"contactId": entity_id,"contactName":"name" } , {'api/updatePolicy',{'contactId', entity "policyId":'123'}}} }
+    async def update_contact(self, entity_id: str, entity: Dict[str, Any]) -> Dict[str, Any]:
+        """PUT an updated contact to IDIT and refresh its cached copy"""
+        return await self.update_entity("contact", entity_id, entity)
 
 
 # Singleton instance
 
 
 _task_execution = None
+_task_execution_lock = threading.Lock()
 
 
 def get_task_execution_agent() -> TaskExecution:
-    """Get or create task execution agent singleton"""
+    """Get or create task execution agent singleton (thread-safe, built on first use)"""
     global _task_execution
     if _task_execution is None:
-        _task_execution = TaskExecution()
+        with _task_execution_lock:
+            if _task_execution is None:
+                _task_execution = TaskExecution()
     return _task_execution
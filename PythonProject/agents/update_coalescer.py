@@ -0,0 +1,103 @@
+"""
+Update Coalescer
+Merges bursts of update instructions for the same contact into one update run
+"""
+import asyncio
+import itertools
+from typing import Dict, List, Optional, Tuple
+
+from services.metrics import get_metrics
+
+
+class UpdateCoalescer:
+    """
+    Collects update instructions per contactExtId for window_ms after the
+    first one arrives, then applies all of them with a single
+    fetch/LLM/PUT run and resolves every caller with its result.
+    Instructions are passed on in sequence order (arrival order when no
+    sequence is given), so later instructions override earlier ones. Runs
+    for the same contact never overlap: instructions arriving during a run
+    are collected into the next one.
+    """
+
+    def __init__(self, agent, window_ms: int = 500, max_instructions: int = 10):
+        """
+        Args:
+            agent: TaskExecution providing apply_contact_instructions
+            window_ms: How long the first instruction for a contact waits for others
+            max_instructions: Number of pending instructions that triggers an immediate run
+        """
+        self.agent = agent
+        self.window = window_ms / 1000
+        self.max_instructions = max_instructions
+        self._pending: Dict[str, List[Tuple[Tuple[float, int], str, asyncio.Future]]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._running: Dict[str, asyncio.Task] = {}
+        self._arrivals = itertools.count()
+        self.runs = 0
+        self.coalesced = 0
+
+    async def submit(self, entity_id: str, instruction: str, sequence: Optional[int] = None) -> str:
+        """
+        Queue an instruction for the contact's next update run and wait for it.
+
+        Args:
+            entity_id: contactExtId of the contact to update
+            instruction: Free-text update instruction
+            sequence: Position of the originating message in arrival order
+
+        Returns:
+            The updated contact as compact JSON, shared by every instruction of the run
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        order = (sequence if sequence is not None else float("inf"), next(self._arrivals))
+        pending = self._pending.setdefault(entity_id, [])
+        pending.append((order, instruction, future))
+
+        if len(pending) >= self.max_instructions:
+            self._flush(entity_id)
+        elif entity_id not in self._timers:
+            self._timers[entity_id] = loop.call_later(self.window, self._flush, entity_id)
+        return await future
+
+    def _flush(self, entity_id: str):
+        timer = self._timers.pop(entity_id, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(entity_id, [])
+        if not batch:
+            return
+        previous = self._running.get(entity_id)
+        task = asyncio.ensure_future(self._run(entity_id, sorted(batch, key=lambda item: item[0]), previous))
+        self._running[entity_id] = task
+        task.add_done_callback(lambda done: self._forget(entity_id, done))
+
+    def _forget(self, entity_id: str, task: asyncio.Task):
+        if self._running.get(entity_id) is task:
+            del self._running[entity_id]
+
+    async def _run(self, entity_id: str, batch: List[Tuple[Tuple[float, int], str, asyncio.Future]],
+                   previous: Optional[asyncio.Task]):
+        if previous is not None:
+            # Wait for the contact's previous run so its PUT is not raced
+            await asyncio.gather(previous, return_exceptions=True)
+        live = [(instruction, future) for _, instruction, future in batch if not future.done()]
+        if not live:
+            return
+        self.runs += 1
+        self.coalesced += len(live) - 1
+        get_metrics().inc("contact_update_runs_total")
+        get_metrics().inc("contact_update_instructions_total", len(live))
+        if len(live) > 1:
+            print(f"Coalescing {len(live)} update instructions for contact {entity_id}")
+        try:
+            result = await self.agent.apply_contact_instructions(entity_id, [instruction for instruction, _ in live])
+        except Exception as e:
+            for _, future in live:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for _, future in live:
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,297 @@
+"""
+End-to-end Pipeline Benchmark
+Drives Orchestrator.process_message with synthetic email load against local
+stub LLM and IDIT servers, and reports throughput, per-stage latency
+percentiles and peak RSS.
+
+Usage:
+    python benchmarks/pipeline_bench.py --rates 10 50 --concurrency 5 20 --messages 200 \\
+        --llm-latency-ms 800 --llm-jitter-ms 200 --output bench_results.json
+    python benchmarks/pipeline_bench.py ... --compare bench_results_baseline.json
+    python benchmarks/pipeline_bench.py --no-rules --model-routes "classify=gpt-4o-mini>gpt-4o" \
+        --model-deployments "gpt-4o-mini:slo=1:prompt=0.15:completion=0.6,gpt-4o:slo=3:prompt=2.5:completion=10" \
+        --model-latency-ms gpt-4o-mini=200 gpt-4o=800
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Any, List
+
+# Add project root to Python path
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from benchmarks.stub_servers import StubLLMServer, StubIDITServer
+from config.settings import settings
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+EXPLICIT_TEMPLATES = [
+    ("Correction needed for Contact ID: {cid}", "Hi,\n\nPlease update the email address for Contact ID: {cid}. The correct email is user{n}@insureplus.com.\n\nThanks"),
+    ("Change of address", "Hello,\n\nplease change the address of contact # {cid} to {n} Herzl Street, Tel Aviv.\n\nRegards"),
+]
+AMBIGUOUS_TEMPLATES = [
+    ("Question about contact {cid}", "Hi, regarding contact {cid} - can you take a look at the record? Ref {n}"),
+    ("Follow up {n}", "Hello, just following up on my previous message, ref {n}."),
+]
+IRRELEVANT_TEMPLATES = [
+    ("Meeting reschedule request", "Hi,\n\nCan we reschedule our meeting to next Wednesday at 10am? ({n})\n\nThanks"),
+]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """Latency summary in milliseconds"""
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+    }
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process (Linux reports KB, macOS bytes)"""
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def build_messages(count: int, run_id: str, contacts: int, mix: Dict[str, float], rng: random.Random,
+                   urgent_ratio: float = 0.0) -> List[Dict[str, Any]]:
+    """
+    Synthetic channel messages; every message is unique so caches only help on contact reuse.
+    With urgent_ratio > 0, that share is marked priority "high" and the rest "normal".
+    """
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    templates = {"explicit": EXPLICIT_TEMPLATES, "ambiguous": AMBIGUOUS_TEMPLATES, "irrelevant": IRRELEVANT_TEMPLATES}
+    messages = []
+    for n in range(count):
+        subject, body = rng.choice(templates[rng.choices(kinds, weights)[0]])
+        cid = str(100000 + rng.randrange(contacts))
+        messages.append({
+            "message_id": f"{run_id}-{n}",
+            "title": subject.format(cid=cid, n=n),
+            "content": body.format(cid=cid, n=f"{run_id}-{n}"),
+            "sender": f"sender{n % 50}@insureplus.com",
+            "channel": "benchmark",
+        })
+        if urgent_ratio > 0:
+            messages[-1]["priority"] = "high" if rng.random() < urgent_ratio else "normal"
+    return messages
+
+
+async def run_load(rate: float, concurrency: int, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Open-loop load: message i arrives at i / rate seconds, regardless of completions"""
+    from orchestarator import Orchestrator
+    from services.entity_cache import get_entity_cache
+
+    settings.app.max_concurrent_tasks = concurrency
+    get_entity_cache().clear()
+    orchestrator = Orchestrator()
+
+    latencies: List[float] = []
+    by_priority: Dict[str, List[float]] = {}
+    stages: Dict[str, List[float]] = {}
+    statuses: Dict[str, int] = {}
+    speculations: List[Dict[str, Any]] = []
+
+    async def one(message: Dict[str, Any], arrival: float):
+        delay = arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        result = await orchestrator.process_message(message)
+        latencies.append(time.perf_counter() - arrival)
+        if message.get("priority"):
+            by_priority.setdefault(message["priority"], []).append(time.perf_counter() - arrival)
+        statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+        if result.get("speculation"):
+            speculations.append(result["speculation"])
+        for stage, seconds in result.get("timings", {}).items():
+            stages.setdefault(stage, []).append(seconds)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(message, started + i / rate) for i, message in enumerate(messages)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "rate": rate,
+        "concurrency": concurrency,
+        "messages": len(messages),
+        "statuses": statuses,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_msg_s": round(len(messages) / elapsed, 2),
+        "latency": {"end_to_end": summarize(latencies), **{stage: summarize(values) for stage, values in stages.items()}},
+        "latency_by_priority": {priority: summarize(values) for priority, values in by_priority.items()},
+        "speculation": summarize_speculation(speculations),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def summarize_speculation(reports: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Outcome counts and total latency saved/backend time wasted by speculative prefetches"""
+    outcomes: Dict[str, int] = {}
+    for report in reports:
+        outcomes[report["outcome"]] = outcomes.get(report["outcome"], 0) + 1
+    return {
+        "outcomes": outcomes,
+        "saved_s": round(sum(report["saved"] for report in reports), 3),
+        "wasted_s": round(sum(report["wasted"] for report in reports), 3),
+    }
+
+
+def configure(llm: StubLLMServer, idit: StubIDITServer, args: argparse.Namespace):
+    """Point the application settings at the stub servers"""
+    settings.azure_openai.endpoint = llm.url
+    settings.azure_openai.api_key = "benchmark"
+    settings.azure_openai.http2 = False
+    settings.idit_api.base_url = f"{idit.url}/idit-web/api/"
+    settings.app.database_url = None
+    settings.app.enable_rule_classifier = not args.no_rules
+    settings.app.enable_streaming_classification = args.stream
+    settings.app.enable_classification_batching = args.batch
+    settings.app.task_execution_mode = args.task_mode
+    # The stub IDIT server takes the PUTs
+    settings.app.enable_entity_updates = True
+    settings.app.enable_priority_scheduling = args.scheduling
+    settings.app.scheduler_shed_policy = args.shed_policy
+    settings.app.enable_speculative_prefetch = args.speculate
+    settings.azure_openai.model_routes = args.model_routes
+    settings.azure_openai.model_deployments = args.model_deployments
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=project_root, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results: Dict[str, Any], baseline_path: str):
+    """Print throughput and p95 deltas against a previous results file"""
+    baseline = json.loads(Path(baseline_path).read_text())
+    previous = {(run["rate"], run["concurrency"]): run for run in baseline["runs"]}
+    print(f"\nComparison against {baseline_path} (commit {baseline.get('commit')}):")
+    for run in results["runs"]:
+        before = previous.get((run["rate"], run["concurrency"]))
+        if before is None:
+            continue
+        throughput = run["throughput_msg_s"] - before["throughput_msg_s"]
+        p95 = run["latency"]["end_to_end"]["p95_ms"] - before["latency"]["end_to_end"]["p95_ms"]
+        print(f"  rate={run['rate']} concurrency={run['concurrency']}: "
+              f"throughput {throughput:+.2f} msg/s, end-to-end p95 {p95:+.1f} ms")
+
+
+async def main(args: argparse.Namespace) -> Dict[str, Any]:
+    model_latency_ms = {name: float(ms) for name, _, ms in (item.partition("=") for item in args.model_latency_ms)}
+    llm = await StubLLMServer(latency_ms=args.llm_latency_ms, jitter_ms=args.llm_jitter_ms,
+                              error_rate=args.llm_error_rate, token_latency_ms=args.llm_token_latency_ms,
+                              model_latency_ms=model_latency_ms, seed=args.seed).start()
+    idit = await StubIDITServer(latency_ms=args.idit_latency_ms, jitter_ms=args.idit_jitter_ms,
+                                error_rate=args.idit_error_rate, seed=args.seed).start()
+    configure(llm, idit, args)
+    rng = random.Random(args.seed)
+    mix = {"explicit": args.explicit_ratio, "ambiguous": args.ambiguous_ratio, "irrelevant": args.irrelevant_ratio}
+
+    runs = []
+    try:
+        for rate in args.rates:
+            for concurrency in args.concurrency:
+                messages = build_messages(args.messages, f"r{rate}c{concurrency}", args.contacts, mix, rng,
+                                          args.urgent_ratio)
+                run = await run_load(rate, concurrency, messages)
+                runs.append(run)
+                e2e = run["latency"]["end_to_end"]
+                print(f"rate={rate} concurrency={concurrency}: {run['throughput_msg_s']} msg/s, "
+                      f"p50={e2e['p50_ms']}ms p95={e2e['p95_ms']}ms p99={e2e['p99_ms']}ms, "
+                      f"statuses={run['statuses']}, peak RSS={run['peak_rss_mb']}MB")
+                if run["speculation"]["outcomes"]:
+                    print(f"  speculation: {run['speculation']['outcomes']}, saved {run['speculation']['saved_s']}s, "
+                          f"wasted {run['speculation']['wasted_s']}s")
+                for priority, summary in sorted(run["latency_by_priority"].items()):
+                    print(f"  {priority}: p50={summary['p50_ms']}ms p99={summary['p99_ms']}ms ({summary['count']} messages)")
+    finally:
+        await llm.stop()
+        await idit.stop()
+
+    from services.model_router import get_model_router
+    router_stats = get_model_router().stats()
+    for name, stats in router_stats.items():
+        print(f"deployment {name}: {stats['calls']} calls in window, p95={stats['p95_ms']}ms, "
+              f"errors={stats['error_rate']:.1%}, cost={stats['cost']}")
+
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": vars(args),
+        "stub_requests": {"llm": dict(llm.requests), "idit": dict(idit.requests)},
+        "model_router": router_stats,
+        "runs": runs,
+    }
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="End-to-end pipeline benchmark against local stubs")
+    parser.add_argument("--rates", type=float, nargs="+", default=[20.0], help="Arrival rates (messages/sec)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[5], help="MAX_CONCURRENT_TASKS values")
+    parser.add_argument("--messages", type=int, default=100, help="Messages per run")
+    parser.add_argument("--contacts", type=int, default=50, help="Distinct contact ids in the synthetic load")
+    parser.add_argument("--explicit-ratio", type=float, default=0.6)
+    parser.add_argument("--ambiguous-ratio", type=float, default=0.25)
+    parser.add_argument("--irrelevant-ratio", type=float, default=0.15)
+    parser.add_argument("--llm-latency-ms", type=float, default=500)
+    parser.add_argument("--llm-jitter-ms", type=float, default=100)
+    parser.add_argument("--llm-token-latency-ms", type=float, default=0, help="Delay per streamed chunk")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--idit-latency-ms", type=float, default=50)
+    parser.add_argument("--idit-jitter-ms", type=float, default=10)
+    parser.add_argument("--idit-error-rate", type=float, default=0.0)
+    parser.add_argument("--no-rules", action="store_true", help="Disable the rule-based classification fast path")
+    parser.add_argument("--stream", action="store_true", help="Enable streaming classification")
+    parser.add_argument("--batch", action="store_true", help="Enable batched classification")
+    parser.add_argument("--task-mode", choices=["patch", "full"], default="patch",
+                        help="Task-execution rewrite: JSON Patch or full-object regeneration")
+    parser.add_argument("--scheduling", action="store_true", help="Enable the priority scheduler")
+    parser.add_argument("--shed-policy", choices=["none", "defer", "reject"], default="none",
+                        help="Scheduler shedding policy (none keeps every message, so latencies stay comparable)")
+    parser.add_argument("--urgent-ratio", type=float, default=0.0,
+                        help="Share of messages marked high priority (the rest normal); 0 leaves priority unset")
+    parser.add_argument("--speculate", action="store_true",
+                        help="Prefetch the contact named in the message while it is classified")
+    parser.add_argument("--model-routes", help="AZURE_OPENAI_MODEL_ROUTES, e.g. classify=gpt-4o-mini>gpt-4o")
+    parser.add_argument("--model-deployments", help="AZURE_OPENAI_MODEL_DEPLOYMENTS (SLOs and token prices)")
+    parser.add_argument("--model-latency-ms", nargs="*", default=[],
+                        help="Stub LLM latency per deployment, e.g. gpt-4o-mini=200 gpt-4o=800")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="bench_results.json", help="Where to write the JSON results")
+    parser.add_argument("--compare", help="Previous results file to compare against")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    results = asyncio.run(main(arguments))
+    Path(arguments.output).write_text(json.dumps(results, indent=2))
+    print(f"Results written to {arguments.output}")
+    if arguments.compare:
+        compare(results, arguments.compare)
@@ -0,0 +1,177 @@
+"""
+Startup Benchmark
+Measures cold-start cost in fresh interpreters: module import time (from
+python -X importtime) and the latency of the first message processed
+against local stub servers. It also checks that the heavy third-party
+packages (pydantic, openai, httpx) are not imported until first use. Exits
+with status 1 when a budget is exceeded or a deferred package is imported
+eagerly, so it can gate CI.
+
+Usage:
+    python benchmarks/startup_bench.py --import-budget-ms 300 --first-message-budget-ms 1500 \\
+        --repeat 5 --output startup_results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Tuple
+
+# Add project root to Python path
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+# Packages whose import is deferred until first use (settings, LLM client, HTTP transport)
+DEFERRED_PACKAGES = ("pydantic", "pydantic_settings", "openai", "httpx")
+
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def parse_import_times(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """Parse -X importtime output into (module, self us, cumulative us, nesting depth) rows"""
+    rows = []
+    for line in stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            rows.append((match.group(4), int(match.group(1)), int(match.group(2)), (len(match.group(3)) - 1) // 2))
+    return rows
+
+
+def measure_imports(module: str, deferred: Tuple[str, ...] = DEFERRED_PACKAGES) -> Dict[str, Any]:
+    """Import module in a fresh interpreter and report its total and heaviest imports, and which deferred packages it loaded"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=project_root, capture_output=True, text=True, env=os.environ.copy()
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{completed.stderr[-2000:]}")
+    rows = parse_import_times(completed.stderr)
+    target = next((cumulative for name, _, cumulative, depth in rows if name == module and depth == 0), None)
+    heaviest = sorted((row for row in rows if row[3] <= 1), key=lambda row: row[2], reverse=True)[:10]
+    eager = {name: cumulative for name, _, cumulative, _ in rows if name in deferred}
+    return {
+        "module": module,
+        "import_ms": round((target or 0) / 1000, 3),
+        "eager_deferred": {name: round(cumulative / 1000, 3) for name, cumulative in eager.items()},
+        "heaviest": [{"module": name, "cumulative_ms": round(cumulative / 1000, 3)} for name, _, cumulative, _ in heaviest],
+    }
+
+
+async def first_message(spawned_at: float) -> Dict[str, Any]:
+    """Child side: time the import of the orchestrator and the first message against stub servers"""
+    from benchmarks.stub_servers import StubLLMServer, StubIDITServer
+
+    llm = await StubLLMServer().start()
+    idit = await StubIDITServer().start()
+    try:
+        started = time.perf_counter()
+        from orchestarator import Orchestrator
+        imported = time.perf_counter()
+
+        from config.settings import settings
+        settings.azure_openai.endpoint = llm.url
+        settings.azure_openai.api_key = "benchmark"
+        settings.azure_openai.http2 = False
+        settings.idit_api.base_url = f"{idit.url}/idit-web/api/"
+        settings.app.database_url = None
+        result = await Orchestrator().process_message({
+            "message_id": "startup-1",
+            "title": "Correction needed for Contact ID: 415089",
+            "content": "Please update the email address for Contact ID: 415089. The correct email is noa@insureplus.com.",
+            "sender": "noa@insureplus.com",
+            "channel": "benchmark",
+        })
+        finished = time.perf_counter()
+        finished_at = time.time()
+    finally:
+        await llm.stop()
+        await idit.stop()
+    return {
+        "status": result["status"],
+        "orchestrator_import_ms": round((imported - started) * 1000, 3),
+        "first_message_ms": round((finished - imported) * 1000, 3),
+        "cold_start_ms": round((finished_at - spawned_at) * 1000, 3),
+    }
+
+
+def measure_first_message() -> Dict[str, Any]:
+    """Run first_message() in a fresh interpreter"""
+    completed = subprocess.run(
+        [sys.executable, str(Path(__file__).resolve()), "--child", str(time.time())],
+        cwd=project_root, capture_output=True, text=True, env=os.environ.copy()
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"First-message run failed:\n{completed.stderr[-2000:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main(args: argparse.Namespace) -> int:
+    deferred = tuple(args.deferred)
+    import_runs = [measure_imports(args.module, deferred) for _ in range(args.repeat)]
+    message_runs = [measure_first_message() for _ in range(args.repeat)]
+    import_ms = statistics.median(run["import_ms"] for run in import_runs)
+    first_message_ms = statistics.median(run["first_message_ms"] for run in message_runs)
+    cold_start_ms = statistics.median(run["cold_start_ms"] for run in message_runs)
+
+    print(f"import {args.module}: {import_ms} ms (median of {args.repeat})")
+    for entry in import_runs[0]["heaviest"]:
+        print(f"  {entry['cumulative_ms']:>9.3f} ms  {entry['module']}")
+    eager = import_runs[0]["eager_deferred"]
+    if eager:
+        print("imported eagerly: " + ", ".join(f"{name} ({ms} ms)" for name, ms in eager.items()))
+    else:
+        print(f"deferred until first use: {', '.join(deferred)}")
+    print(f"first message: {first_message_ms} ms, cold start to first result: {cold_start_ms} ms "
+          f"(status {message_runs[0]['status']})")
+
+    failures = []
+    if args.import_budget_ms is not None and import_ms > args.import_budget_ms:
+        failures.append(f"import time {import_ms} ms exceeds budget {args.import_budget_ms} ms")
+    if eager:
+        failures.append(f"{', '.join(eager)} imported by {args.module}; these should only load on first use")
+    if args.first_message_budget_ms is not None and first_message_ms > args.first_message_budget_ms:
+        failures.append(f"first-message latency {first_message_ms} ms exceeds budget {args.first_message_budget_ms} ms")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps({
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "config": vars(args),
+            "import_ms": import_ms,
+            "first_message_ms": first_message_ms,
+            "cold_start_ms": cold_start_ms,
+            "import_runs": import_runs,
+            "message_runs": message_runs,
+            "failures": failures,
+        }, indent=2))
+        print(f"Results written to {args.output}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Cold-start import and first-message latency benchmark")
+    parser.add_argument("--module", default="orchestarator", help="Module whose import time is measured")
+    parser.add_argument("--import-budget-ms", type=float, default=None, help="Fail if the median import time exceeds this")
+    parser.add_argument("--first-message-budget-ms", type=float, default=None,
+                        help="Fail if the median first-message latency exceeds this")
+    parser.add_argument("--deferred", nargs="*", default=list(DEFERRED_PACKAGES),
+                        help="Packages that must not be imported by --module (none to skip the check)")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreters per measurement")
+    parser.add_argument("--output", help="Where to write the JSON results")
+    parser.add_argument("--child", type=float, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    if arguments.child is not None:
+        print(json.dumps(asyncio.run(first_message(arguments.child))))
+    else:
+        sys.exit(main(arguments))
@@ -0,0 +1,569 @@
+"""
+Benchmark Stub Servers
+Local stand-ins for Azure OpenAI and the IDIT API with configurable latency,
+jitter and error rate, a minimal IMAP server for the email source, and an
+in-process Redis streams stand-in for the work queue. Implemented on asyncio
+streams so benchmarks and tests need no extra dependencies.
+"""
+import asyncio
+import itertools
+import json
+import random
+import re
+import time
+from collections import Counter
+from typing import Dict, Any, Optional, Tuple, Union, AsyncIterator
+from urllib.parse import unquote, urlsplit
+
+Payload = Union[bytes, AsyncIterator[bytes]]
+
+CONTACT_ID = re.compile(r"contact\s*(?:id|#|number)?\s*[:=#]?\s*(\d{3,})", re.IGNORECASE)
+EMAIL = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+STREET_ADDRESS = re.compile(r"(\d+)\s+([A-Z][\w']*)\s+Street", re.IGNORECASE)
+
+
+class StubHTTPServer:
+    """
+    Minimal keep-alive HTTP/1.1 server.
+
+    Every request is delayed by latency_ms +/- jitter_ms and fails with a 503
+    with probability error_rate. Subclasses implement route().
+    """
+
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0.0,
+                 seed: Optional[int] = None, host: str = "127.0.0.1", port: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.host = host
+        self.port = port
+        self.requests: Counter = Counter()
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> "StubHTTPServer":
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def route(self, method: str, path: str, body: Optional[Dict[str, Any]],
+                    headers: Dict[str, str]) -> Tuple[int, Payload]:
+        raise NotImplementedError
+
+    def _latency_ms(self, body: Optional[Dict[str, Any]]) -> float:
+        return self.latency_ms
+
+    def _delay(self, body: Optional[Dict[str, Any]]) -> float:
+        jitter = self._random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0
+        return max(0.0, self._latency_ms(body) + jitter) / 1000
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                raw_body = await reader.readexactly(int(headers.get("content-length", 0) or 0))
+                body = json.loads(raw_body) if raw_body else None
+                path = urlsplit(target).path
+
+                await asyncio.sleep(self._delay(body))
+                if self.error_rate and self._random.random() < self.error_rate:
+                    self.errors += 1
+                    status, payload = 503, json.dumps({"error": "stub failure"}).encode()
+                else:
+                    status, payload = await self.route(method, path, body, headers)
+                await self._write_response(writer, status, payload)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _write_response(writer: asyncio.StreamWriter, status: int, payload: Payload):
+        reason = {200: "OK", 404: "Not Found", 409: "Conflict", 503: "Service Unavailable"}.get(status, "Status")
+        if isinstance(payload, bytes):
+            writer.write(
+                f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload
+            )
+            await writer.drain()
+            return
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\nContent-Type: text/event-stream\r\n"
+            f"Transfer-Encoding: chunked\r\n\r\n".encode()
+        )
+        async for chunk in payload:
+            writer.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+class StubLLMServer(StubHTTPServer):
+    """
+    Fake Azure OpenAI chat completions endpoint.
+
+    Classification requests are answered deterministically from the email
+    (explicit contact id -> task JSON, otherwise "Not classified"); batch
+    requests return the JSON array format; JSON Patch requests get a patch for
+    the email address or street address in the instruction; any other request
+    echoes the JSON object found in the prompt (the full-object rewrite).
+    model_latency_ms overrides latency_ms per deployment name, and usage is
+    reported at four characters per token.
+    """
+
+    def __init__(self, token_latency_ms: float = 0, model_latency_ms: Optional[Dict[str, float]] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.token_latency_ms = token_latency_ms
+        self.model_latency_ms = model_latency_ms or {}
+        self.prompt_chars = 0
+        self.completion_chars = 0
+
+    async def route(self, method: str, path: str, body: Optional[Dict[str, Any]],
+                    headers: Dict[str, str]) -> Tuple[int, Payload]:
+        if method != "POST" or not path.endswith("/chat/completions"):
+            return 404, b'{"error": "not found"}'
+        self.requests["chat/completions"] += 1
+        self.requests[f"model {body.get('model', 'stub')}"] += 1
+        messages = body.get("messages", [])
+        prompt_chars = sum(len(m.get("content") or "") for m in messages)
+        self.prompt_chars += prompt_chars
+        content = self._answer(messages)
+        self.completion_chars += len(content)
+        if body.get("stream"):
+            return 200, self._stream(body.get("model", "stub"), content)
+        return 200, json.dumps(self._completion(body.get("model", "stub"), content, prompt_chars)).encode()
+
+    def _latency_ms(self, body: Optional[Dict[str, Any]]) -> float:
+        return self.model_latency_ms.get((body or {}).get("model"), self.latency_ms)
+
+    def _answer(self, messages) -> str:
+        system = messages[0]["content"] if messages else ""
+        user = messages[-1]["content"] if messages else ""
+        if "classify incoming emails" in system:
+            if "Batch Mode" in system:
+                emails = json.loads(user)
+                return json.dumps([{"id": e["id"], "classification": self._classify(e)} for e in emails])
+            return json.dumps(self._classify(json.loads(user)))
+        if "JSON Patch" in user:
+            return json.dumps(self._patch(user))
+        match = re.search(r"JSON: (\{.*\})", user, re.DOTALL)
+        return match.group(1) if match else '{"result": "ok"}'
+
+    @staticmethod
+    def _classify(email: Dict[str, Any]) -> Dict[str, Any]:
+        text = f"{email.get('subject', '')}\n{email.get('body', '')}"
+        match = CONTACT_ID.search(text)
+        if not match:
+            return {"result": "Not classified"}
+        return {
+            "queueId": 10886, "contactExtId": match.group(1), "dueOn": "2025-11-07T12:09:35.827Z",
+            "updateVersion": 0, "taskDescription": f"Contact: {match.group(1)}", "priority": 1,
+            "followUpSuperType": 0, "startHandlingOn": "2025-11-07T12:09:35.827Z", "consequences": 0,
+            "id": 0, "remarks": email.get("body", ""), "taskCategory": 0,
+        }
+
+    @staticmethod
+    def _patch(prompt: str):
+        instruction = re.search(r"massage: (.*?)\nJSON: ", prompt, re.DOTALL)
+        text = instruction.group(1) if instruction else ""
+        patch = []
+        email = EMAIL.search(text)
+        if email:
+            patch.append({"op": "replace", "path": "/email", "value": email.group(0)})
+        address = STREET_ADDRESS.search(text)
+        if address:
+            patch += [
+                {"op": "replace", "path": "/address/houseNr", "value": address.group(1)},
+                {"op": "replace", "path": "/address/street", "value": address.group(2)},
+            ]
+        return patch
+
+    @staticmethod
+    def _completion(model: str, content: str, prompt_chars: int) -> Dict[str, Any]:
+        prompt_tokens, completion_tokens = prompt_chars // 4, len(content) // 4
+        return {
+            "id": "chatcmpl-stub", "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    async def _stream(self, model: str, content: str) -> AsyncIterator[bytes]:
+        for start in range(0, len(content), 4):
+            chunk = {
+                "id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "delta": {"content": content[start:start + 4]}, "finish_reason": None}],
+            }
+            if self.token_latency_ms:
+                await asyncio.sleep(self.token_latency_ms / 1000)
+            yield f"data: {json.dumps(chunk)}\n\n".encode()
+        yield b"data: [DONE]\n\n"
+
+
+class StubIDITServer(StubHTTPServer):
+    """
+    Fake IDIT web API serving /contact/{id}, /policy/{id}, /claim/{id} and
+    /accounting/{id} (GET/PUT) and /workflow/createTask.
+    Entities are generated on first access; PUT bumps updateVersion and is
+    rejected with 409 if it carries a stale updateVersion; a
+    createTask repeated with the same Idempotency-Key returns the original
+    task instead of creating another.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.contacts: Dict[str, Dict[str, Any]] = {}
+        self.entities: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.tasks = []
+        self._task_ids = itertools.count(1)
+        self._idempotent_responses: Dict[str, bytes] = {}
+
+    async def route(self, method: str, path: str, body: Optional[Dict[str, Any]],
+                    headers: Dict[str, str]) -> Tuple[int, Payload]:
+        match = re.search(r"/contact/([^/]+)$", path)
+        if match:
+            contact_id = match.group(1)
+            if method == "GET":
+                self.requests["GET contact"] += 1
+                return 200, json.dumps(self._contact(contact_id)).encode()
+            if method == "PUT":
+                self.requests["PUT contact"] += 1
+                current = self._contact(contact_id)
+                if body and body.get("updateVersion", current["updateVersion"]) != current["updateVersion"]:
+                    self.requests["PUT contact conflict"] += 1
+                    return 409, json.dumps({"error": "updateVersion conflict",
+                                            "updateVersion": current["updateVersion"]}).encode()
+                updated = {**current, **(body or {}), "updateVersion": current["updateVersion"] + 1}
+                self.contacts[contact_id] = updated
+                return 200, json.dumps(updated).encode()
+        match = re.search(r"/(policy|claim|accounting)/([^/]+)$", path)
+        if match:
+            key = (match.group(1), unquote(match.group(2)))
+            current = self.entities.setdefault(key, {"id": key[1], "updateVersion": 1, "bankAccount": "12-345-678"})
+            self.requests[f"{method} {key[0]}"] += 1
+            if method == "GET":
+                return 200, json.dumps(current).encode()
+            if method == "PUT":
+                if body and body.get("updateVersion", current["updateVersion"]) != current["updateVersion"]:
+                    return 409, json.dumps({"error": "updateVersion conflict",
+                                            "updateVersion": current["updateVersion"]}).encode()
+                self.entities[key] = {**current, **(body or {}), "updateVersion": current["updateVersion"] + 1}
+                return 200, json.dumps(self.entities[key]).encode()
+        if method == "POST" and path.endswith("/workflow/createTask"):
+            self.requests["POST createTask"] += 1
+            key = headers.get("idempotency-key")
+            if key in self._idempotent_responses:
+                self.requests["POST createTask replayed"] += 1
+                return 200, self._idempotent_responses[key]
+            self.tasks.append(body)
+            payload = json.dumps({"id": next(self._task_ids)}).encode()
+            if key:
+                self._idempotent_responses[key] = payload
+            return 200, payload
+        return 404, b'{"error": "not found"}'
+
+    def _contact(self, contact_id: str) -> Dict[str, Any]:
+        if contact_id not in self.contacts:
+            self.contacts[contact_id] = {
+                "id": int(contact_id) if contact_id.isdigit() else 0,
+                "contactExtId": contact_id,
+                "updateVersion": 1,
+                "firstName": "Malka",
+                "lastName": "Blau",
+                "email": f"contact{contact_id}@example.com",
+                "telephone": "050-0000000",
+                "address": {"street": "Herzl", "houseNr": "45", "city": "Tel Aviv", "zipCode": "6789000"},
+            }
+        return self.contacts[contact_id]
+
+
+class StubIMAPServer:
+    """
+    Minimal IMAP4rev1 server with one mailbox, for driving the email source.
+
+    Supports CAPABILITY, LOGIN, SELECT/EXAMINE, UID SEARCH UID, UID FETCH
+    (header and partial text), IDLE, NOOP and LOGOUT. Any login is accepted.
+    append() delivers a message and notifies clients waiting in IDLE.
+    """
+
+    def __init__(self, uidvalidity: int = 1, idle: bool = True, host: str = "127.0.0.1", port: int = 0):
+        self.uidvalidity = uidvalidity
+        self.idle = idle
+        self.host = host
+        self.port = port
+        self.messages: list = []  # (uid, raw bytes), in UID order
+        self.requests: Counter = Counter()
+        self._next_uid = 1
+        self._idlers = set()
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> "StubIMAPServer":
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._idlers):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def append(self, raw: bytes) -> int:
+        """Deliver a message; returns its UID"""
+        uid = self._next_uid
+        self._next_uid += 1
+        self.messages.append((uid, raw))
+        for writer in list(self._idlers):
+            writer.write(f"* {len(self.messages)} EXISTS\r\n".encode())
+        return uid
+
+    def reset(self, uidvalidity: int):
+        """Recreate the mailbox with a new UIDVALIDITY (all UIDs start over)"""
+        self.uidvalidity = uidvalidity
+        self.messages = []
+        self._next_uid = 1
+
+    def _uids(self, sequence_set: str):
+        highest = self.messages[-1][0] if self.messages else 0
+        selected = set()
+        for part in sequence_set.split(","):
+            low, _, high = part.partition(":")
+            low = highest if low == "*" else int(low)
+            high = low if not high else highest if high == "*" else int(high)
+            low, high = min(low, high), max(low, high)
+            selected.update(uid for uid, _ in self.messages if low <= uid <= high)
+        return selected
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        capabilities = "IMAP4rev1 IDLE" if self.idle else "IMAP4rev1"
+        writer.write(b"* OK stub IMAP ready\r\n")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                tag, _, rest = line.decode("utf-8").rstrip("\r\n").partition(" ")
+                command, _, arguments = rest.partition(" ")
+                command = command.upper()
+                if command == "UID":
+                    command, _, arguments = arguments.partition(" ")
+                    command = f"UID {command.upper()}"
+                self.requests[command] += 1
+
+                if command == "CAPABILITY":
+                    writer.write(f"* CAPABILITY {capabilities}\r\n{tag} OK CAPABILITY completed\r\n".encode())
+                elif command in ("LOGIN", "NOOP"):
+                    writer.write(f"{tag} OK {command} completed\r\n".encode())
+                elif command in ("SELECT", "EXAMINE"):
+                    writer.write(
+                        f"* {len(self.messages)} EXISTS\r\n* 0 RECENT\r\n"
+                        f"* OK [UIDVALIDITY {self.uidvalidity}] UIDs valid\r\n"
+                        f"* OK [UIDNEXT {self._next_uid}] Predicted next UID\r\n"
+                        f"{tag} OK [READ-ONLY] {command} completed\r\n".encode()
+                    )
+                elif command == "UID SEARCH":
+                    sequence_set = arguments.split()[-1]
+                    uids = " ".join(str(uid) for uid in sorted(self._uids(sequence_set)))
+                    writer.write(f"* SEARCH {uids}\r\n{tag} OK SEARCH completed\r\n".encode())
+                elif command == "UID FETCH":
+                    sequence_set, _, items = arguments.partition(" ")
+                    partial = re.search(r"BODY\.PEEK\[TEXT\]<(\d+)\.(\d+)>", items)
+                    selected = self._uids(sequence_set)
+                    for number, (uid, raw) in enumerate(self.messages, 1):
+                        if uid not in selected:
+                            continue
+                        header, separator, text = raw.partition(b"\r\n\r\n")
+                        header += separator
+                        if partial:
+                            start = int(partial.group(1))
+                            text = text[start:start + int(partial.group(2))]
+                        writer.write(
+                            f"* {number} FETCH (UID {uid} RFC822.SIZE {len(raw)} BODY[HEADER] {{{len(header)}}}\r\n"
+                            .encode() + header + f" BODY[TEXT]<0> {{{len(text)}}}\r\n".encode() + text + b")\r\n"
+                        )
+                    writer.write(f"{tag} OK FETCH completed\r\n".encode())
+                elif command == "IDLE" and self.idle:
+                    writer.write(b"+ idling\r\n")
+                    self._idlers.add(writer)
+                    try:
+                        while (await reader.readline()).strip().upper() not in (b"DONE", b""):
+                            pass
+                    finally:
+                        self._idlers.discard(writer)
+                    writer.write(f"{tag} OK IDLE terminated\r\n".encode())
+                elif command == "LOGOUT":
+                    writer.write(f"* BYE logging out\r\n{tag} OK LOGOUT completed\r\n".encode())
+                    await writer.drain()
+                    break
+                else:
+                    writer.write(f"{tag} BAD unknown command\r\n".encode())
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+class StubRedisStreams:
+    """
+    In-process stand-in for the redis.asyncio stream commands used by
+    RedisStreamWorkQueue (decode_responses=True): XADD, XGROUP CREATE,
+    XREADGROUP, XAUTOCLAIM (Redis 7 reply), XCLAIM, XPENDING, XACK, XDEL and
+    XREVRANGE. Idle times follow clock, so visibility timeouts can be tested
+    without waiting.
+    """
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self.streams: Dict[str, Dict[str, Dict[str, str]]] = {}  # stream -> entry id -> fields, in id order
+        self.groups: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._sequence = itertools.count()
+        self.closed = False
+
+    def _now_ms(self) -> int:
+        return int(self._clock() * 1000)
+
+    @staticmethod
+    def _id_key(entry_id: str) -> Tuple[int, int]:
+        milliseconds, _, sequence = entry_id.partition("-")
+        return int(milliseconds), int(sequence or 0)
+
+    def _group(self, name: str, groupname: str) -> Dict[str, Any]:
+        group = self.groups.get((name, groupname))
+        if group is None:
+            raise Exception(f"NOGROUP No such key '{name}' or consumer group '{groupname}'")
+        return group
+
+    async def xadd(self, name: str, fields: Dict[str, Any], id: str = "*") -> str:
+        entry_id = f"{self._now_ms()}-{next(self._sequence)}" if id == "*" else id
+        self.streams.setdefault(name, {})[entry_id] = {str(key): str(value) for key, value in fields.items()}
+        return entry_id
+
+    async def xgroup_create(self, name: str, groupname: str, id: str = "$", mkstream: bool = False):
+        if name not in self.streams:
+            if not mkstream:
+                raise Exception("ERR The XGROUP subcommand requires the key to exist")
+            self.streams[name] = {}
+        if (name, groupname) in self.groups:
+            raise Exception("BUSYGROUP Consumer Group name already exists")
+        last = max(self.streams[name], key=self._id_key, default="0-0") if id == "$" else id
+        self.groups[(name, groupname)] = {"last_delivered": last, "pending": {}}
+        return True
+
+    async def xreadgroup(self, groupname: str, consumername: str, streams: Dict[str, str],
+                         count: Optional[int] = None, block: Optional[int] = None, noack: bool = False):
+        response = []
+        for name, start in streams.items():
+            group = self._group(name, groupname)
+            if start != ">":
+                raise NotImplementedError("Only new entries ('>') are supported")
+            entries = []
+            for entry_id in sorted(self.streams[name], key=self._id_key):
+                if self._id_key(entry_id) <= self._id_key(group["last_delivered"]):
+                    continue
+                if count is not None and len(entries) >= count:
+                    break
+                group["last_delivered"] = entry_id
+                group["pending"][entry_id] = {"consumer": consumername, "delivered_at": self._now_ms(), "count": 1}
+                entries.append((entry_id, dict(self.streams[name][entry_id])))
+            if entries:
+                response.append([name, entries])
+        if not response and block:
+            # A real server would wait up to block ms for new entries
+            await asyncio.sleep(0)
+        return response
+
+    async def xautoclaim(self, name: str, groupname: str, consumername: str, min_idle_time: int,
+                         start_id: str = "0-0", count: int = 100, justid: bool = False):
+        group = self._group(name, groupname)
+        now = self._now_ms()
+        claimed, deleted = [], []
+        for entry_id in sorted(group["pending"], key=self._id_key):
+            if len(claimed) >= count:
+                break
+            pending = group["pending"][entry_id]
+            if self._id_key(entry_id) < self._id_key(start_id) or now - pending["delivered_at"] < min_idle_time:
+                continue
+            if entry_id not in self.streams[name]:
+                del group["pending"][entry_id]
+                deleted.append(entry_id)
+                continue
+            pending.update(consumer=consumername, delivered_at=now)
+            if not justid:
+                pending["count"] += 1
+            claimed.append(entry_id if justid else (entry_id, dict(self.streams[name][entry_id])))
+        return ["0-0", claimed, deleted]
+
+    async def xclaim(self, name: str, groupname: str, consumername: str, min_idle_time: int, message_ids,
+                     idle: Optional[int] = None, time: Optional[int] = None, retrycount: Optional[int] = None,
+                     force: bool = False, justid: bool = False):
+        group = self._group(name, groupname)
+        now = self._now_ms()
+        claimed = []
+        for entry_id in message_ids:
+            pending = group["pending"].get(entry_id)
+            if pending is None or now - pending["delivered_at"] < min_idle_time:
+                continue
+            pending.update(consumer=consumername, delivered_at=now - (idle or 0))
+            if retrycount is not None:
+                pending["count"] = retrycount
+            elif not justid:
+                pending["count"] += 1
+            claimed.append(entry_id if justid else (entry_id, dict(self.streams[name].get(entry_id, {}))))
+        return claimed
+
+    async def xpending_range(self, name: str, groupname: str, min: str, max: str, count: int,
+                             consumername: Optional[str] = None, idle: Optional[int] = None):
+        group = self._group(name, groupname)
+        now = self._now_ms()
+        result = []
+        for entry_id in sorted(group["pending"], key=self._id_key):
+            if not self._id_key(min) <= self._id_key(entry_id) <= self._id_key(max):
+                continue
+            pending = group["pending"][entry_id]
+            if consumername is not None and pending["consumer"] != consumername:
+                continue
+            result.append({"message_id": entry_id, "consumer": pending["consumer"],
+                           "time_since_delivered": now - pending["delivered_at"],
+                           "times_delivered": pending["count"]})
+            if len(result) >= count:
+                break
+        return result
+
+    async def xack(self, name: str, groupname: str, *ids: str) -> int:
+        pending = self._group(name, groupname)["pending"]
+        return sum(1 for entry_id in ids if pending.pop(entry_id, None) is not None)
+
+    async def xdel(self, name: str, *ids: str) -> int:
+        entries = self.streams.get(name, {})
+        return sum(1 for entry_id in ids if entries.pop(entry_id, None) is not None)
+
+    async def xrevrange(self, name: str, max: str = "+", min: str = "-", count: Optional[int] = None):
+        entries = sorted(self.streams.get(name, {}).items(), key=lambda item: self._id_key(item[0]), reverse=True)
+        return [(entry_id, dict(fields)) for entry_id, fields in entries[:count]]
+
+    async def aclose(self):
+        self.closed = True
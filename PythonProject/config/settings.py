@@ -2,100 +2,47 @@
 Configuration Module
 Manages all application settings and environment variables
 """
-import os
-from typing import Optional
-from pydantic_settings import BaseSettings
-from pydantic import Field
+import threading
+from typing import Optional, TYPE_CHECKING
 
+if TYPE_CHECKING:
+    from config.settings_models import Settings
 
-# class AzureOpenAISettings(BaseSettings):
-#     """Azure OpenAI Configuration"""
-#     api_key: str = Field(..., env="AZURE_OPENAI_API_KEY")
-#     endpoint: str = Field(..., env="AZURE_OPENAI_ENDPOINT")
-#     deployment_name: str = Field(..., env="AZURE_OPENAI_DEPLOYMENT_NAME")
-#     api_version: str = Field(default="2024-02-15-preview", env="AZURE_OPENAI_API_VERSION")
-#     model: str = Field(default="gpt-4", env="AZURE_OPENAI_MODEL")
-#
-#     class Config:
-#         env_file = ".env"
-#         case_sensitive = False
-#
+# Section classes re-exported from config.settings_models on first access
+SETTINGS_CLASSES = ("AzureOpenAISettings", "IDITAPISettings", "EmailSettings", "AppSettings", "Settings")
 
-class IDITAPISettings(BaseSettings):
-    """IDIT API Configuration"""
-    base_url: str = Field("https://core-trunk-ci-qa.idit.sapiens.com:443/idit-web/api/")
-    api_key: dict[str, str] = Field({"userName": "Administrator", "password": "1111"})
-    timeout: int = Field(default=30)
+_settings: Optional["Settings"] = None
+_settings_lock = threading.Lock()
 
-    class Config:
-        env_file = ".env"
-        case_sensitive = False
 
+def get_settings() -> "Settings":
+    """Get or create the settings singleton; pydantic is imported and the environment and .env are read on first use"""
+    global _settings
+    if _settings is None:
+        with _settings_lock:
+            if _settings is None:
+                from config.settings_models import Settings
+                _settings = Settings()
+    return _settings
 
-# class EmailSettings(BaseSettings):
-#     """Email Channel Configuration"""
-#     imap_server: str = Field(..., env="EMAIL_IMAP_SERVER")
-#     imap_port: int = Field(default=993, env="EMAIL_IMAP_PORT")
-#     username: str = Field(..., env="EMAIL_USERNAME")
-#     password: str = Field(..., env="EMAIL_PASSWORD")
-#     smtp_server: str = Field(..., env="EMAIL_SMTP_SERVER")
-#     smtp_port: int = Field(default=587, env="EMAIL_SMTP_PORT")
-#
-#     class Config:
-#         env_file = ".env"
-#         case_sensitive = False
 
-#
-# class WhatsAppSettings(BaseSettings):
-#     """WhatsApp Channel Configuration"""
-#     api_url: str = Field(..., env="WHATSAPP_API_URL")
-#     access_token: str = Field(..., env="WHATSAPP_ACCESS_TOKEN")
-#     phone_number_id: str = Field(..., env="WHATSAPP_PHONE_NUMBER_ID")
-#     business_account_id: str = Field(..., env="WHATSAPP_BUSINESS_ACCOUNT_ID")
-#
-#     class Config:
-#         env_file = ".env"
-#         case_sensitive = False
-#
-#
-# class TeamsSettings(BaseSettings):
-#     """Teams Channel Configuration"""
-#     webhook_url: str = Field(..., env="TEAMS_WEBHOOK_URL")
-#     bot_id: Optional[str] = Field(None, env="TEAMS_BOT_ID")
-#     bot_password: Optional[str] = Field(None, env="TEAMS_BOT_PASSWORD")
-#     app_id: Optional[str] = Field(None, env="TEAMS_APP_ID")
-#
-#     class Config:
-#         env_file = ".env"
-#         case_sensitive = False
-#
+def __getattr__(name):
+    """Keep "from config.settings import AppSettings" working without importing pydantic up front"""
+    if name in SETTINGS_CLASSES:
+        import config.settings_models
+        return getattr(config.settings_models, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-class AppSettings(BaseSettings):
-    """Application Configuration"""
-    log_level: str = Field(default="INFO", env="LOG_LEVEL")
-    message_poll_interval: int = Field(default=60, env="MESSAGE_POLL_INTERVAL")
-    max_concurrent_tasks: int = Field(default=5, env="MAX_CONCURRENT_TASKS")
-    enable_retry: bool = Field(default=True, env="ENABLE_RETRY")
-    max_retries: int = Field(default=3, env="MAX_RETRIES")
-    database_url: Optional[str] = Field(None, env="DATABASE_URL")
-    redis_host: Optional[str] = Field(None, env="REDIS_HOST")
-    redis_port: Optional[int] = Field(None, env="REDIS_PORT")
 
-    class Config:
-        env_file = ".env"
-        case_sensitive = False
+class _LazySettings:
+    """Stand-in for the Settings instance that builds it on first attribute access, so imports stay cheap"""
 
+    def __getattr__(self, name):
+        return getattr(get_settings(), name)
 
-class Settings:
-    """Main Settings Container"""
-    def __init__(self):
-        # self.azure_openai = AzureOpenAISettings()
-        self.idit_api = IDITAPISettings()
-        # self.email = EmailSettings()
-        # self.whatsapp = WhatsAppSettings()
-        # self.teams = TeamsSettings()
-        self.app = AppSettings()
+    def __setattr__(self, name, value):
+        setattr(get_settings(), name, value)
 
 
 # Global settings instance
-settings = Settings()
+settings = _LazySettings()
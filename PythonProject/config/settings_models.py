@@ -0,0 +1,162 @@
+"""
+Settings Models
+pydantic-settings classes for every configuration section, imported by
+config.settings on first use so that importing the application does not
+pay for pydantic
+"""
+from typing import Optional
+from pydantic_settings import BaseSettings, SettingsConfigDict
+from pydantic import Field
+
+
+class AzureOpenAISettings(BaseSettings):
+    """Azure OpenAI Configuration"""
+    api_key: str = Field(default="")
+    endpoint: str = Field(default="https://moshe-m6dfn51l-eastus2.services.ai.azure.com")
+    deployment_name: str = Field(default="gpt-4o")
+    api_version: str = Field(default="2024-02-01")
+    request_timeout: float = Field(default=60.0)
+    max_connections: int = Field(default=20)
+    http2: bool = Field(default=False)
+    initial_concurrency: int = Field(default=4)
+    requests_per_second: float = Field(default=0.0)
+    tokens_per_minute: int = Field(default=0)
+    latency_target: Optional[float] = Field(default=None)
+    model_deployments: Optional[str] = Field(None)
+    model_routes: Optional[str] = Field(None)
+    router_window: float = Field(default=120.0)
+    router_min_samples: int = Field(default=20)
+    router_max_error_rate: float = Field(default=0.25)
+
+    model_config = SettingsConfigDict(env_prefix="AZURE_OPENAI_", env_file=".env", case_sensitive=False)
+
+
+class IDITAPISettings(BaseSettings):
+    """IDIT API Configuration"""
+    base_url: str = Field("https://core-trunk-ci-qa.idit.sapiens.com:443/idit-web/api/")
+    api_key: dict[str, str] = Field({"userName": "Administrator", "password": "1111"})
+    timeout: int = Field(default=30)
+    pool_size: int = Field(default=10)
+    keepalive_expiry: float = Field(default=30.0)
+    entity_cache_size: int = Field(default=1000)
+    entity_cache_ttl: int = Field(default=300)
+    initial_concurrency: int = Field(default=4)
+    requests_per_second: float = Field(default=0.0)
+    latency_target: Optional[float] = Field(default=2.0)
+    hedge_delay: Optional[float] = Field(default=None)
+
+    model_config = SettingsConfigDict(env_file=".env", case_sensitive=False)
+
+
+class EmailSettings(BaseSettings):
+    """Email Channel Configuration"""
+    imap_server: Optional[str] = Field(None)
+    imap_port: int = Field(default=993)
+    imap_ssl: bool = Field(default=True)
+    username: Optional[str] = Field(None)
+    password: Optional[str] = Field(None)
+    mailbox: str = Field(default="INBOX")
+    initial_sync: str = Field(default="new")
+    fetch_batch_size: int = Field(default=50)
+    max_body_bytes: int = Field(default=65536)
+    use_idle: bool = Field(default=True)
+    idle_timeout: float = Field(default=300.0)
+    timeout: float = Field(default=30.0)
+    smtp_server: Optional[str] = Field(None)
+    smtp_port: int = Field(default=587)
+
+    model_config = SettingsConfigDict(env_prefix="EMAIL_", env_file=".env", case_sensitive=False)
+
+#
+# class WhatsAppSettings(BaseSettings):
+#     """WhatsApp Channel Configuration"""
+#     api_url: str = Field(..., env="WHATSAPP_API_URL")
+#     access_token: str = Field(..., env="WHATSAPP_ACCESS_TOKEN")
+#     phone_number_id: str = Field(..., env="WHATSAPP_PHONE_NUMBER_ID")
+#     business_account_id: str = Field(..., env="WHATSAPP_BUSINESS_ACCOUNT_ID")
+#
+#     class Config:
+#         env_file = ".env"
+#         case_sensitive = False
+#
+#
+# class TeamsSettings(BaseSettings):
+#     """Teams Channel Configuration"""
+#     webhook_url: str = Field(..., env="TEAMS_WEBHOOK_URL")
+#     bot_id: Optional[str] = Field(None, env="TEAMS_BOT_ID")
+#     bot_password: Optional[str] = Field(None, env="TEAMS_BOT_PASSWORD")
+#     app_id: Optional[str] = Field(None, env="TEAMS_APP_ID")
+#
+#     class Config:
+#         env_file = ".env"
+#         case_sensitive = False
+#
+
+class AppSettings(BaseSettings):
+    """Application Configuration"""
+    log_level: str = Field(default="INFO")
+    message_poll_interval: int = Field(default=60)
+    max_concurrent_tasks: int = Field(default=5)
+    message_queue_size: int = Field(default=100)
+    shutdown_timeout: int = Field(default=30)
+    enable_retry: bool = Field(default=True)
+    max_retries: int = Field(default=3)
+    retry_base_delay: float = Field(default=0.2)
+    retry_max_delay: float = Field(default=5.0)
+    circuit_failure_threshold: int = Field(default=5)
+    circuit_reset_timeout: float = Field(default=30.0)
+    database_url: Optional[str] = Field(None)
+    work_queue_backend: Optional[str] = Field(None)
+    work_queue_visibility_timeout: float = Field(default=300.0)
+    work_queue_max_attempts: int = Field(default=5)
+    work_queue_poll_interval: float = Field(default=1.0)
+    enable_adaptive_concurrency: bool = Field(default=True)
+    enable_metrics: bool = Field(default=False)
+    metrics_port: Optional[int] = Field(None)
+    metrics_dump_path: Optional[str] = Field(None)
+    classification_cache_size: int = Field(default=10000)
+    enable_rule_classifier: bool = Field(default=True)
+    enable_streaming_classification: bool = Field(default=False)
+    task_execution_mode: str = Field(default="patch")
+    enable_entity_updates: bool = Field(default=False)
+    enable_classification_batching: bool = Field(default=False)
+    classification_batch_size: int = Field(default=10)
+    classification_batch_wait_ms: int = Field(default=200)
+    enable_update_coalescing: bool = Field(default=False)
+    update_coalescing_window_ms: int = Field(default=500)
+    update_coalescing_max_instructions: int = Field(default=10)
+    zip_dataset_path: Optional[str] = Field(None)
+    zip_index_path: Optional[str] = Field(None)
+    enable_transliteration: bool = Field(default=False)
+    transliteration_llm_fallback: bool = Field(default=True)
+    enable_dedup: bool = Field(default=False)
+    dedup_backend: Optional[str] = Field(None)
+    dedup_ttl: int = Field(default=604800)
+    dedup_expected_messages: int = Field(default=1000000)
+    dedup_false_positive_rate: float = Field(default=0.001)
+    dedup_by_content: bool = Field(default=False)
+    dedup_trust_bloom: bool = Field(default=True)
+    enable_priority_scheduling: bool = Field(default=False)
+    scheduler_class_limits: Optional[str] = Field(None)
+    scheduler_max_waiting: int = Field(default=100)
+    scheduler_shed_policy: str = Field(default="defer")
+    scheduler_defer_delay: float = Field(default=30.0)
+    scheduler_deadline_high: float = Field(default=60.0)
+    scheduler_deadline_normal: float = Field(default=900.0)
+    scheduler_deadline_low: float = Field(default=3600.0)
+    enable_speculative_prefetch: bool = Field(default=False)
+    redis_host: Optional[str] = Field(None)
+    redis_port: Optional[int] = Field(None)
+
+    model_config = SettingsConfigDict(env_file=".env", case_sensitive=False)
+
+
+class Settings:
+    """Main Settings Container"""
+    def __init__(self):
+        self.azure_openai = AzureOpenAISettings()
+        self.idit_api = IDITAPISettings()
+        self.email = EmailSettings()
+        # self.whatsapp = WhatsAppSettings()
+        # self.teams = TeamsSettings()
+        self.app = AppSettings()
@@ -2,7 +2,9 @@
 Main Application Entry Point
 AI Multi-Agent Orchestration System
 """
+import argparse
 import asyncio
+import signal
 import sys
 from pathlib import Path
 
@@ -13,29 +15,28 @@ sys.path.insert(0, str(project_root))
 
 from orchestarator import get_orchestrator
 
-from config.settings import settings
-from dotenv import load_dotenv
-from agents.classification_agent import get_classification_agent
+async def main(workers: int = 1):
+    """
+    Main application entry point
 
-async def main():
-    """Main application entry point"""
+    Args:
+        workers: Number of worker processes; more than 1 runs the multi-process supervisor
+    """
     try:
-        agent = get_classification_agent()
-
-        # שלח prompt ל-LLM
-        response = await agent.generate_response(
-            prompt="How do I create a new order?",
-            context={
-                "user_role": "customer",
-                "channel": "teams"
-            }
-        )
-
-        print(response)
-
+        # Agents and clients are built lazily by the first message, not at startup
         # Get orchestrator instance
         print("main Application started")
-        orchestrator = get_orchestrator()
+        if workers > 1:
+            from supervisor import Supervisor
+            orchestrator = Supervisor(workers)
+        else:
+            orchestrator = get_orchestrator()
+
+        # Stop gracefully (drain queued messages) on SIGTERM
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, orchestrator.stop)
+        except (NotImplementedError, AttributeError):
+            pass  # signal handlers are not supported on Windows event loops
 
         # Start the orchestration system
         print("Starting orchestrator...")
@@ -52,8 +53,12 @@ async def main():
 
 def run():
     """Run the application"""
+    parser = argparse.ArgumentParser(description="AI Multi-Agent Orchestration System")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes; messages are sharded between them by contact (default: 1)")
+    args = parser.parse_args()
     try:
-        asyncio.run(main())
+        asyncio.run(main(workers=max(1, args.workers)))
     except KeyboardInterrupt:
         print("Application stopped by user")
     except Exception as e:
@@ -1,8 +1,16 @@
 import asyncio
-from typing import Dict, Any
-from agents import get_classification_agent, get_task_execution_agent
-from agents import get_task_execution_agent
+import itertools
+import time
+from typing import Dict, Any, List, Optional, Tuple
+from contextlib import asynccontextmanager
+from agents.rule_classifier import RuleClassifier
 # from services import get_message_pull_service
+from services.message_sources import MessageSource, InMemoryMessageSource
+from services.dedup import get_deduplicator
+from services.metrics import get_metrics
+from services.scheduler import create_scheduler
+from services.speculation import Speculation
+from services.work_queue import get_work_queue, WorkQueueMessageSource
 # from utils.logger import get_logger
 from config.settings import settings
 
@@ -10,31 +18,239 @@ from config.settings import settings
 # logger = get_logger(__name__)
 
 
+def contact_key(message: Dict[str, Any]) -> str:
+    """
+    Key of the contact a message is about, known before classification: the
+    first explicit contact id in the title/content, otherwise the sender.
+    Messages with the same key are processed one at a time, in order
+    (with update coalescing, the UpdateCoalescer orders them instead).
+    """
+    text = f"{message.get('title') or ''}\n{message.get('content') or ''}"
+    contact_ids = RuleClassifier.extract_contact_ids(text)
+    if contact_ids:
+        return f"contact:{contact_ids[0]}"
+    return f"sender:{(message.get('sender') or '').strip().lower()}"
+
+
 class Orchestrator:
     """
     Main orchestrator for the AI Multi-Agent System
     Coordinates message flow through classification, task creation, and execution
     """
 
+    def __init__(self, sources: Optional[List[MessageSource]] = None):
+        # self.task_creation_agent = get_task_creation_agent()
+        # self.message_service = get_message_pull_service()
+        self.max_concurrent_tasks = settings.app.max_concurrent_tasks
+        self.semaphore = asyncio.Semaphore(self.max_concurrent_tasks)
+        self.scheduler = create_scheduler(self.max_concurrent_tasks)
+        self.poll_interval = settings.app.message_poll_interval
+        self.queue_size = settings.app.message_queue_size
+        self.shutdown_timeout = settings.app.shutdown_timeout
+        self.sources: List[MessageSource] = list(sources or [])
+        self.queue: Optional[asyncio.Queue] = None
+        self._stop_event: Optional[asyncio.Event] = None
+        self.metrics = get_metrics()
+        self._contact_locks: Dict[str, List] = {}
+        self._arrivals = itertools.count()
+        self._deferred: Dict[asyncio.Task, Tuple[MessageSource, Dict[str, Any]]] = {}
+
+    @property
+    def classification_agent(self):
+        # Deferred import: the agents (and the LLM/HTTP clients) load with the first message
+        from agents import get_classification_agent
+        return get_classification_agent()
+
+    @property
+    def task_execution_agent(self):
+        from agents import get_task_execution_agent
+        return get_task_execution_agent()
+
+    def add_source(self, source: MessageSource):
+        """Register a message source; must be called before start()"""
+        self.sources.append(source)
+
     async def start(self):
+        """
+        Run the ingestion engine until every source is exhausted or stop() is called.
+
+        Sources feed a bounded queue (producers block when it is full), and a
+        fixed pool of max_concurrent_tasks workers drains it through
+        process_message. On shutdown the queue is drained before returning.
+        """
         print("Starting AI Multi-Agent Orchestration System")
+        if not self.sources:
+            self.sources.extend(self._default_sources())
+
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self._stop_event = asyncio.Event()
+        producers = [asyncio.create_task(self._produce(source)) for source in self.sources]
+        # With the scheduler, extra workers carry the backlog into it, where it is ordered by priority
+        worker_count = self.max_concurrent_tasks + (self.scheduler.max_waiting if self.scheduler else 0)
+        workers = [asyncio.create_task(self._work(worker_id)) for worker_id in range(worker_count)]
+        metrics_server = None
+        if self.metrics.enabled and settings.app.metrics_port:
+            metrics_server = await self.metrics.serve(port=settings.app.metrics_port)
+            print(f"Serving metrics on port {settings.app.metrics_port}")
+
+        try:
+            await asyncio.gather(*producers)
+        finally:
+            print("Stopping ingestion, draining queued messages...")
+            self._stop_event.set()
+            await asyncio.gather(*producers, return_exceptions=True)
+            for task, (source, message) in list(self._deferred.items()):
+                # Messages deferred in memory are retried now rather than lost with the process
+                if task.cancel():
+                    await self.queue.put((source, message, time.perf_counter()))
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout=self.shutdown_timeout)
+            except asyncio.TimeoutError:
+                print(f"Shutdown timeout reached with {self.queue.qsize()} messages still queued")
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            await self._on_drained()
+            for source in self.sources:
+                await source.close()
+            if metrics_server is not None:
+                metrics_server.close()
+            if self.metrics.enabled and settings.app.metrics_dump_path:
+                self.metrics.dump(settings.app.metrics_dump_path)
+                print(f"Metrics written to {settings.app.metrics_dump_path}")
+            print("Orchestrator stopped")
+
+    async def _on_drained(self):
+        """Hook run during shutdown after the queue is drained, before sources close and metrics are dumped"""
+        pass
+
+    def stop(self):
+        """Request a graceful shutdown of a running start()"""
+        if self._stop_event is not None:
+            self._stop_event.set()
+
+    async def _produce(self, source: MessageSource):
+        """Pull batches from a source into the bounded queue until it is exhausted or stop() is called"""
+        interval = source.poll_interval if source.poll_interval is not None else self.poll_interval
+        while not source.exhausted and not self._stop_event.is_set():
+            try:
+                batch = await self._fetch_unless_stopped(source)
+            except Exception as e:
+                print(f"Error fetching from source {source.name}: {str(e)}")
+                batch = []
+            if batch is None:
+                break
+            for message in batch:
+                # Blocks while the queue is full, applying backpressure to the source
+                await self.queue.put((source, message, time.perf_counter()))
+                self.metrics.set_gauge("ingestion_queue_depth", self.queue.qsize())
+            if not batch and not source.exhausted:
+                try:
+                    await asyncio.wait_for(self._stop_event.wait(), timeout=interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _fetch_unless_stopped(self, source: MessageSource) -> Optional[List[Dict[str, Any]]]:
+        """Fetch a batch, or return None if stop() is called while waiting on the source"""
+        fetch = asyncio.ensure_future(source.fetch())
+        stop = asyncio.ensure_future(self._stop_event.wait())
+        try:
+            await asyncio.wait({fetch, stop}, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            fetch.cancel()
+            raise
+        finally:
+            stop.cancel()
+        if not fetch.done():
+            fetch.cancel()
+            return None
+        return fetch.result()
+
+    async def _work(self, worker_id: int):
+        """Worker coroutine: process queued messages one at a time"""
+        while True:
+            source, message, enqueued = await self.queue.get()
+            self.metrics.set_gauge("ingestion_queue_depth", self.queue.qsize())
+            self.metrics.observe("queue_wait_seconds", time.perf_counter() - enqueued)
+            try:
+                async with self._contact_lock(contact_key(message)):
+                    result = await self.process_message(message)
+                if result["status"] == "deferred":
+                    await self._defer(source, message, result)
+                else:
+                    await source.ack(message, result)
+            except Exception as e:
+                print(f"Worker {worker_id} failed on message {message.get('message_id')}: {str(e)}")
+            finally:
+                self.queue.task_done()
+
+    async def _defer(self, source: MessageSource, message: Dict[str, Any], result: Dict[str, Any]):
+        """
+        Retry a message shed by the scheduler after scheduler_defer_delay seconds.
+
+        Sources that can redeliver it (durable work queues) take it back;
+        otherwise it is put back on the queue after the delay, or, during
+        shutdown, acked to its source with the deferred result.
+        """
+        delay = settings.app.scheduler_defer_delay
+        if await source.defer(message, delay):
+            return
+        if self._stop_event.is_set():
+            await source.ack(message, result)
+            return
+
+        async def requeue():
+            await asyncio.sleep(delay)
+            await self.queue.put((source, message, time.perf_counter()))
+
+        task = asyncio.ensure_future(requeue())
+        self._deferred[task] = (source, message)
+        task.add_done_callback(lambda done: self._deferred.pop(done, None))
+
+    def _default_sources(self) -> List[MessageSource]:
+        """The configured durable work queue and IMAP mailbox, or the demo message if neither is configured"""
+        sources: List[MessageSource] = []
+        work_queue = get_work_queue()
+        if work_queue is not None:
+            sources.append(WorkQueueMessageSource(work_queue, batch_size=self.max_concurrent_tasks,
+                                                  poll_interval=settings.app.work_queue_poll_interval))
+        # Deferred import: imaplib/ssl/email load only when the orchestrator starts
+        from services.imap_source import get_imap_source
+        imap_source = get_imap_source()
+        if imap_source is not None:
+            sources.append(imap_source)
+        return sources or [self._demo_source()]
+
+    @asynccontextmanager
+    async def _contact_lock(self, key: str):
+        """Serialize processing per contact so concurrent workers never race on one contact's updateVersion"""
+        if settings.app.enable_update_coalescing:
+            # A contact's messages must run concurrently to be coalesced; the coalescer
+            # applies them in arrival order and PUTs are guarded by updateVersion
+            yield
+            return
+        entry = self._contact_locks.get(key)
+        if entry is None:
+            entry = self._contact_locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._contact_locks[key]
+
+    @staticmethod
+    def _demo_source() -> InMemoryMessageSource:
         message = {
             "message_id": '1',
-            "title:": 'update Address',
+            "title": 'update Address',
             "content": 'HI, I want to update my new addres: 3 Broyer st. BB. thanks, malka blau.',
             "sender": 'malka.blau@sapiens.com',
             "channel": 'manual',
         }
-
-        await self.process_message(message)
-
-    def __init__(self):
-        self.classification_agent = get_classification_agent()
-        # self.task_creation_agent = get_task_creation_agent()
-        self.task_execution_agent = get_task_execution_agent()
-        # self.message_service = get_message_pull_service()
-        self.max_concurrent_tasks = settings.app.max_concurrent_tasks
-        self.semaphore = asyncio.Semaphore(self.max_concurrent_tasks)
+        return InMemoryMessageSource([message], complete=True)
 
     async def process_message(self, message: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -44,46 +260,121 @@ class Orchestrator:
             message: Standardized message dictionary
 
         Returns:
-            Processing result with status and response
+            Processing result with status, response and per-stage timings (seconds)
         """
-        async with (self.semaphore):
-            try:
-                print(f"Processing message {message.get('message_id')} from {message.get('channel')}")
-
-                # Stage 1: Classification
-                # classification_result = await self._classify_message(message)
-
-                # if not classification_result:
-                #   print("Classification failed")
-                #    return self._create_error_result(message, "Classification failed")
-
-                # Stage 2: Task Creation
-                # task_data = await self._create_task(classification_result, message)
-
-                # if not task_data:
-                #   print("Task creation failed")
-                #    return self._create_error_result(message, "Task creation failed")
-
-                # Stage 3: Task Execution
-                task_data = {
-                    "queueId": 10886,
-                    "contactExtId": "617259",
-                    "dueOn": "2025-11-07T12:09:35.827Z",
-                    "updateVersion": 0,
-                    "taskDescription": "Contact: [contact reference]",
-                    "priority": 1,
-                    "followUpSuperType": 10000,
-                    "startHandlingOn": "2025-11-07T12:09:35.827Z",
-                    "consequences": 10000,
-                    "id": 0,
-                    "remarks": "string",
-                    "taskCategory": 10000
-                }
-
-                response= await  get_task_execution_agent().get_task_data(task_data)
-            except Exception as e:
-                print(f"Error processing message {message.get('message_id')}: {str(e)}")
-                return {"status": "failed", "response": None}
+        sequence = next(self._arrivals)
+        deduplicator = get_deduplicator()
+        with self.metrics.span("process_message", message_id=message.get("message_id"),
+                               channel=message.get("channel")) as span:
+            dedup_keys = await deduplicator.claim(message) if deduplicator is not None else []
+            if dedup_keys is None:
+                print(f"Skipping duplicate message {message.get('message_id')}")
+                result = {"status": "duplicate", "response": None, "timings": {}}
+            else:
+                # Stays "failed" if processing is cancelled, so the message is not remembered
+                result = {"status": "failed", "response": None, "timings": {}}
+                try:
+                    result = await self._schedule_pipeline(message, sequence)
+                finally:
+                    if deduplicator is not None:
+                        await deduplicator.complete(dedup_keys, result)
+            span.set("status", result["status"])
+        self.metrics.inc("messages_processed_total", status=result["status"])
+        for stage, seconds in result["timings"].items():
+            self.metrics.observe("pipeline_stage_duration_seconds", seconds, stage=stage)
+        return result
+
+    async def _schedule_pipeline(self, message: Dict[str, Any], sequence: int) -> Dict[str, Any]:
+        """Run the pipeline once the priority scheduler (or, without one, the semaphore) admits the message"""
+        if self.scheduler is None:
+            async with (self.semaphore):
+                return await self._run_pipeline(message, sequence)
+        ticket = await self.scheduler.acquire(message)
+        if ticket.shed:
+            print(f"Shedding {ticket.priority} priority message {message.get('message_id')}: {ticket.shed}")
+            return {"status": ticket.shed, "response": None, "timings": {}}
+        try:
+            return await self._run_pipeline(message, sequence)
+        finally:
+            self.scheduler.release(ticket)
+
+    async def _run_pipeline(self, message: Dict[str, Any], sequence: Optional[int] = None) -> Dict[str, Any]:
+        timings: Dict[str, float] = {}
+        speculation = None
+        try:
+            print(f"Processing message {message.get('message_id')} from {message.get('channel')}")
+            speculation = self._speculate(message)
+
+            # Stage 1: Classification
+            started = time.perf_counter()
+            classification_result = await self.classification_agent.classify_email(self._to_email(message))
+            timings["classification"] = time.perf_counter() - started
+
+            if not self.classification_agent.is_valid_classification(classification_result):
+                return self._result("not_classified", classification_result, timings, speculation)
+            if speculation is not None and speculation.key != f"contact:{classification_result.get('contactExtId')}":
+                speculation.discard()
+
+            # Stage 2: Task Creation
+            started = time.perf_counter()
+            with self.metrics.span("stage.task_creation"):
+                await self.classification_agent.create_task(classification_result, self._task_key(message))
+            timings["task_creation"] = time.perf_counter() - started
+
+            # Stage 3: Task Execution
+            started = time.perf_counter()
+            if speculation is not None:
+                # The execution's contact fetch is served by the prefetch (through the entity cache)
+                await speculation.confirm()
+            response = await self.task_execution_agent.get_task_data(classification_result, sequence)
+            timings["task_execution"] = time.perf_counter() - started
+            return self._result("completed", response, timings, speculation)
+        except Exception as e:
+            print(f"Error processing message {message.get('message_id')}: {str(e)}")
+            return self._result("failed", None, timings, speculation)
+        finally:
+            if speculation is not None:
+                speculation.discard()
+
+    def _speculate(self, message: Dict[str, Any]) -> Optional[Speculation]:
+        """
+        Start fetching the contact named by an explicit contact id in the
+        message, in parallel with classification; None if speculative
+        prefetching is disabled or the message names no contact.
+        """
+        if not settings.app.enable_speculative_prefetch:
+            return None
+        key = contact_key(message)
+        if not key.startswith("contact:"):
+            return None
+        contact_id = key.split(":", 1)[1]
+        return Speculation("contact_fetch", key, self.task_execution_agent.fetch_contact(contact_id))
+
+    @staticmethod
+    def _result(status: str, response: Any, timings: Dict[str, float],
+                speculation: Optional[Speculation]) -> Dict[str, Any]:
+        result = {"status": status, "response": response, "timings": timings}
+        if speculation is not None:
+            # Settled here so the report is final; a no-op if the prefetch was confirmed
+            speculation.discard()
+            result["speculation"] = speculation.report()
+        return result
+
+    @staticmethod
+    def _task_key(message: Dict[str, Any]) -> Optional[str]:
+        """Idempotency key for the task created from a message, stable across redeliveries"""
+        message_id = message.get("message_id")
+        return f"createTask-{message.get('channel')}-{message_id}" if message_id else None
+
+    @staticmethod
+    def _to_email(message: Dict[str, Any]) -> Dict[str, Any]:
+        """Map a standardized channel message to the email shape the classifier expects"""
+        return {
+            "message_id": message.get("message_id"),
+            "from": message.get("sender"),
+            "subject": message.get("title"),
+            "body": message.get("content"),
+        }
 
 
 _orchestrator = None
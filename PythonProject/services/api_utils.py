@@ -1,52 +1,266 @@
 from typing import Optional, Dict, Any
-import requests
+import asyncio
+import threading
+import time
+import httpx
+
+from config.settings import settings
+from services.metrics import get_metrics
+from services.rate_limit import get_rate_limiter, retry_after_seconds
+from services.resilience import CircuitBreaker, endpoint_key, get_circuit_breaker, hedged, retry_async
+
+# Methods that can be repeated safely; other methods are only retried when sent with an idempotency key
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+RETRYABLE_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
 
 
 class ApiUtils:
+    """
+    IDIT API client backed by one keep-alive connection pool.
+    The async methods are the primary interface; get_api/post_api/put_api
+    remain as a synchronous facade for existing callers. Async requests pass
+    through the shared "idit" rate limiter, whose concurrency limit adapts to
+    429/503 responses, Retry-After hints and latency, and through a
+    per-endpoint circuit breaker. Transient failures of idempotent requests
+    are retried with decorrelated-jitter backoff, and slow GETs can be hedged.
+    """
+
+    def __init__(self):
+        api_settings = settings.idit_api
+        self.base_url = api_settings.base_url
+        self.timeout = httpx.Timeout(api_settings.timeout)
+        self.limits = httpx.Limits(
+            max_connections=api_settings.pool_size,
+            max_keepalive_connections=api_settings.pool_size,
+            keepalive_expiry=api_settings.keepalive_expiry,
+        )
+        self.default_headers = self._build_default_headers(api_settings.api_key)
+        self.default_json_headers = {**self.default_headers, 'Content-Type': 'application/json'}
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._sync_client: Optional[httpx.Client] = None
+        self.limiter = get_rate_limiter("idit")
+
+    @staticmethod
+    def _build_default_headers(api_key: Dict[str, str]) -> Dict[str, str]:
+        """Build the default IDIT headers once from the configured credentials"""
+        return {'accept': 'application/json', **api_key}
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        """Pooled async HTTP client, created on first use"""
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=self.limits)
+        return self._async_client
+
+    @property
+    def sync_client(self) -> httpx.Client:
+        """Pooled sync HTTP client backing the sync facade, created on first use"""
+        if self._sync_client is None:
+            self._sync_client = httpx.Client(base_url=self.base_url, timeout=self.timeout, limits=self.limits)
+        return self._sync_client
+
+    def _request_headers(self, json_data: Optional[Dict[str, Any]], headers: Optional[Dict[str, str]]) -> Dict[str, str]:
+        if headers:
+            return headers
+        return self.default_headers if json_data is None else self.default_json_headers
+
+    @staticmethod
+    def _handle_response(response: httpx.Response) -> Dict[str, Any]:
+        print(f"Response status: {response.status_code}")
+        print(f"Response body: {response.text}")
+        response.raise_for_status()
+        return response.json()
+
+    @staticmethod
+    def _log_error(method: str, e: httpx.HTTPError):
+        print(f"Error calling {method} API: {e}")
+        if isinstance(e, httpx.HTTPStatusError):
+            print(f"Response text: {e.response.text}")
+
+    @staticmethod
+    def _is_retryable(e: BaseException) -> bool:
+        if isinstance(e, httpx.HTTPStatusError):
+            return e.response.status_code in RETRYABLE_STATUS_CODES
+        return isinstance(e, httpx.TransportError)
+
+    @staticmethod
+    def _record(method: str, started: float, status: Any):
+        metrics = get_metrics()
+        metrics.inc("http_requests_total", backend="idit", method=method, status=status)
+        metrics.observe("http_request_duration_seconds", time.perf_counter() - started, backend="idit", method=method)
+
+    async def request_async(
+        self,
+        method: str,
+        url: str,
+        json_data: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        idempotency_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Send a request over the shared async connection pool.
+
+        Args:
+            method: HTTP method (GET, POST, PUT...).
+            url: Absolute URL, or a path relative to the IDIT base URL.
+            json_data: Optional dictionary sent as the JSON request body.
+            headers: Optional dictionary containing HTTP headers. If None, uses default headers.
+            idempotency_key: Sent as the Idempotency-Key header; makes a non-idempotent request retryable.
+
+        Returns:
+            Dictionary containing the API response.
+
+        Raises:
+            httpx.HTTPError: If the API call fails after all retries.
+            CircuitOpenError: If the endpoint's circuit breaker is open.
+        """
+        request_headers = self._request_headers(json_data, headers)
+        if idempotency_key:
+            request_headers = {**request_headers, 'Idempotency-Key': idempotency_key}
+        breaker = get_circuit_breaker(endpoint_key("idit", method, url))
+
+        async def attempt():
+            return await self._send_async(method, url, json_data, request_headers, breaker)
+
+        call = attempt
+        hedge_delay = settings.idit_api.hedge_delay
+        if method == "GET" and hedge_delay:
+            async def call():
+                return await hedged(attempt, hedge_delay)
+
+        if method in IDEMPOTENT_METHODS or idempotency_key:
+            return await retry_async(call, self._is_retryable, description=f"IDIT {method} {url}")
+        return await call()
+
+    async def _send_async(self, method: str, url: str, json_data: Optional[Dict[str, Any]],
+                          headers: Dict[str, str], breaker: CircuitBreaker) -> Dict[str, Any]:
+        """Single attempt: circuit breaker check, rate limiter slot, request and response handling"""
+        breaker.before_call()
+        with get_metrics().span(f"idit.{method}", url=url):
+            async with self.limiter.acquire() as permit:
+                started = time.perf_counter()
+                try:
+                    print(f"Sending {method} request to: {url}")
+                    response = await self.async_client.request(method, url, headers=headers, json=json_data)
+                except httpx.HTTPError as e:
+                    self._record(method, started, type(e).__name__)
+                    breaker.record_failure()
+                    self._log_error(method, e)
+                    raise
+                except asyncio.CancelledError:
+                    breaker.release_probe()
+                    raise
+                self._record(method, started, response.status_code)
+                if response.status_code in (429, 503):
+                    permit.throttle(retry_after_seconds(response.headers))
+                if response.status_code >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                try:
+                    return self._handle_response(response)
+                except httpx.HTTPError as e:
+                    self._log_error(method, e)
+                    raise
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        json_data: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Any]:
+        """Synchronous counterpart of request_async, sharing the same pool settings"""
+        started = time.perf_counter()
+        with get_metrics().span(f"idit.{method}", url=url):
+            try:
+                print(f"Sending {method} request to: {url}")
+                response = self.sync_client.request(
+                    method, url, headers=self._request_headers(json_data, headers), json=json_data
+                )
+                self._record(method, started, response.status_code)
+                return self._handle_response(response)
+            except httpx.HTTPError as e:
+                if not isinstance(e, httpx.HTTPStatusError):
+                    self._record(method, started, type(e).__name__)
+                self._log_error(method, e)
+                raise
+
+    async def get_api_async(self, url: str, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """
+        Generic async GET method to call any API endpoint.
+
+        Args:
+            url: Absolute URL, or a path relative to the IDIT base URL.
+            headers: Optional dictionary containing HTTP headers. If None, uses default headers.
+
+        Returns:
+            Dictionary containing the API response.
+
+        Raises:
+            httpx.HTTPError: If the API call fails.
+        """
+        return await self.request_async("GET", url, headers=headers)
+
+    async def post_api_async(self, url: str, json_data: Dict[str, Any], headers: Optional[Dict[str, str]] = None,
+                             idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Generic async POST method to call any API endpoint.
+
+        Args:
+            url: Absolute URL, or a path relative to the IDIT base URL.
+            json_data: Dictionary containing the JSON data to send in the request body.
+            headers: Optional dictionary containing HTTP headers. If None, uses default headers.
+            idempotency_key: Optional Idempotency-Key; without one a failed POST is not retried.
+
+        Returns:
+            Dictionary containing the API response.
+
+        Raises:
+            httpx.HTTPError: If the API call fails.
+        """
+        return await self.request_async("POST", url, json_data=json_data, headers=headers,
+                                        idempotency_key=idempotency_key)
+
+    async def put_api_async(self, url: str, json_data: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """
+        Generic async PUT method to call any API endpoint.
+
+        Args:
+            url: Absolute URL, or a path relative to the IDIT base URL.
+            json_data: Dictionary containing the JSON data to send in the request body.
+            headers: Optional dictionary containing HTTP headers. If None, uses default headers.
+
+        Returns:
+            Dictionary containing the API response.
+
+        Raises:
+            httpx.HTTPError: If the API call fails.
+        """
+        return await self.request_async("PUT", url, json_data=json_data, headers=headers)
 
     def get_api(self, url: str, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
         """
         Generic GET method to call any API endpoint.
 
         Args:
-            url: The complete URL for the GET request.
+            url: Absolute URL, or a path relative to the IDIT base URL.
             headers: Optional dictionary containing HTTP headers. If None, uses default headers.
 
         Returns:
             Dictionary containing the API response.
 
         Raises:
-            requests.exceptions.RequestException: If the API call fails.
+            httpx.HTTPError: If the API call fails.
         """
-        print("Inside get_api method")
-        default_headers = {
-            'accept': 'application/json',
-            'userName': 'Administrator',
-            'password': '1111'
-        }
-
-        request_headers = headers or default_headers
-
-        try:
-            print(f"Sending GET request to: {url}")
-            print(f"Headers: {request_headers}")
-            response = requests.get(url, headers=request_headers)
-            print(f"Response status: {response.status_code}")
-            print(f"Response body: {response.text}")
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Error calling GET API: {e}")
-            if hasattr(e, 'response') and e.response is not None:
-                print(f"Response text: {e.response.text}")
-            raise
+        return self.request("GET", url, headers=headers)
 
     def post_api(self, url: str, json_data: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
         """
         Generic POST method to call any API endpoint.
 
         Args:
-            url: The complete URL for the POST request.
+            url: Absolute URL, or a path relative to the IDIT base URL.
             json_data: Dictionary containing the JSON data to send in the request body.
             headers: Optional dictionary containing HTTP headers. If None, uses default headers.
 
@@ -54,38 +268,16 @@ class ApiUtils:
             Dictionary containing the API response.
 
         Raises:
-            requests.exceptions.RequestException: If the API call fails.
+            httpx.HTTPError: If the API call fails.
         """
-        default_headers = {
-            'accept': 'application/json',
-            'userName': 'Administrator',
-            'password': '1111',
-            'Content-Type': 'application/json'
-        }
-
-        request_headers = headers or default_headers
-
-        try:
-            print(f"Sending POST request to: {url}")
-            print(f"Headers: {request_headers}")
-            print(f"Body: {json_data}")
-            response = requests.post(url, headers=request_headers, json=json_data)
-            print(f"Response status: {response.status_code}")
-            print(f"Response body: {response.text}")
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Error calling POST API: {e}")
-            if hasattr(e, 'response') and e.response is not None:
-                print(f"Response text: {e.response.text}")
-            raise
+        return self.request("POST", url, json_data=json_data, headers=headers)
 
     def put_api(self, url: str, json_data: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
         """
         Generic PUT method to call any API endpoint.
 
         Args:
-            url: The complete URL for the PUT request.
+            url: Absolute URL, or a path relative to the IDIT base URL.
             json_data: Dictionary containing the JSON data to send in the request body.
             headers: Optional dictionary containing HTTP headers. If None, uses default headers.
 
@@ -93,43 +285,30 @@ class ApiUtils:
             Dictionary containing the API response.
 
         Raises:
-            requests.exceptions.RequestException: If the API call fails.
+            httpx.HTTPError: If the API call fails.
         """
-        default_headers = {
-            'accept': 'application/json',
-            'userName': 'Administrator',
-            'password': '1111',
-            'Content-Type': 'application/json'
-        }
-
-        request_headers = headers or default_headers
-
-        try:
-            print(f"Sending PUT request to: {url}")
-            print(f"Headers: {request_headers}")
-            print(f"Body: {json_data}")
-            response = requests.put(url, headers=request_headers, json=json_data)
-            print(f"Response status: {response.status_code}")
-            print(f"Response body: {response.text}")
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Error calling PUT API: {e}")
-            if hasattr(e, 'response') and e.response is not None:
-                print(f"Response text: {e.response.text}")
-
-    pass
+        return self.request("PUT", url, json_data=json_data, headers=headers)
+
+    async def close(self):
+        """Close the pooled connections"""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+        if self._sync_client is not None:
+            self._sync_client.close()
+            self._sync_client = None
 
 
 # Singleton instance
 _api_utils = None
+_api_utils_lock = threading.Lock()
 
 
 def get_api_utils() -> ApiUtils:
-    """Get or create task execution agent singleton"""
+    """Get or create IDIT API utilities singleton (thread-safe, built on first use)"""
     global _api_utils
     if _api_utils is None:
-        _api_utils = ApiUtils()
+        with _api_utils_lock:
+            if _api_utils is None:
+                _api_utils = ApiUtils()
     return _api_utils
-
- 
\ No newline at end of file
@@ -0,0 +1,141 @@
+"""
+Classification Cache
+Memoizes email classifications by a normalized content hash
+"""
+import copy
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+from config.settings import settings
+from services.sqlite_utils import sqlite_path_from_url, connect_sqlite
+
+_WHITESPACE = re.compile(r"\s+")
+_REPLY_PREFIX = re.compile(r"^\s*((re|fw|fwd)\s*:\s*)+", re.IGNORECASE)
+
+
+class ClassificationCache:
+    """
+    Two-tier cache of classification results.
+
+    Keys hash the normalized (from, subject, body) together with the prompt
+    version, so editing the system prompt automatically misses old entries.
+    The in-memory LRU tier is always on; the SQLite tier is used when
+    AppSettings.database_url is a sqlite URL and survives restarts.
+    """
+
+    def __init__(self, max_size: int = 10000, db_path: Optional[str] = None):
+        self.max_size = max_size
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._db = connect_sqlite(db_path)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS classification_cache ("
+                "key TEXT PRIMARY KEY, prompt_version TEXT NOT NULL, "
+                "result TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(text: Optional[str]) -> str:
+        """Unicode-normalize, casefold and collapse whitespace"""
+        text = unicodedata.normalize("NFKC", text or "")
+        return _WHITESPACE.sub(" ", text).strip().casefold()
+
+    @classmethod
+    def make_key(cls, email: Dict[str, Any], prompt_version: str) -> str:
+        """
+        Build the cache key for an email.
+
+        Args:
+            email: Email dictionary with from/subject/body
+            prompt_version: Hash identifying the classification prompt
+
+        Returns:
+            Hex digest identifying the (email content, prompt) pair
+        """
+        subject = _REPLY_PREFIX.sub("", email.get("subject") or "")
+        parts = [
+            prompt_version,
+            cls.normalize(email.get("from")),
+            cls.normalize(subject),
+            cls.normalize(email.get("body")),
+        ]
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a cached classification, or None on a miss"""
+        with self._lock:
+            result = self._memory.get(key)
+            if result is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return copy.deepcopy(result)
+            if self._db is not None:
+                row = self._db.execute("SELECT result FROM classification_cache WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    result = json.loads(row[0])
+                    self._remember(key, copy.deepcopy(result))
+                    self.disk_hits += 1
+                    return result
+            self.misses += 1
+            return None
+
+    def set(self, key: str, result: Dict[str, Any], prompt_version: str):
+        """Store a copy of a classification in both tiers, so later changes to result do not reach the cache"""
+        with self._lock:
+            self._remember(key, copy.deepcopy(result))
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO classification_cache (key, prompt_version, result, created_at) VALUES (?, ?, ?, ?)",
+                    (key, prompt_version, json.dumps(result), time.time())
+                )
+
+    def purge_stale(self, prompt_version: str) -> int:
+        """Delete persisted entries produced by any other prompt version"""
+        if self._db is None:
+            return 0
+        with self._lock:
+            cursor = self._db.execute("DELETE FROM classification_cache WHERE prompt_version != ?", (prompt_version,))
+            return cursor.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss statistics"""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "size": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+    def _remember(self, key: str, result: Dict[str, Any]):
+        self._memory[key] = result
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+
+# Singleton instance
+_classification_cache = None
+
+
+def get_classification_cache() -> ClassificationCache:
+    """Get or create classification cache singleton"""
+    global _classification_cache
+    if _classification_cache is None:
+        _classification_cache = ClassificationCache(
+            max_size=settings.app.classification_cache_size,
+            db_path=sqlite_path_from_url(settings.app.database_url),
+        )
+    return _classification_cache
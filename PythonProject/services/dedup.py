@@ -0,0 +1,409 @@
+"""
+Message Deduplication
+Bloom filter in front of a persistent seen-set, so redelivered messages skip the pipeline
+"""
+import asyncio
+import hashlib
+import math
+import threading
+import time
+from typing import Dict, Any, Callable, List, Optional
+
+from config.settings import settings
+from services.classification_cache import ClassificationCache
+from services.metrics import get_metrics
+from services.sqlite_utils import sqlite_path_from_url, connect_sqlite
+
+# Processing results that mark a message as seen; failed messages may be redelivered and retried
+SEEN_STATUSES = ("completed", "not_classified")
+COMPACTION_BATCH = 10000
+
+
+def _digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def message_keys(message: Dict[str, Any], by_content: bool = False) -> List[bytes]:
+    """
+    Dedup keys of a message: its channel message_id and, optionally, a
+    fingerprint of the normalized sender, title and content (which also
+    catches resends under a new message_id, but also a sender repeating the
+    same request on purpose, e.g. changing a phone number back).
+
+    Returns:
+        16-byte digests
+    """
+    keys = []
+    if message.get("message_id"):
+        keys.append(_digest(f"id\x1f{message.get('channel') or ''}\x1f{message['message_id']}"))
+    if by_content:
+        parts = [ClassificationCache.normalize(message.get(field)) for field in ("sender", "title", "content")]
+        keys.append(_digest("content\x1f" + "\x1f".join(parts)))
+    return keys
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over 16-byte digests (double hashing on the digest halves)"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: bytes):
+        first = int.from_bytes(key[:8], "little")
+        step = int.from_bytes(key[8:16], "little") | 1
+        return ((first + i * step) % self.size for i in range(self.hashes))
+
+    def add(self, key: bytes):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: bytes) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class SeenStore:
+    """Base class for persistent sets of dedup keys that expire after a TTL"""
+
+    async def contains_any(self, keys: List[bytes]) -> bool:
+        raise NotImplementedError
+
+    async def add(self, keys: List[bytes], ttl: float):
+        raise NotImplementedError
+
+    async def live_keys(self) -> List[bytes]:
+        """Every unexpired key, used to fill the Bloom filter at startup"""
+        raise NotImplementedError
+
+    async def compact(self) -> int:
+        """Delete expired keys; returns how many were deleted"""
+        return 0
+
+    async def close(self):
+        pass
+
+
+class MemorySeenStore(SeenStore):
+    """Seen-set in a dict; lost on restart"""
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self._clock = clock
+        self._expiry: Dict[bytes, float] = {}
+
+    async def contains_any(self, keys: List[bytes]) -> bool:
+        now = self._clock()
+        return any(self._expiry.get(key, 0) > now for key in keys)
+
+    async def add(self, keys: List[bytes], ttl: float):
+        expires_at = self._clock() + ttl
+        for key in keys:
+            self._expiry[key] = expires_at
+
+    async def live_keys(self) -> List[bytes]:
+        now = self._clock()
+        return [key for key, expires_at in self._expiry.items() if expires_at > now]
+
+    async def compact(self) -> int:
+        now = self._clock()
+        expired = [key for key, expires_at in self._expiry.items() if expires_at <= now]
+        for key in expired:
+            del self._expiry[key]
+        return len(expired)
+
+
+class SQLiteSeenStore(SeenStore):
+    """
+    Seen-set in a WITHOUT ROWID SQLite table of 16-byte keys and expiry
+    times. Lookups are primary-key probes of a few microseconds, so they run
+    inline; compaction deletes in batches on a worker thread.
+    """
+
+    def __init__(self, path: str, clock: Callable[[], float] = time.time):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._db = connect_sqlite(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS seen_messages ("
+            "key BLOB PRIMARY KEY, expires_at INTEGER NOT NULL) WITHOUT ROWID"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS seen_messages_expiry ON seen_messages (expires_at)")
+
+    async def contains_any(self, keys: List[bytes]) -> bool:
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT 1 FROM seen_messages WHERE key IN ({','.join('?' * len(keys))}) AND expires_at > ? LIMIT 1",
+                (*keys, int(self._clock()))
+            ).fetchone()
+        return row is not None
+
+    async def add(self, keys: List[bytes], ttl: float):
+        expires_at = int(self._clock() + ttl)
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO seen_messages (key, expires_at) VALUES (?, ?)",
+                [(key, expires_at) for key in keys]
+            )
+
+    async def live_keys(self) -> List[bytes]:
+        def select():
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT key FROM seen_messages WHERE expires_at > ?", (int(self._clock()),)
+                ).fetchall()
+            return [row[0] for row in rows]
+        return await asyncio.to_thread(select)
+
+    async def compact(self) -> int:
+        def delete() -> int:
+            deleted = 0
+            while True:
+                # Batches keep the lock, and so concurrent lookups, from waiting on one huge DELETE
+                with self._lock:
+                    cursor = self._db.execute(
+                        "DELETE FROM seen_messages WHERE key IN "
+                        "(SELECT key FROM seen_messages WHERE expires_at <= ? LIMIT ?)",
+                        (int(self._clock()), COMPACTION_BATCH)
+                    )
+                deleted += cursor.rowcount
+                if cursor.rowcount < COMPACTION_BATCH:
+                    return deleted
+        return await asyncio.to_thread(delete)
+
+    async def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class RedisSeenStore(SeenStore):
+    """Seen-set as Redis keys with native expiry, shared by every process and host"""
+
+    def __init__(self, client=None, prefix: str = "dedup:"):
+        """
+        Args:
+            client: redis.asyncio client (or compatible stand-in); created from AppSettings if None
+            prefix: Key prefix
+        """
+        if client is None:
+            try:
+                import redis.asyncio as redis
+            except ImportError as e:
+                raise ImportError("RedisSeenStore requires the 'redis' package") from e
+            client = redis.Redis(host=settings.app.redis_host, port=settings.app.redis_port)
+        self.client = client
+        self.prefix = prefix
+
+    def _name(self, key: bytes) -> str:
+        return self.prefix + key.hex()
+
+    async def contains_any(self, keys: List[bytes]) -> bool:
+        return await self.client.exists(*(self._name(key) for key in keys)) > 0
+
+    async def add(self, keys: List[bytes], ttl: float):
+        async with self.client.pipeline(transaction=False) as pipeline:
+            for key in keys:
+                pipeline.set(self._name(key), 1, ex=max(1, int(ttl)))
+            await pipeline.execute()
+
+    async def live_keys(self) -> List[bytes]:
+        keys = []
+        async for name in self.client.scan_iter(match=f"{self.prefix}*", count=1000):
+            name = name.decode() if isinstance(name, bytes) else name
+            keys.append(bytes.fromhex(name[len(self.prefix):]))
+        return keys
+
+    async def close(self):
+        close = getattr(self.client, "aclose", None) or self.client.close
+        await close()
+
+
+class MessageDeduplicator:
+    """
+    Detects messages that were already processed.
+
+    A message is a duplicate if any of its keys (message_id, content
+    fingerprint) is in the seen-set. An in-memory Bloom filter answers most
+    lookups: a key it has never seen is new without touching the store, so
+    only duplicates and the filter's rare false positives cost a store
+    lookup. The filter has two generations of ttl seconds each, so its size
+    stays fixed however many messages pass, and it is filled from the store
+    before the first lookup. Keys are recorded once a message is processed
+    (failed messages stay retryable); a duplicate arriving while its
+    original is still in flight waits for the original's outcome.
+
+    With trust_bloom=False every lookup goes to the store; use it when
+    several independent processes consume the same messages, as each
+    process's filter only knows its own keys.
+    """
+
+    def __init__(self, store: SeenStore, ttl: float = 604800, capacity: int = 1000000,
+                 error_rate: float = 0.001, by_content: bool = False, trust_bloom: bool = True,
+                 compaction_interval: float = 3600, clock: Callable[[], float] = time.time):
+        """
+        Args:
+            store: Persistent seen-set
+            ttl: Seconds a processed message is remembered
+            capacity: Messages expected per ttl, sizing the Bloom filter
+            error_rate: Bloom filter false positive rate at capacity
+            by_content: Also deduplicate by content fingerprint, not only message_id; a legitimately
+                repeated request from the same sender within ttl is then dropped too
+            trust_bloom: Treat Bloom filter negatives as new without asking the store
+            compaction_interval: Seconds between deletions of expired keys from the store
+            clock: Time source
+        """
+        self.store = store
+        self.ttl = ttl
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.by_content = by_content
+        self.trust_bloom = trust_bloom
+        self.compaction_interval = compaction_interval
+        self._clock = clock
+        self._current = self._new_filter()
+        self._previous: Optional[BloomFilter] = None
+        self._generation_started = clock()
+        self._last_compaction = clock()
+        self._compacting = False
+        self._warm: Optional[asyncio.Task] = None
+        self._inflight: Dict[bytes, asyncio.Future] = {}
+
+    def _new_filter(self) -> BloomFilter:
+        # Up to two keys per message
+        return BloomFilter(2 * self.capacity, self.error_rate)
+
+    def _rotate(self):
+        if self._clock() - self._generation_started >= self.ttl:
+            # Keys of the previous generation are older than ttl by now
+            self._previous, self._current = self._current, self._new_filter()
+            self._generation_started = self._clock()
+
+    def _might_contain(self, key: bytes) -> bool:
+        return key in self._current or (self._previous is not None and key in self._previous)
+
+    async def _ensure_warm(self):
+        if self._warm is None:
+            self._warm = asyncio.ensure_future(self._fill_from_store())
+        await asyncio.shield(self._warm)
+
+    async def _fill_from_store(self):
+        keys = await self.store.live_keys()
+        for key in keys:
+            self._current.add(key)
+        get_metrics().inc("dedup_bloom_keys_loaded_total", len(keys))
+
+    async def claim(self, message: Dict[str, Any]) -> Optional[List[bytes]]:
+        """
+        Check a message before processing.
+
+        Args:
+            message: Standardized message dictionary
+
+        Returns:
+            The message's keys, to be passed to complete() after processing, or None if it is a duplicate
+        """
+        keys = message_keys(message, self.by_content)
+        if not keys:
+            return keys
+        while True:
+            waiting = [self._inflight[key] for key in keys if key in self._inflight]
+            if not waiting:
+                break
+            # The same message is being processed right now; a duplicate only if that succeeds
+            if any(await asyncio.gather(*(asyncio.shield(future) for future in waiting))):
+                get_metrics().inc("dedup_messages_total", result="duplicate_inflight")
+                return None
+
+        # Registered before the lookups below, so concurrent copies wait for this one
+        loop = asyncio.get_running_loop()
+        for key in keys:
+            self._inflight[key] = loop.create_future()
+        try:
+            if self.trust_bloom:
+                await self._ensure_warm()
+                self._rotate()
+                candidates = [key for key in keys if self._might_contain(key)]
+            else:
+                candidates = keys
+            duplicate = bool(candidates) and await self.store.contains_any(candidates)
+        except BaseException:
+            self._release(keys, False)
+            raise
+        if duplicate:
+            self._release(keys, True)
+            get_metrics().inc("dedup_messages_total", result="duplicate")
+            return None
+        get_metrics().inc("dedup_messages_total", result="bloom_false_positive" if candidates and self.trust_bloom
+                          else "new")
+        return keys
+
+    def _release(self, keys: List[bytes], seen: bool):
+        for key in keys:
+            future = self._inflight.pop(key, None)
+            if future is not None and not future.done():
+                future.set_result(seen)
+
+    async def complete(self, keys: List[bytes], result: Dict[str, Any]):
+        """
+        Record the outcome of a claimed message.
+
+        Args:
+            keys: Keys returned by claim()
+            result: Processing result; the keys are remembered unless it failed
+        """
+        seen = result.get("status") in SEEN_STATUSES
+        try:
+            if seen and keys:
+                self._rotate()
+                for key in keys:
+                    self._current.add(key)
+                await self.store.add(keys, self.ttl)
+        finally:
+            self._release(keys, seen)
+        if not self._compacting and self._clock() - self._last_compaction >= self.compaction_interval:
+            self._compacting = True
+            asyncio.ensure_future(self._compact())
+
+    async def _compact(self):
+        try:
+            deleted = await self.store.compact()
+            get_metrics().inc("dedup_keys_expired_total", deleted)
+        except Exception as e:
+            get_metrics().inc("dedup_compaction_errors_total", error=type(e).__name__)
+        finally:
+            self._last_compaction = self._clock()
+            self._compacting = False
+
+    async def close(self):
+        await self.store.close()
+
+
+# Singleton instance
+_deduplicator = None
+_deduplicator_lock = threading.Lock()
+
+
+def get_deduplicator() -> Optional[MessageDeduplicator]:
+    """Get or create the deduplicator singleton, or None if AppSettings.enable_dedup is off (thread-safe)"""
+    global _deduplicator
+    if _deduplicator is None and settings.app.enable_dedup:
+        with _deduplicator_lock:
+            if _deduplicator is None:
+                app = settings.app
+                backend = app.dedup_backend or ("sqlite" if sqlite_path_from_url(app.database_url) else "memory")
+                if backend == "sqlite":
+                    path = sqlite_path_from_url(app.database_url)
+                    if path is None:
+                        raise ValueError("DEDUP_BACKEND=sqlite requires a sqlite DATABASE_URL")
+                    store = SQLiteSeenStore(path)
+                elif backend == "redis":
+                    store = RedisSeenStore()
+                elif backend == "memory":
+                    store = MemorySeenStore()
+                else:
+                    raise ValueError(f"Unknown DEDUP_BACKEND: {app.dedup_backend}")
+                _deduplicator = MessageDeduplicator(
+                    store, ttl=app.dedup_ttl, capacity=app.dedup_expected_messages,
+                    error_rate=app.dedup_false_positive_rate, by_content=app.dedup_by_content,
+                    trust_bloom=app.dedup_trust_bloom,
+                )
+    return _deduplicator
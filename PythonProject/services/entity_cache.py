@@ -0,0 +1,171 @@
+"""
+Entity Cache
+Bounded TTL/LRU cache for IDIT entity lookups with single-flight loading
+"""
+import asyncio
+import copy
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Callable, Awaitable, Optional, Tuple
+
+from config.settings import settings
+
+
+class EntityCache:
+    """
+    In-memory cache in front of IDIT GET calls.
+
+    Entries are evicted least-recently-used once max_size is reached and
+    expire ttl seconds after they were loaded. Concurrent misses for the same
+    key share a single in-flight fetch, which is cancelled only when every
+    caller waiting for it is. Callers always receive a copy, so mutating a
+    returned entity never corrupts the cache.
+    """
+
+    def __init__(self, max_size: int = 1000, ttl: float = 300.0, clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[asyncio.Task, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    async def get(
+        self,
+        key: str,
+        fetcher: Callable[[], Awaitable[Dict[str, Any]]],
+        update_version: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Return the cached entity for key, loading it with fetcher on a miss.
+
+        Args:
+            key: Cache key, e.g. "contact:415089"
+            fetcher: Coroutine function performing the actual GET
+            update_version: Known current updateVersion of the entity; a cached
+                copy with a different updateVersion is treated as stale
+
+        Returns:
+            A copy of the entity
+        """
+        entity = self._lookup(key)
+        if entity is not None and update_version is not None and entity.get("updateVersion") != update_version:
+            self.invalidate(key)
+            entity = None
+        if entity is not None:
+            self.hits += 1
+            return copy.deepcopy(entity)
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(self._load(key, fetcher))
+            task.add_done_callback(self._consume_exception)
+            self._inflight[key] = task
+        else:
+            self.coalesced += 1
+        # Shield so a cancelled caller does not abort the fetch shared with other callers;
+        # the fetch is only cancelled when its last caller is
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            entity = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._waiters[task] == 1 and not task.done():
+                task.cancel()
+            raise
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+        return copy.deepcopy(entity)
+
+    def put(self, key: str, entity: Dict[str, Any]):
+        """Store a known-fresh entity, e.g. the body returned by a successful PUT"""
+        # A load started before the write must not overwrite the fresh copy when it completes
+        self._inflight.pop(key, None)
+        self._store(key, entity)
+
+    def invalidate(self, key: str):
+        """Drop a cached entity (and detach any in-flight load from the cache)"""
+        removed = self._entries.pop(key, None) is not None
+        removed = self._inflight.pop(key, None) is not None or removed
+        if removed:
+            self.invalidations += 1
+
+    def clear(self):
+        """Drop every cached entity"""
+        self._entries.clear()
+        self._inflight.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss statistics"""
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "hit_ratio": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+        }
+
+    async def _load(self, key: str, fetcher: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        this_task = asyncio.current_task()
+        try:
+            entity = await fetcher()
+            # Only cache if nobody invalidated the key while the fetch was in flight
+            if self._inflight.get(key) is this_task:
+                self._store(key, entity)
+            return entity
+        finally:
+            if self._inflight.get(key) is this_task:
+                del self._inflight[key]
+
+    def _lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, entity = entry
+        if self._clock() >= expires_at:
+            del self._entries[key]
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return entity
+
+    def _store(self, key: str, entity: Dict[str, Any]):
+        self._entries[key] = (self._clock() + self.ttl, copy.deepcopy(entity))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    @staticmethod
+    def _consume_exception(task: asyncio.Task):
+        # Callers see the exception through the shield; mark it retrieved so an
+        # abandoned load does not log "exception was never retrieved"
+        if not task.cancelled():
+            task.exception()
+
+
+# Singleton instance
+_entity_cache = None
+
+
+def get_entity_cache() -> EntityCache:
+    """Get or create IDIT entity cache singleton"""
+    global _entity_cache
+    if _entity_cache is None:
+        _entity_cache = EntityCache(
+            max_size=settings.idit_api.entity_cache_size,
+            ttl=settings.idit_api.entity_cache_ttl,
+        )
+    return _entity_cache
@@ -0,0 +1,87 @@
+"""
+Entity Registry
+IDIT entity types with their GET/PUT endpoints and the fields the LLM may update
+"""
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+
+@dataclass(frozen=True)
+class EntitySpec:
+    """An IDIT entity type: endpoint templates (formatted with entity_id) and its updatable fields"""
+    name: str
+    get_url: str
+    put_url: str
+    updatable_fields: Tuple[str, ...]
+
+    def get_endpoint(self, entity_id: str) -> str:
+        return self.get_url.format(entity_id=quote(str(entity_id), safe="@:"))
+
+    def put_endpoint(self, entity_id: str) -> str:
+        return self.put_url.format(entity_id=quote(str(entity_id), safe="@:"))
+
+    def cache_key(self, entity_id: str) -> str:
+        """Entity cache key, e.g. "contact:415089\""""
+        return f"{self.name}:{entity_id}"
+
+    def allowed_paths(self) -> List[str]:
+        """JSON Pointers a patch of this entity may touch"""
+        return [f"/{field}" for field in self.updatable_fields]
+
+
+# Contact fields the LLM may change; everything else (ids, versions, audit data) is never sent in patch mode
+CONTACT_UPDATABLE_FIELDS = (
+    "firstName", "lastName", "middleName", "title", "gender", "dateOfBirth", "language",
+    "email", "telephone", "mobile", "fax", "address", "addresses",
+)
+
+ENTITY_REGISTRY: Dict[str, EntitySpec] = {
+    "contact": EntitySpec("contact", "contact/{entity_id}", "contact/{entity_id}", CONTACT_UPDATABLE_FIELDS),
+    "policy": EntitySpec(
+        "policy", "policy/{entity_id}", "policy/{entity_id}",
+        ("paymentMethod", "paymentFrequency", "bankAccount", "correspondenceAddress", "beneficiaries"),
+    ),
+    "claim": EntitySpec(
+        "claim", "claim/{entity_id}", "claim/{entity_id}",
+        ("description", "lossDate", "lossLocation", "contactPhone", "contactEmail", "bankAccount"),
+    ),
+    "accounting": EntitySpec(
+        "accounting", "accounting/{entity_id}", "accounting/{entity_id}",
+        ("paymentMethod", "bankAccount", "billingAddress", "email"),
+    ),
+}
+
+# "contact:123", "policy:'abc 1'", "claim: \"C-9\"" (the value may be quoted to contain spaces)
+ENTITY_REFERENCE_PATTERN = re.compile(r"\b([A-Za-z]+)\s*:\s*(?:'([^']*)'|\"([^\"]*)\"|([^\s,;'\"]+))")
+
+
+def register_entity(spec: EntitySpec):
+    """Add or replace an entity type"""
+    ENTITY_REGISTRY[spec.name] = spec
+
+
+def get_entity_spec(entity_type: str) -> EntitySpec:
+    """
+    Spec of an entity type (case-insensitive).
+
+    Raises:
+        KeyError: If the entity type is not registered
+    """
+    return ENTITY_REGISTRY[entity_type.lower()]
+
+
+def parse_entity_references(description: Optional[str]) -> List[Tuple[str, str]]:
+    """
+    (entity type, id) pairs referenced in a task description such as "contact:123 policy:'abc'".
+
+    Unknown entity types are ignored and repeated references are returned once, in order.
+    """
+    references = []
+    for match in ENTITY_REFERENCE_PATTERN.finditer(description or ""):
+        entity_type = match.group(1).lower()
+        entity_id = next((group for group in match.groups()[1:] if group is not None), "").strip()
+        if entity_type in ENTITY_REGISTRY and entity_id and (entity_type, entity_id) not in references:
+            references.append((entity_type, entity_id))
+    return references
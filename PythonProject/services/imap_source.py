@@ -0,0 +1,419 @@
+"""
+IMAP Message Source
+Incremental email ingestion with a persistent UID checkpoint and IMAP IDLE
+"""
+import asyncio
+import email
+import html
+import imaplib
+import re
+import threading
+import time
+from email import policy
+from email.utils import parseaddr
+from typing import Dict, Any, List, Optional, Tuple
+
+from config.settings import settings
+from services.message_sources import MessageSource
+from services.metrics import get_metrics
+from services.sqlite_utils import sqlite_path_from_url, connect_sqlite
+
+# How often a thread blocked in IDLE checks whether the source is closing
+IDLE_CHECK_INTERVAL = 1.0
+MAX_RECONNECT_DELAY = 60.0
+
+_FETCH_START = re.compile(rb"^\d+ \(")
+_FETCH_ITEM = re.compile(rb"(UID|RFC822\.SIZE) (\d+)")
+_NEW_MAIL = re.compile(rb"^\* \d+ (EXISTS|RECENT)", re.IGNORECASE)
+_TAGS = re.compile(r"<[^>]+>")
+
+
+def uid_set(uids: List[int]) -> str:
+    """Compact IMAP sequence set of sorted UIDs, e.g. [1, 2, 3, 7] -> "1:3,7" """
+    ranges = []
+    for uid in uids:
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+    return ",".join(f"{low}:{high}" if low != high else str(low) for low, high in ranges)
+
+
+def parse_fetch_response(data: List[Any]) -> List[Dict[str, Any]]:
+    """
+    Split imaplib UID FETCH data into per-message parts.
+
+    Args:
+        data: Data returned by IMAP4.uid("FETCH", ...), a mix of (prefix, literal) tuples and bytes
+
+    Returns:
+        One dictionary per message with "UID", "RFC822.SIZE", "header" and "text" (bytes)
+    """
+    messages: List[Dict[str, Any]] = []
+    current: Optional[Dict[str, Any]] = None
+    for item in data:
+        prefix, literal = item if isinstance(item, tuple) else (item, None)
+        if not prefix:
+            continue
+        if _FETCH_START.match(prefix):
+            current = {"header": b"", "text": b""}
+            messages.append(current)
+        if current is None:
+            continue
+        for name, value in _FETCH_ITEM.findall(prefix):
+            current[name.decode()] = int(value)
+        if literal is not None:
+            if b"BODY[HEADER]" in prefix.upper():
+                current["header"] = literal
+            elif b"BODY[TEXT]" in prefix.upper():
+                current["text"] = literal
+    return [message for message in messages if "UID" in message]
+
+
+def body_text(message: email.message.EmailMessage) -> str:
+    """Plain text body of a parsed email, falling back to its HTML part with the tags stripped"""
+    try:
+        part = message.get_body(preferencelist=("plain", "html"))
+        if part is None:
+            return ""
+        content = part.get_content()
+    except (LookupError, KeyError, ValueError) as e:
+        print(f"Could not decode email body: {str(e)}")
+        return ""
+    if part.get_content_subtype() == "html":
+        content = html.unescape(_TAGS.sub(" ", content))
+    return content.strip()
+
+
+class IMAPCheckpointStore:
+    """
+    (UIDVALIDITY, last processed UID) per account and mailbox. Stored in
+    SQLite when AppSettings.database_url is a sqlite URL, otherwise in
+    memory only (every restart then starts from EmailSettings.initial_sync).
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self._memory: Dict[str, Tuple[int, int]] = {}
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._db = connect_sqlite(db_path)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS imap_checkpoints ("
+                "mailbox TEXT PRIMARY KEY, uidvalidity INTEGER NOT NULL, last_uid INTEGER NOT NULL, "
+                "updated_at REAL NOT NULL)"
+            )
+
+    def load(self, key: str) -> Optional[Tuple[int, int]]:
+        with self._lock:
+            if key not in self._memory and self._db is not None:
+                row = self._db.execute(
+                    "SELECT uidvalidity, last_uid FROM imap_checkpoints WHERE mailbox = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    self._memory[key] = (row[0], row[1])
+            return self._memory.get(key)
+
+    def save(self, key: str, uidvalidity: int, last_uid: int):
+        with self._lock:
+            self._memory[key] = (uidvalidity, last_uid)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO imap_checkpoints (mailbox, uidvalidity, last_uid, updated_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, uidvalidity, last_uid, time.time())
+                )
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+
+
+class IMAPMessageSource(MessageSource):
+    """
+    Feeds the orchestrator from an IMAP mailbox.
+
+    The mailbox is opened read-only and only messages with a UID above the
+    checkpoint are searched, so a sync costs the same however large the
+    mailbox is. New messages are fetched in one UID FETCH per batch with
+    BODY.PEEK (flags are left untouched), and only the first
+    max_body_bytes of each body are downloaded, so attachments never are.
+    When nothing is new the source waits in IMAP IDLE for the server to
+    report new mail (polling every message_poll_interval seconds on servers
+    without IDLE). The checkpoint advances as messages are acknowledged,
+    up to the oldest message still in flight, so a crash re-delivers
+    unfinished mail; a UIDVALIDITY change resets it. imaplib is blocking,
+    so all IMAP traffic runs on a worker thread.
+    """
+
+    name = "email"
+    poll_interval = 0  # fetch() itself waits in IDLE (or sleeps) when the mailbox has nothing new
+
+    def __init__(self, host: str, username: str, password: str, port: int = 993, use_ssl: bool = True,
+                 mailbox: str = "INBOX", checkpoints: Optional[IMAPCheckpointStore] = None,
+                 initial_sync: str = "new", batch_size: int = 50, max_body_bytes: int = 65536,
+                 use_idle: bool = True, idle_timeout: float = 300.0, fallback_poll_interval: float = 60.0,
+                 timeout: float = 30.0):
+        """
+        Args:
+            host: IMAP server
+            username: Login user
+            password: Login password
+            port: IMAP port
+            use_ssl: Connect with IMAP4_SSL
+            mailbox: Mailbox to read
+            checkpoints: Checkpoint store (in-memory if omitted)
+            initial_sync: Without a checkpoint, "new" starts after the current last message, "all" reads the whole mailbox
+            batch_size: Maximum messages per UID FETCH
+            max_body_bytes: Bytes of each message body downloaded
+            use_idle: Wait for new mail with IDLE when the server supports it
+            idle_timeout: Seconds before IDLE is re-issued (RFC 2177 servers drop it after 30 minutes)
+            fallback_poll_interval: Seconds between searches without IDLE
+            timeout: Socket timeout of IMAP commands
+        """
+        if initial_sync not in ("new", "all"):
+            raise ValueError(f"Unknown initial_sync: {initial_sync}")
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_ssl = use_ssl
+        self.mailbox = mailbox
+        self.checkpoints = checkpoints or IMAPCheckpointStore()
+        self.initial_sync = initial_sync
+        self.batch_size = batch_size
+        self.max_body_bytes = max_body_bytes
+        self.use_idle = use_idle
+        self.idle_timeout = idle_timeout
+        self.fallback_poll_interval = fallback_poll_interval
+        self.timeout = timeout
+        self.key = f"{username}@{host}:{port}/{mailbox}"
+        self._imap: Optional[imaplib.IMAP4] = None
+        self._imap_lock = threading.Lock()
+        self._closing = threading.Event()
+        self._uidvalidity: Optional[int] = None
+        self._fetched_uid = 0  # highest UID handed to the orchestrator
+        self._saved_uid: Optional[int] = None
+        self._unacked: Dict[int, int] = {}  # id(message) -> UID
+        self._failures = 0
+        self._idle_tags = 0
+
+    async def fetch(self) -> List[Dict[str, Any]]:
+        if self._failures:
+            # Back off after connection errors; fetch() is called again right away
+            delay = min(2 ** (self._failures - 1), MAX_RECONNECT_DELAY)
+            await asyncio.to_thread(self._closing.wait, delay)
+        try:
+            fetched = await asyncio.to_thread(self._sync)
+        except (imaplib.IMAP4.error, OSError):
+            self._failures += 1
+            self._disconnect()
+            raise
+        self._failures = 0
+        batch = []
+        for uid, message in fetched:
+            # Advanced only once the batch is delivered, so a cancelled fetch is searched again
+            self._fetched_uid = max(self._fetched_uid, uid)
+            self._unacked[id(message)] = uid
+            batch.append(message)
+        get_metrics().inc("email_messages_fetched_total", len(batch))
+        return batch
+
+    async def ack(self, message: Dict[str, Any], result: Optional[Dict[str, Any]]):
+        uid = self._unacked.pop(id(message), None)
+        if uid is None:
+            return
+        if result is not None and result.get("status") == "failed":
+            # Email has no redelivery of its own; the checkpoint moves past failed messages too
+            print(f"Email UID {uid} failed processing, not retried")
+        await self._save_checkpoint()
+
+    async def close(self):
+        self._closing.set()
+        await asyncio.to_thread(self._logout)
+        await self._save_checkpoint()
+        self.checkpoints.close()
+
+    async def _save_checkpoint(self):
+        if self._uidvalidity is None:
+            return
+        # Everything below the oldest in-flight message is done
+        last_uid = min(self._unacked.values()) - 1 if self._unacked else self._fetched_uid
+        if last_uid != self._saved_uid:
+            self._saved_uid = last_uid
+            await asyncio.to_thread(self.checkpoints.save, self.key, self._uidvalidity, last_uid)
+
+    def _sync(self) -> List[Tuple[int, Dict[str, Any]]]:
+        """Blocking: return new messages, waiting for new mail first if there is none yet"""
+        with self._imap_lock:
+            if self._closing.is_set():
+                return []
+            if self._imap is None:
+                self._connect()
+            uids = self._new_uids()
+            if not uids:
+                if self.use_idle and "IDLE" in self._imap.capabilities:
+                    if not self._idle():
+                        return []
+                elif self._closing.wait(self.fallback_poll_interval):
+                    return []
+                uids = self._new_uids()
+            return self._fetch(uids[:self.batch_size]) if uids else []
+
+    def _connect(self):
+        imap_class = imaplib.IMAP4_SSL if self.use_ssl else imaplib.IMAP4
+        imap = imap_class(self.host, self.port, timeout=self.timeout)
+        try:
+            imap.login(self.username, self.password)
+            status, data = imap.select(self.mailbox, readonly=True)
+            if status != "OK":
+                raise imaplib.IMAP4.error(f"Cannot open mailbox {self.mailbox}: {data!r}")
+            uidvalidity = imap.response("UIDVALIDITY")[1][0]
+            uidnext = imap.response("UIDNEXT")[1][0]
+            if uidvalidity is None:
+                raise imaplib.IMAP4.error(f"Server sent no UIDVALIDITY for {self.mailbox}")
+            uidvalidity = int(uidvalidity)
+        except BaseException:
+            imap.shutdown()
+            raise
+        self._imap = imap
+
+        checkpoint = self.checkpoints.load(self.key)
+        if checkpoint is not None and checkpoint[0] == uidvalidity:
+            last_uid = checkpoint[1]
+        else:
+            if checkpoint is not None:
+                print(f"UIDVALIDITY of {self.key} changed, resynchronizing ({self.initial_sync})")
+            if self.initial_sync == "all":
+                last_uid = 0
+            elif uidnext is not None:
+                last_uid = int(uidnext) - 1
+            else:
+                last_uid = max(self._search("UID *") or [0])
+            self.checkpoints.save(self.key, uidvalidity, last_uid)
+        if self._uidvalidity == uidvalidity:
+            # Reconnected: messages fetched before the connection dropped are already queued
+            last_uid = max(last_uid, self._fetched_uid)
+        else:
+            self._unacked.clear()
+            self._saved_uid = None
+        self._uidvalidity = uidvalidity
+        self._fetched_uid = last_uid
+        print(f"Connected to IMAP {self.key}, continuing after UID {self._fetched_uid}")
+
+    def _search(self, criteria: str) -> List[int]:
+        status, data = self._imap.uid("SEARCH", criteria)
+        if status != "OK":
+            raise imaplib.IMAP4.error(f"UID SEARCH failed: {data!r}")
+        return sorted(int(uid) for uid in b" ".join(part for part in data if part).split())
+
+    def _new_uids(self) -> List[int]:
+        # "n:*" always matches the highest UID, even when it is below n
+        return [uid for uid in self._search(f"UID {self._fetched_uid + 1}:*") if uid > self._fetched_uid]
+
+    def _fetch(self, uids: List[int]) -> List[Tuple[int, Dict[str, Any]]]:
+        status, data = self._imap.uid(
+            "FETCH", uid_set(uids),
+            f"(UID RFC822.SIZE BODY.PEEK[HEADER] BODY.PEEK[TEXT]<0.{self.max_body_bytes}>)"
+        )
+        if status != "OK":
+            raise imaplib.IMAP4.error(f"UID FETCH failed: {data!r}")
+        fetched = []
+        for part in sorted(parse_fetch_response(data), key=lambda part: part["UID"]):
+            fetched.append((part["UID"], self._to_message(part)))
+        return fetched
+
+    def _to_message(self, part: Dict[str, Any]) -> Dict[str, Any]:
+        """Map a fetched email to the orchestrator's standardized message"""
+        parsed = email.message_from_bytes(part["header"] + part["text"], policy=policy.default)
+        size = part.get("RFC822.SIZE")
+        truncated = size is not None and size > len(part["header"]) + len(part["text"])
+        message_id = (parsed.get("Message-ID") or "").strip()
+        return {
+            "message_id": message_id or f"imap-{self._uidvalidity}-{part['UID']}",
+            "title": str(parsed.get("Subject") or ""),
+            "content": body_text(parsed),
+            "sender": parseaddr(str(parsed.get("From") or ""))[1],
+            "channel": "email",
+            "received_at": str(parsed.get("Date") or "") or None,
+            "imap_uid": part["UID"],
+            "truncated": truncated,
+        }
+
+    def _idle(self) -> bool:
+        """Blocking: wait in IDLE; True if the server reported new mail before the timeout or close()"""
+        imap = self._imap
+        self._idle_tags += 1
+        tag = f"IDLE{self._idle_tags}".encode()
+        imap.send(tag + b" IDLE\r\n")
+        line = imap.readline()
+        if not line.startswith(b"+"):
+            raise imaplib.IMAP4.error(f"IDLE rejected: {line!r}")
+        notified = False
+        deadline = time.monotonic() + self.idle_timeout
+        imap.sock.settimeout(IDLE_CHECK_INTERVAL)
+        try:
+            while not notified and not self._closing.is_set() and time.monotonic() < deadline:
+                try:
+                    line = imap.readline()
+                except TimeoutError:
+                    # A timed-out socket file cannot be read again
+                    imap.file = imap.sock.makefile("rb")
+                    continue
+                if not line:
+                    raise imaplib.IMAP4.abort("connection closed during IDLE")
+                notified = bool(_NEW_MAIL.match(line))
+        finally:
+            imap.sock.settimeout(self.timeout)
+        imap.send(b"DONE\r\n")
+        while True:
+            line = imap.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("connection closed ending IDLE")
+            if line.startswith(tag + b" "):
+                if not line[len(tag) + 1:].upper().startswith(b"OK"):
+                    raise imaplib.IMAP4.error(f"IDLE failed: {line!r}")
+                break
+        get_metrics().inc("email_idle_wakeups_total", result="new_mail" if notified else "timeout")
+        return notified
+
+    def _logout(self):
+        with self._imap_lock:
+            if self._imap is not None:
+                try:
+                    self._imap.logout()
+                except (imaplib.IMAP4.error, OSError):
+                    pass
+                self._imap = None
+
+    def _disconnect(self):
+        """Drop a broken connection; the next fetch reconnects"""
+        imap, self._imap = self._imap, None
+        if imap is not None:
+            try:
+                imap.shutdown()
+            except OSError:
+                pass
+
+
+def get_imap_source() -> Optional[IMAPMessageSource]:
+    """Create an IMAP source from EmailSettings, or None if no IMAP server is configured"""
+    email_settings = settings.email
+    if not email_settings.imap_server:
+        return None
+    return IMAPMessageSource(
+        host=email_settings.imap_server,
+        port=email_settings.imap_port,
+        username=email_settings.username or "",
+        password=email_settings.password or "",
+        use_ssl=email_settings.imap_ssl,
+        mailbox=email_settings.mailbox,
+        checkpoints=IMAPCheckpointStore(sqlite_path_from_url(settings.app.database_url)),
+        initial_sync=email_settings.initial_sync,
+        batch_size=email_settings.fetch_batch_size,
+        max_body_bytes=email_settings.max_body_bytes,
+        use_idle=email_settings.use_idle,
+        idle_timeout=email_settings.idle_timeout,
+        fallback_poll_interval=settings.app.message_poll_interval,
+        timeout=email_settings.timeout,
+    )
@@ -0,0 +1,194 @@
+"""
+JSON Patch
+RFC 6902 validation and application, used to apply LLM-proposed entity edits locally
+"""
+import copy
+import json
+from typing import Dict, Any, List, Optional, Iterable
+
+OPERATIONS = {
+    "add": ("path", "value"),
+    "remove": ("path",),
+    "replace": ("path", "value"),
+    "move": ("from", "path"),
+    "copy": ("from", "path"),
+    "test": ("path", "value"),
+}
+
+
+class JsonPatchError(ValueError):
+    """Raised when a patch is malformed or does not apply to the target document"""
+
+
+def compact_json(value: Any) -> str:
+    """Serialize without insignificant whitespace, keeping non-ASCII text readable"""
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def parse_pointer(pointer: str) -> List[str]:
+    """
+    Split an RFC 6901 JSON Pointer into unescaped reference tokens.
+
+    Args:
+        pointer: Pointer such as "/address/city" ("" is the whole document)
+
+    Returns:
+        List of reference tokens
+
+    Raises:
+        JsonPatchError: If the pointer is not a string or does not start with "/"
+    """
+    if not isinstance(pointer, str):
+        raise JsonPatchError(f"Pointer must be a string, got {pointer!r}")
+    if pointer == "":
+        return []
+    if not pointer.startswith("/"):
+        raise JsonPatchError(f"Pointer must start with '/': {pointer!r}")
+    return [token.replace("~1", "/").replace("~0", "~") for token in pointer[1:].split("/")]
+
+
+def _array_index(container: List[Any], token: str, allow_end: bool) -> int:
+    if token == "-" and allow_end:
+        return len(container)
+    if not token.isdigit() or (token != "0" and token.startswith("0")):
+        raise JsonPatchError(f"Invalid array index {token!r}")
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise JsonPatchError(f"Array index {index} out of range")
+    return index
+
+
+def _resolve(document: Any, tokens: List[str]) -> Any:
+    current = document
+    for token in tokens:
+        if isinstance(current, dict):
+            if token not in current:
+                raise JsonPatchError(f"Path member {token!r} does not exist")
+            current = current[token]
+        elif isinstance(current, list):
+            current = current[_array_index(current, token, allow_end=False)]
+        else:
+            raise JsonPatchError(f"Cannot descend into {type(current).__name__} at {token!r}")
+    return current
+
+
+def _add(document: Any, tokens: List[str], value: Any) -> Any:
+    if not tokens:
+        return value
+    parent = _resolve(document, tokens[:-1])
+    key = tokens[-1]
+    if isinstance(parent, dict):
+        parent[key] = value
+    elif isinstance(parent, list):
+        parent.insert(_array_index(parent, key, allow_end=True), value)
+    else:
+        raise JsonPatchError(f"Cannot add to {type(parent).__name__}")
+    return document
+
+
+def _remove(document: Any, tokens: List[str]) -> Any:
+    if not tokens:
+        raise JsonPatchError("Cannot remove the whole document")
+    parent = _resolve(document, tokens[:-1])
+    key = tokens[-1]
+    if isinstance(parent, dict):
+        if key not in parent:
+            raise JsonPatchError(f"Path member {key!r} does not exist")
+        return parent.pop(key)
+    if isinstance(parent, list):
+        return parent.pop(_array_index(parent, key, allow_end=False))
+    raise JsonPatchError(f"Cannot remove from {type(parent).__name__}")
+
+
+def validate_patch(patch: Any, allowed_paths: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Check the structure of a patch without applying it.
+
+    Args:
+        patch: Candidate list of operations
+        allowed_paths: If given, every path/from must equal or lie below one of these pointers
+
+    Returns:
+        The patch, as a list of operation dictionaries
+
+    Raises:
+        JsonPatchError: If the patch is malformed or touches a path outside allowed_paths
+    """
+    if not isinstance(patch, list):
+        raise JsonPatchError("Patch must be a JSON array of operations")
+    allowed = [parse_pointer(path) for path in allowed_paths] if allowed_paths is not None else None
+    for operation in patch:
+        if not isinstance(operation, dict) or operation.get("op") not in OPERATIONS:
+            raise JsonPatchError(f"Invalid operation {operation!r}")
+        for member in OPERATIONS[operation["op"]]:
+            if member not in operation:
+                raise JsonPatchError(f"Operation {operation['op']!r} is missing {member!r}")
+        for member in ("path", "from"):
+            if member not in operation:
+                continue
+            tokens = parse_pointer(operation[member])
+            if allowed is not None and not any(tokens[:len(prefix)] == prefix for prefix in allowed):
+                raise JsonPatchError(f"Path {operation[member]!r} is not updatable")
+    return patch
+
+
+def apply_patch(document: Any, patch: Any, allowed_paths: Optional[Iterable[str]] = None) -> Any:
+    """
+    Apply an RFC 6902 patch atomically.
+
+    Args:
+        document: Target JSON document (not modified)
+        patch: List of operations
+        allowed_paths: Optional pointers limiting which parts of the document may change
+
+    Returns:
+        Patched copy of the document
+
+    Raises:
+        JsonPatchError: If any operation is invalid or fails, in which case nothing is applied
+    """
+    result = copy.deepcopy(document)
+    for operation in validate_patch(patch, allowed_paths):
+        op = operation["op"]
+        tokens = parse_pointer(operation["path"])
+        if op == "add":
+            result = _add(result, tokens, copy.deepcopy(operation["value"]))
+        elif op == "remove":
+            _remove(result, tokens)
+        elif op == "replace":
+            _resolve(result, tokens)
+            if not tokens:
+                result = copy.deepcopy(operation["value"])
+                continue
+            parent = _resolve(result, tokens[:-1])
+            key = tokens[-1] if isinstance(parent, dict) else _array_index(parent, tokens[-1], allow_end=False)
+            parent[key] = copy.deepcopy(operation["value"])
+        elif op == "move":
+            source = parse_pointer(operation["from"])
+            if tokens[:len(source)] == source and tokens != source:
+                raise JsonPatchError("Cannot move a value into one of its children")
+            if tokens != source:
+                result = _add(result, tokens, _remove(result, source))
+        elif op == "copy":
+            value = copy.deepcopy(_resolve(result, parse_pointer(operation["from"])))
+            result = _add(result, tokens, value)
+        elif _resolve(result, tokens) != operation["value"]:
+            raise JsonPatchError(f"Test failed at {operation['path']!r}")
+    return result
+
+
+def parse_patch(text: str) -> List[Dict[str, Any]]:
+    """
+    Extract the JSON Patch array from an LLM response (code fences and prose around it are ignored).
+
+    Raises:
+        JsonPatchError: If no JSON array can be parsed from the text
+    """
+    start, end = text.find("["), text.rfind("]")
+    if start == -1 or end <= start:
+        raise JsonPatchError("Response does not contain a JSON array")
+    try:
+        patch = json.loads(text[start:end + 1])
+    except json.JSONDecodeError as e:
+        raise JsonPatchError(f"Response is not valid JSON: {e}") from e
+    return validate_patch(patch)
@@ -0,0 +1,82 @@
+"""
+Incremental JSON Parsing
+Detects the first complete JSON object in text that arrives in chunks
+"""
+import json
+from typing import Dict, Any, Optional
+
+
+class IncrementalJSONParser:
+    """
+    Single-pass scanner that tracks brace depth and string/escape state, so it
+    finds the first complete top-level JSON object as soon as its closing brace
+    arrives. Text before the object (e.g. explanations) is skipped, and every
+    character is examined exactly once regardless of how the text is chunked.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._position = 0
+        self._start = -1
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self.result: Optional[Dict[str, Any]] = None
+
+    @property
+    def partial(self) -> str:
+        """Text of the object currently being received ('' outside an object)"""
+        return self._buffer[self._start:] if self._start >= 0 else ""
+
+    def feed(self, chunk: str) -> Optional[Dict[str, Any]]:
+        """
+        Consume the next chunk of text.
+
+        Args:
+            chunk: Newly received text
+
+        Returns:
+            The parsed object once complete, otherwise None
+        """
+        if self.result is not None:
+            return self.result
+        self._buffer += chunk
+        buffer = self._buffer
+        for index in range(self._position, len(buffer)):
+            char = buffer[index]
+            if self._depth == 0:
+                if char == "{":
+                    self._start = index
+                    self._depth = 1
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    candidate = buffer[self._start:index + 1]
+                    self._start = -1
+                    try:
+                        parsed = json.loads(candidate)
+                    except json.JSONDecodeError:
+                        continue
+                    if isinstance(parsed, dict):
+                        self._position = index + 1
+                        self.result = parsed
+                        return parsed
+        self._position = len(buffer)
+        return None
+
+
+def parse_first_json_object(text: str) -> Optional[Dict[str, Any]]:
+    """Return the first complete JSON object embedded in text, or None"""
+    return IncrementalJSONParser().feed(text)
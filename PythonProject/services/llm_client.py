@@ -0,0 +1,270 @@
+"""
+Async LLM Client
+Shared non-blocking Azure OpenAI client used by all agents
+"""
+import asyncio
+import importlib.util
+import threading
+from typing import Dict, Any, List, Optional, Callable, Awaitable, TypeVar
+
+import httpx
+from openai import AsyncAzureOpenAI, APIConnectionError, APIStatusError
+
+from config.settings import settings
+from services.metrics import get_metrics
+from services.rate_limit import get_rate_limiter, retry_after_seconds
+from services.resilience import get_circuit_breaker, retry_async
+
+T = TypeVar("T")
+
+# Rough characters-per-token ratio used to reserve tokens/min budget before a call
+CHARS_PER_TOKEN = 4
+DEFAULT_COMPLETION_TOKENS = 500
+RETRYABLE_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+class LLMClient:
+    """
+    Async Azure OpenAI client backed by a single pooled keep-alive connection
+    pool (HTTP/2 when AZURE_OPENAI_HTTP2 is set and the h2 package is installed).
+    Every agent shares this instance, so concurrent messages overlap their
+    LLM round-trips instead of blocking the event loop. All calls pass
+    through the shared "llm" rate limiter (429/503 responses shrink its
+    concurrency limit and pause it for the advertised Retry-After) and a
+    per-deployment circuit breaker; transient failures are retried with
+    decorrelated-jitter backoff.
+    """
+
+    def __init__(self):
+        llm_settings = settings.azure_openai
+        self.deployment_name = llm_settings.deployment_name
+        self.timeout = llm_settings.request_timeout
+        self.http_client = httpx.AsyncClient(
+            http2=self._http2_available(llm_settings.http2),
+            limits=httpx.Limits(
+                max_connections=llm_settings.max_connections,
+                max_keepalive_connections=llm_settings.max_connections,
+            ),
+            timeout=httpx.Timeout(llm_settings.request_timeout),
+        )
+        self.client = AsyncAzureOpenAI(
+            api_key=llm_settings.api_key,
+            api_version=llm_settings.api_version,
+            azure_endpoint=llm_settings.endpoint,
+            http_client=self.http_client,
+            # Throttling and retries are handled below, so 429s must reach the limiter instead of being retried here
+            max_retries=0,
+        )
+        self.limiter = get_rate_limiter("llm")
+        # Called with (deployment, prompt tokens, completion tokens) after every completion
+        self.usage_listeners: List[Callable[[str, int, int], None]] = []
+
+    async def chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        timeout: Optional[float] = None,
+        **kwargs: Any
+    ) -> str:
+        """
+        Send a chat completion request without blocking the event loop.
+
+        Args:
+            messages: Chat messages (role/content dictionaries)
+            model: Deployment name, defaults to the configured deployment
+            timeout: Per-request timeout in seconds, defaults to settings
+            **kwargs: Extra completion parameters (temperature, max_tokens...)
+
+        Returns:
+            Content of the first completion choice
+
+        Raises:
+            asyncio.TimeoutError: If the request exceeds the timeout.
+            asyncio.CancelledError: If the calling task is cancelled.
+        """
+        request_timeout = timeout or self.timeout
+        model = model or self.deployment_name
+        metrics = get_metrics()
+        estimated_tokens = self._estimate_tokens(messages, kwargs)
+        with metrics.span("llm.chat_completion", model=model) as span:
+            try:
+                response = await self._limited(
+                    lambda: asyncio.wait_for(
+                        self.client.chat.completions.create(
+                            model=model,
+                            messages=messages,
+                            timeout=request_timeout,
+                            **kwargs
+                        ),
+                        timeout=request_timeout
+                    ),
+                    estimated_tokens,
+                    model
+                )
+            except Exception as e:
+                metrics.inc("llm_requests_total", model=model, outcome=type(e).__name__)
+                raise
+            metrics.inc("llm_requests_total", model=model, outcome="ok")
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                self._record_usage(model, estimated_tokens, usage.prompt_tokens, usage.completion_tokens)
+                span.set("completion_tokens", usage.completion_tokens)
+        return response.choices[0].message.content
+
+    async def stream_chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        on_chunk: Callable[[str], bool],
+        model: Optional[str] = None,
+        timeout: Optional[float] = None,
+        **kwargs: Any
+    ) -> str:
+        """
+        Stream a chat completion, handing each content delta to on_chunk.
+
+        The stream is closed (and generation stops being paid for) as soon as
+        on_chunk returns True.
+
+        Args:
+            messages: Chat messages (role/content dictionaries)
+            on_chunk: Called with every content delta; return True to stop early
+            model: Deployment name, defaults to the configured deployment
+            timeout: Timeout in seconds for the whole stream, defaults to settings
+            **kwargs: Extra completion parameters (temperature, max_tokens...)
+
+        Returns:
+            All content received before the stream ended or was stopped
+        """
+        request_timeout = timeout or self.timeout
+        model = model or self.deployment_name
+        metrics = get_metrics()
+        estimated_tokens = self._estimate_tokens(messages, kwargs)
+        delivered = []
+
+        def forward(delta: str) -> bool:
+            delivered.append(delta)
+            return on_chunk(delta)
+
+        with metrics.span("llm.stream_chat_completion", model=model) as span:
+            try:
+                text = await self._limited(
+                    lambda: asyncio.wait_for(
+                        self._consume_stream(messages, forward, model, request_timeout, **kwargs),
+                        timeout=request_timeout
+                    ),
+                    estimated_tokens,
+                    model,
+                    # A retry would replay chunks on_chunk has already seen
+                    can_retry=lambda: not delivered
+                )
+            except Exception as e:
+                metrics.inc("llm_requests_total", model=model, outcome=type(e).__name__)
+                raise
+            metrics.inc("llm_requests_total", model=model, outcome="ok")
+            prompt_tokens = estimated_tokens - kwargs.get("max_tokens", DEFAULT_COMPLETION_TOKENS)
+            self._record_usage(model, estimated_tokens, prompt_tokens, len(text) // CHARS_PER_TOKEN)
+            metrics.inc("llm_streamed_chars_total", len(text), model=model)
+            span.set("streamed_chars", len(text))
+        return text
+
+    async def _limited(self, call: Callable[[], Awaitable[T]], estimated_tokens: int, model: str,
+                       can_retry: Callable[[], bool] = lambda: True) -> T:
+        """
+        Run call under the shared LLM limiter and the deployment's circuit
+        breaker, retrying transient failures (throttled attempts wait for the
+        limiter's Retry-After pause first).
+        """
+        breaker = get_circuit_breaker(f"llm:{model}")
+
+        async def attempt():
+            breaker.before_call()
+            async with self.limiter.acquire(tokens=estimated_tokens) as permit:
+                try:
+                    result = await call()
+                except APIStatusError as e:
+                    if e.status_code in (429, 503):
+                        permit.throttle(retry_after_seconds(e.response.headers))
+                    if e.status_code >= 500:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+                    raise
+                except (APIConnectionError, asyncio.TimeoutError):
+                    breaker.record_failure()
+                    raise
+                except BaseException:
+                    breaker.release_probe()
+                    raise
+                breaker.record_success()
+                return result
+
+        return await retry_async(attempt, lambda e: can_retry() and self._is_retryable(e), description="LLM request")
+
+    def _record_usage(self, model: str, estimated_tokens: int, prompt_tokens: int, completion_tokens: int):
+        self.limiter.record_tokens(estimated_tokens, prompt_tokens + completion_tokens)
+        metrics = get_metrics()
+        metrics.inc("llm_tokens_total", prompt_tokens, model=model, kind="prompt")
+        metrics.inc("llm_tokens_total", completion_tokens, model=model, kind="completion")
+        for listener in self.usage_listeners:
+            listener(model, prompt_tokens, completion_tokens)
+
+    @staticmethod
+    def _http2_available(requested: bool) -> bool:
+        """httpx needs the h2 package for HTTP/2; without it fall back to HTTP/1.1 keep-alive"""
+        if requested and importlib.util.find_spec("h2") is None:
+            print("AZURE_OPENAI_HTTP2 is set but the h2 package is not installed (pip install httpx[http2]), using HTTP/1.1")
+            return False
+        return requested
+
+    @staticmethod
+    def _is_retryable(e: BaseException) -> bool:
+        if isinstance(e, APIStatusError):
+            return e.status_code in RETRYABLE_STATUS_CODES
+        return isinstance(e, (APIConnectionError, asyncio.TimeoutError))
+
+    @staticmethod
+    def _estimate_tokens(messages: List[Dict[str, str]], kwargs: Dict[str, Any]) -> int:
+        prompt_chars = sum(len(message.get("content") or "") for message in messages)
+        return prompt_chars // CHARS_PER_TOKEN + kwargs.get("max_tokens", DEFAULT_COMPLETION_TOKENS)
+
+    async def _consume_stream(self, messages, on_chunk, model, request_timeout, **kwargs) -> str:
+        stream = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            timeout=request_timeout,
+            stream=True,
+            **kwargs
+        )
+        received = []
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                received.append(delta)
+                if on_chunk(delta):
+                    break
+        finally:
+            await stream.close()
+        return "".join(received)
+
+    async def close(self):
+        """Close the pooled HTTP connections"""
+        await self.client.close()
+
+
+# Singleton instance
+_llm_client = None
+_llm_client_lock = threading.Lock()
+
+
+def get_llm_client() -> LLMClient:
+    """Get or create shared LLM client singleton (thread-safe, built on first use)"""
+    global _llm_client
+    if _llm_client is None:
+        with _llm_client_lock:
+            if _llm_client is None:
+                _llm_client = LLMClient()
+    return _llm_client
@@ -0,0 +1,92 @@
+"""
+Message Sources
+Pluggable inputs feeding the orchestrator's ingestion queue
+"""
+import asyncio
+from collections import deque
+from typing import Dict, Any, List, Optional, Iterable
+
+
+class MessageSource:
+    """
+    Base class for message sources.
+
+    The orchestrator repeatedly calls fetch(); an empty batch means "nothing
+    right now" and the source is polled again after poll_interval seconds,
+    until the source reports it is exhausted.
+    """
+
+    name: str = "source"
+    poll_interval: Optional[float] = None  # None -> AppSettings.message_poll_interval
+
+    async def fetch(self) -> List[Dict[str, Any]]:
+        """Return the next batch of standardized messages (may be empty)"""
+        raise NotImplementedError
+
+    @property
+    def exhausted(self) -> bool:
+        """True when the source will never produce messages again"""
+        return False
+
+    async def ack(self, message: Dict[str, Any], result: Optional[Dict[str, Any]]):
+        """Called once a message fetched from this source has been processed"""
+        pass
+
+    async def defer(self, message: Dict[str, Any], delay: float) -> bool:
+        """
+        Hand back a message the scheduler shed, to be delivered again after delay seconds.
+
+        Returns False if the source cannot redeliver it; the orchestrator
+        then requeues the message in memory itself.
+        """
+        return False
+
+    async def close(self):
+        """Release any resources held by the source"""
+        pass
+
+
+class InMemoryMessageSource(MessageSource):
+    """
+    Message source backed by an in-process deque.
+    Used for manual input and for driving the orchestrator in tests.
+    """
+
+    name = "memory"
+
+    def __init__(self, messages: Optional[Iterable[Dict[str, Any]]] = None, batch_size: int = 100, complete: bool = False):
+        self._pending = deque(messages or [])
+        self._batch_size = batch_size
+        self._complete = complete
+        self._available = asyncio.Event()
+        self.processed: List[Dict[str, Any]] = []
+        if self._pending or complete:
+            self._available.set()
+
+    def put(self, message: Dict[str, Any]):
+        """Add a message to the source"""
+        if self._complete:
+            raise RuntimeError("Cannot put into a completed InMemoryMessageSource")
+        self._pending.append(message)
+        self._available.set()
+
+    def complete(self):
+        """Stop accepting messages; the source is exhausted once drained"""
+        self._complete = True
+        self._available.set()
+
+    async def fetch(self) -> List[Dict[str, Any]]:
+        await self._available.wait()
+        batch = []
+        while self._pending and len(batch) < self._batch_size:
+            batch.append(self._pending.popleft())
+        if not self._pending and not self._complete:
+            self._available.clear()
+        return batch
+
+    @property
+    def exhausted(self) -> bool:
+        return self._complete and not self._pending
+
+    async def ack(self, message: Dict[str, Any], result: Optional[Dict[str, Any]]):
+        self.processed.append({"message": message, "result": result})
@@ -0,0 +1,281 @@
+"""
+Metrics and Tracing
+Low-overhead spans, counters, gauges and histograms with Prometheus text export
+"""
+import asyncio
+import itertools
+import json
+import time
+from bisect import bisect_left
+from collections import deque
+from contextvars import ContextVar
+from typing import Dict, Any, Optional, Tuple, List
+
+from config.settings import settings
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+_span_ids = itertools.count(1)
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in items) + "}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style"""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"buckets": list(self.buckets), "counts": list(self.counts), "sum": self.sum, "count": self.count}
+
+    def merge(self, data: Dict[str, Any]):
+        """Add the observations of another histogram, given as to_dict() output with the same buckets"""
+        if tuple(data["buckets"]) != tuple(self.buckets):
+            raise ValueError("Cannot merge histograms with different buckets")
+        self.counts = [mine + theirs for mine, theirs in zip(self.counts, data["counts"])]
+        self.sum += data["sum"]
+        self.count += data["count"]
+
+
+class Span:
+    """A timed unit of work; nested spans share the trace id of their parent"""
+
+    __slots__ = ("_metrics", "_token", "name", "trace_id", "span_id", "parent_id", "attributes", "start", "end", "status")
+
+    def __init__(self, metrics: "Metrics", name: str, attributes: Dict[str, Any]):
+        self._metrics = metrics
+        self._token = None
+        self.name = name
+        self.attributes = attributes
+        self.span_id = next(_span_ids)
+        parent = _current_span.get()
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else self.span_id
+        self.start = 0.0
+        self.end = 0.0
+        self.status = "ok"
+
+    def __enter__(self) -> "Span":
+        self.start = time.perf_counter()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end = time.perf_counter()
+        if exc_type is not None:
+            self.status = "cancelled" if issubclass(exc_type, asyncio.CancelledError) else "error"
+        _current_span.reset(self._token)
+        self._metrics._finish_span(self)
+        return False
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+    def set(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name, "trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+            "duration_ms": round(self.duration * 1000, 3), "status": self.status, "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    """Returned when metrics are disabled, so instrumented code pays almost nothing"""
+
+    __slots__ = ()
+    duration = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, key: str, value: Any):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Metrics:
+    """
+    Process-wide metrics registry and tracer.
+
+    Every finished span is recorded in the span_duration_seconds histogram
+    (labelled by span name and status) and kept in a bounded list of recent
+    spans. When disabled, span() returns a shared no-op object and the
+    recording methods return immediately.
+    """
+
+    def __init__(self, enabled: bool = True, recent_spans: int = 1000):
+        self.enabled = enabled
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+        self.gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self.histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self.recent_spans: deque = deque(maxlen=recent_spans)
+
+    def span(self, name: str, **attributes: Any):
+        """Context manager timing a unit of work as a child of the current span"""
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, attributes)
+
+    def inc(self, name: str, value: float = 1, **labels: Any):
+        """Increase a counter"""
+        if not self.enabled:
+            return
+        series = self.counters.setdefault(name, {})
+        key = _label_key(labels)
+        series[key] = series.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: Any):
+        """Set a gauge to its current value"""
+        if not self.enabled:
+            return
+        self.gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    def observe(self, name: str, value: float, **labels: Any):
+        """Record a histogram observation"""
+        if not self.enabled:
+            return
+        series = self.histograms.setdefault(name, {})
+        key = _label_key(labels)
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram()
+        histogram.observe(value)
+
+    def _finish_span(self, span: Span):
+        self.observe("span_duration_seconds", span.duration, span=span.name, status=span.status)
+        self.recent_spans.append(span)
+
+    def render_prometheus(self) -> str:
+        """Render every metric in the Prometheus text exposition format"""
+        lines: List[str] = []
+        for name, series in sorted(self.counters.items()):
+            lines.append(f"# TYPE {name} counter")
+            lines.extend(f"{name}{_format_labels(key)} {value}" for key, value in series.items())
+        for name, series in sorted(self.gauges.items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.extend(f"{name}{_format_labels(key)} {value}" for key, value in series.items())
+        for name, series in sorted(self.histograms.items()):
+            lines.append(f"# TYPE {name} histogram")
+            for key, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip(list(histogram.buckets) + ["+Inf"], histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(key, ('le', str(bound)))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum}")
+                lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON-serializable copy of all metrics and the most recent spans"""
+        def encode(series):
+            return [{"labels": dict(key), "value": value} for key, value in series.items()]
+
+        return {
+            "counters": {name: encode(series) for name, series in self.counters.items()},
+            "gauges": {name: encode(series) for name, series in self.gauges.items()},
+            "histograms": {
+                name: [{"labels": dict(key), "value": histogram.to_dict()} for key, histogram in series.items()]
+                for name, series in self.histograms.items()
+            },
+            "recent_spans": [span.to_dict() for span in self.recent_spans],
+        }
+
+    def merge_snapshot(self, snapshot: Dict[str, Any], gauges: bool = True):
+        """
+        Add another registry's snapshot() to this one: counters and histograms
+        are summed, and gauges too unless gauges is False. Spans are not merged.
+        """
+        for name, series in snapshot.get("counters", {}).items():
+            for item in series:
+                key = _label_key(item["labels"])
+                target = self.counters.setdefault(name, {})
+                target[key] = target.get(key, 0) + item["value"]
+        if gauges:
+            for name, series in snapshot.get("gauges", {}).items():
+                for item in series:
+                    key = _label_key(item["labels"])
+                    target = self.gauges.setdefault(name, {})
+                    target[key] = target.get(key, 0) + item["value"]
+        for name, series in snapshot.get("histograms", {}).items():
+            for item in series:
+                key = _label_key(item["labels"])
+                target = self.histograms.setdefault(name, {})
+                if key not in target:
+                    target[key] = Histogram(tuple(item["value"]["buckets"]))
+                target[key].merge(item["value"])
+
+    def dump(self, path: str):
+        """Write the Prometheus text (.prom) or a JSON snapshot (any other extension) to path"""
+        with open(path, "w", encoding="utf-8") as handle:
+            if path.endswith(".prom"):
+                handle.write(self.render_prometheus())
+            else:
+                json.dump(self.snapshot(), handle, indent=2)
+
+    async def serve(self, host: str = "0.0.0.0", port: int = 9100) -> asyncio.AbstractServer:
+        """Serve GET /metrics in the Prometheus text format"""
+        async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            try:
+                request_line = await reader.readline()
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                if request_line.split(b" ")[1:2] == [b"/metrics"]:
+                    body, status = self.render_prometheus().encode(), "200 OK"
+                else:
+                    body, status = b"not found\n", "404 Not Found"
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                    f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+                )
+                await writer.drain()
+            finally:
+                writer.close()
+
+        return await asyncio.start_server(handle, host, port)
+
+
+# Singleton instance
+_metrics = None
+
+
+def get_metrics() -> Metrics:
+    """Get or create metrics registry singleton"""
+    global _metrics
+    if _metrics is None:
+        _metrics = Metrics(enabled=settings.app.enable_metrics)
+    return _metrics
@@ -0,0 +1,310 @@
+"""
+Model Router
+Latency- and cost-aware routing of LLM tasks across Azure OpenAI deployments
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, Any, Awaitable, Callable, Deque, List, Optional, Tuple, TypeVar
+
+from config.settings import settings
+from services.llm_client import get_llm_client
+from services.metrics import get_metrics
+from services.resilience import get_circuit_breaker
+
+T = TypeVar("T")
+
+TASKS = ("classify", "rewrite", "translate")
+MAX_SAMPLES = 1000
+
+
+@dataclass
+class DeploymentSpec:
+    """An Azure OpenAI deployment with its p95 latency SLO (seconds) and price per million prompt/completion tokens"""
+    name: str
+    slo: float
+    prompt_cost: float = 0.0
+    completion_cost: float = 0.0
+
+    def cost(self, prompt_tokens: int, completion_tokens: int) -> float:
+        return (prompt_tokens * self.prompt_cost + completion_tokens * self.completion_cost) / 1_000_000
+
+
+def parse_deployments(value: Optional[str], default_slo: float) -> Dict[str, DeploymentSpec]:
+    """
+    Deployment specs from "gpt-4o-mini:slo=3:prompt=0.15:completion=0.6,gpt-4o:slo=8:prompt=2.5:completion=10".
+
+    Omitted SLOs default to default_slo and omitted prices to 0.
+    """
+    specs = {}
+    for item in (value or "").split(","):
+        if not item.strip():
+            continue
+        name, *options = item.strip().split(":")
+        spec = DeploymentSpec(name.strip(), default_slo)
+        for option in options:
+            key, _, number = option.partition("=")
+            key = key.strip().lower()
+            if key == "slo":
+                spec.slo = float(number)
+            elif key == "prompt":
+                spec.prompt_cost = float(number)
+            elif key == "completion":
+                spec.completion_cost = float(number)
+            else:
+                raise ValueError(f"Unknown option in AZURE_OPENAI_MODEL_DEPLOYMENTS: {key}")
+        specs[spec.name] = spec
+    return specs
+
+
+def parse_routes(value: Optional[str], default_deployment: str) -> Dict[str, List[str]]:
+    """
+    Per-task deployment lists from "classify=gpt-4o-mini>gpt-4o,translate=gpt-4o-mini",
+    cheapest first. Tasks left out use only default_deployment.
+    """
+    routes = {task: [default_deployment] for task in TASKS}
+    for item in (value or "").split(","):
+        if not item.strip():
+            continue
+        task, _, deployments = item.partition("=")
+        task = task.strip().lower()
+        if task not in TASKS:
+            raise ValueError(f"Unknown task in AZURE_OPENAI_MODEL_ROUTES: {task}")
+        names = [name.strip() for name in deployments.split(">") if name.strip()]
+        if not names:
+            raise ValueError(f"No deployments for task {task} in AZURE_OPENAI_MODEL_ROUTES")
+        routes[task] = names
+    return routes
+
+
+class DeploymentStats:
+    """Latency and outcome of the calls to one deployment in the last window seconds, and its token spend"""
+
+    def __init__(self, window: float, clock: Callable[[], float]):
+        self.window = window
+        self._clock = clock
+        self._calls: Deque[Tuple[float, float, bool]] = deque(maxlen=MAX_SAMPLES)  # (finished at, seconds, ok)
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+
+    def record_call(self, seconds: float, ok: bool):
+        self._calls.append((self._clock(), seconds, ok))
+
+    def record_usage(self, prompt_tokens: int, completion_tokens: int, cost: float):
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.cost += cost
+
+    def _trim(self):
+        horizon = self._clock() - self.window
+        while self._calls and self._calls[0][0] < horizon:
+            self._calls.popleft()
+
+    @property
+    def count(self) -> int:
+        self._trim()
+        return len(self._calls)
+
+    def p95(self) -> Optional[float]:
+        """95th percentile call latency in the window, failed calls included; None without samples"""
+        self._trim()
+        if not self._calls:
+            return None
+        latencies = sorted(seconds for _, seconds, _ in self._calls)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+    def error_rate(self) -> float:
+        self._trim()
+        if not self._calls:
+            return 0.0
+        return sum(1 for _, _, ok in self._calls if not ok) / len(self._calls)
+
+
+class ModelRouter:
+    """
+    Routes each agent task to an ordered list of deployments, cheapest first.
+
+    A task is sent to the first healthy deployment of its route. If the call
+    fails it fails over to the next one, and if the result does not pass the
+    caller's validation (malformed or low-confidence output) it escalates to
+    a later, larger deployment. A deployment is unhealthy while its circuit
+    breaker is open, or once it has min_samples calls in the window and
+    either its p95 latency exceeds its SLO or its error rate exceeds
+    max_error_rate; unhealthy deployments are only tried after the healthy
+    ones, and recover once their slow or failed calls age out of the window.
+    """
+
+    def __init__(self, deployments: Dict[str, DeploymentSpec], routes: Dict[str, List[str]],
+                 window: float = 120.0, min_samples: int = 20, max_error_rate: float = 0.25,
+                 default_slo: float = 60.0, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            deployments: Deployment specs by name
+            routes: Deployment names per task, cheapest first
+            window: Seconds of calls the latency and error statistics cover
+            min_samples: Calls in the window before a deployment can be judged unhealthy
+            max_error_rate: Error rate above which a deployment is unhealthy
+            default_slo: SLO of deployments missing from deployments
+            clock: Time source for the statistics window
+        """
+        self.routes = routes
+        self.deployments = dict(deployments)
+        for names in routes.values():
+            for name in names:
+                self.deployments.setdefault(name, DeploymentSpec(name, default_slo))
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self._stats = {name: DeploymentStats(window, clock) for name in self.deployments}
+        self._clock = clock
+
+    def deployments_for(self, task: str) -> List[str]:
+        """Configured deployments of a task, cheapest first"""
+        return self.routes[task]
+
+    def healthy(self, name: str) -> bool:
+        if not get_circuit_breaker(f"llm:{name}").allows_call():
+            return False
+        stats = self._stats[name]
+        if stats.count < self.min_samples:
+            return True
+        return stats.p95() <= self.deployments[name].slo and stats.error_rate() <= self.max_error_rate
+
+    def candidates(self, task: str) -> List[str]:
+        """Deployments to try for a task: the healthy ones in route order, then the unhealthy ones"""
+        route = self.routes[task]
+        health = {name: self.healthy(name) for name in route}
+        for name, healthy in health.items():
+            get_metrics().set_gauge("model_router_degraded", int(not healthy), deployment=name)
+        return [name for name in route if health[name]] + [name for name in route if not health[name]]
+
+    async def run(self, task: str, call: Callable[[str], Awaitable[T]],
+                  validate: Optional[Callable[[T], bool]] = None) -> T:
+        """
+        Run call(deployment) on the task's deployments until one succeeds and its result validates.
+
+        Args:
+            task: "classify", "rewrite" or "translate"
+            call: Makes the LLM call(s) for a deployment name and returns the parsed result
+            validate: Returns False for results that should be escalated to a larger deployment
+
+        Returns:
+            The first valid result; the last result if no larger deployment could do better
+
+        Raises:
+            Exception: The last deployment's error if every deployment failed
+        """
+        metrics = get_metrics()
+        route = self.routes[task]
+        candidates = self.candidates(task)
+        fallback: Optional[Tuple[T]] = None
+        error: Optional[BaseException] = None
+        escalated_from = -1
+        with metrics.span("llm.route", task=task) as span:
+            for name in candidates:
+                if route.index(name) <= escalated_from:
+                    continue
+                if fallback is not None:
+                    print(f"Result for {task} did not validate, escalating to {name}")
+                    metrics.inc("model_router_escalations_total", task=task, deployment=name)
+                started = self._clock()
+                try:
+                    result = await call(name)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self._record(task, name, started, type(e).__name__, ok=False)
+                    print(f"Deployment {name} failed for {task}, failing over: {str(e)}")
+                    metrics.inc("model_router_failovers_total", task=task, deployment=name)
+                    error = e
+                    continue
+                if validate is None or validate(result):
+                    self._record(task, name, started, "ok", ok=True)
+                    span.set("deployment", name)
+                    return result
+                self._record(task, name, started, "invalid", ok=True)
+                fallback = (result,)
+                escalated_from = route.index(name)
+            if fallback is not None:
+                span.set("deployment", "unvalidated")
+                return fallback[0]
+        raise error
+
+    async def chat_completion(self, task: str, messages: List[Dict[str, str]],
+                              validate: Optional[Callable[[str], bool]] = None, **kwargs: Any) -> str:
+        """
+        LLMClient.chat_completion on the task's route.
+
+        Args:
+            task: "classify", "rewrite" or "translate"
+            messages: Chat messages (role/content dictionaries)
+            validate: Returns False for responses that should be escalated
+            **kwargs: Extra completion parameters (temperature, max_tokens...)
+
+        Returns:
+            Content of the first completion choice
+        """
+        client = get_llm_client()
+        return await self.run(task, lambda name: client.chat_completion(messages, model=name, **kwargs), validate)
+
+    def _record(self, task: str, name: str, started: float, outcome: str, ok: bool):
+        seconds = self._clock() - started
+        stats = self._stats[name]
+        stats.record_call(seconds, ok)
+        metrics = get_metrics()
+        metrics.inc("model_router_requests_total", task=task, deployment=name, outcome=outcome)
+        metrics.observe("model_router_latency_seconds", seconds, deployment=name)
+        metrics.set_gauge("model_router_p95_seconds", stats.p95(), deployment=name)
+
+    def record_usage(self, model: str, prompt_tokens: int, completion_tokens: int):
+        """LLMClient usage listener: add the cost of a completion to its deployment"""
+        spec = self.deployments.get(model)
+        if spec is None:
+            return
+        cost = spec.cost(prompt_tokens, completion_tokens)
+        self._stats[model].record_usage(prompt_tokens, completion_tokens, cost)
+        get_metrics().inc("llm_cost_total", cost, model=model)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Window latency/error statistics and total token spend per deployment"""
+        report = {}
+        for name, stats in self._stats.items():
+            p95 = stats.p95()
+            report[name] = {
+                "calls": stats.count,
+                "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+                "slo_ms": round(self.deployments[name].slo * 1000, 1),
+                "error_rate": round(stats.error_rate(), 4),
+                "healthy": self.healthy(name),
+                "prompt_tokens": stats.prompt_tokens,
+                "completion_tokens": stats.completion_tokens,
+                "cost": round(stats.cost, 6),
+            }
+        return report
+
+
+# Singleton instance
+_model_router = None
+_model_router_lock = threading.Lock()
+
+
+def get_model_router() -> ModelRouter:
+    """Get or create the model router singleton from AzureOpenAISettings (thread-safe, built on first use)"""
+    global _model_router
+    if _model_router is None:
+        with _model_router_lock:
+            if _model_router is None:
+                llm = settings.azure_openai
+                router = ModelRouter(
+                    parse_deployments(llm.model_deployments, llm.request_timeout),
+                    parse_routes(llm.model_routes, llm.deployment_name),
+                    window=llm.router_window,
+                    min_samples=llm.router_min_samples,
+                    max_error_rate=llm.router_max_error_rate,
+                    default_slo=llm.request_timeout,
+                )
+                get_llm_client().usage_listeners.append(router.record_usage)
+                _model_router = router
+    return _model_router
@@ -0,0 +1,278 @@
+"""
+Rate Limiting and Adaptive Concurrency
+Token buckets and AIMD concurrency limiters shared by every caller of a backend
+"""
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Callable, AsyncIterator
+
+from config.settings import settings
+from services.metrics import get_metrics
+
+
+class TokenBucket:
+    """
+    Classic token bucket: capacity tokens, refilled continuously at rate
+    tokens per second. Waiters are served in FIFO order, so a large request
+    cannot be starved by a stream of small ones. A rate of 0 disables the
+    bucket.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            rate: Tokens added per second (0 = unlimited)
+            capacity: Maximum burst size, defaults to one second worth of tokens
+            clock: Monotonic time source
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self._clock = clock
+        self._updated = clock()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1):
+        """Wait until amount tokens are available and take them (amounts above capacity are capped)"""
+        if self.rate <= 0:
+            return
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def adjust(self, amount: float):
+        """Take (positive) or return (negative) tokens after the fact, e.g. when actual usage differs from an estimate"""
+        if self.rate <= 0:
+            return
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class Permit:
+    """One in-flight call admitted by an AdaptiveConcurrencyLimiter"""
+
+    __slots__ = ("limiter", "started", "throttled")
+
+    def __init__(self, limiter: "AdaptiveConcurrencyLimiter", started: float):
+        self.limiter = limiter
+        self.started = started
+        self.throttled = False
+
+    def throttle(self, retry_after: Optional[float] = None):
+        """Report that the backend rejected this call as overloaded (HTTP 429/503)"""
+        self.throttled = True
+        self.limiter.on_throttle(self, retry_after)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD concurrency limit for one backend.
+
+    Each call that completes within latency_target raises the limit by
+    1/limit (about +1 per round of calls); a throttled call, or one slower
+    than latency_target, multiplies it by backoff_ratio. Only calls started
+    after the previous decrease can trigger another one, so a burst of
+    failures from the same round backs off once rather than collapsing the
+    limit. A Retry-After hint also pauses new calls until it has elapsed.
+    """
+
+    def __init__(self, name: str, initial_limit: int, min_limit: int = 1, max_limit: int = 100,
+                 latency_target: Optional[float] = None, backoff_ratio: float = 0.5, adaptive: bool = True,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            name: Backend name used in metrics
+            initial_limit: Starting number of concurrent calls
+            min_limit: Lower bound for the limit
+            max_limit: Upper bound for the limit
+            latency_target: Calls slower than this (seconds) count as congestion; None to ignore latency
+            backoff_ratio: Multiplicative decrease factor
+            adaptive: If False the limit stays at initial_limit
+            clock: Monotonic time source
+        """
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(max(min_limit, min(initial_limit, max_limit)))
+        self.latency_target = latency_target
+        self.backoff_ratio = backoff_ratio
+        self.adaptive = adaptive
+        self.in_flight = 0
+        self.throttled = 0
+        self._clock = clock
+        self._paused_until = 0.0
+        self._last_decrease = float("-inf")
+        self._waiters: deque = deque()
+        self._publish()
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[Permit]:
+        """Wait for a free slot; the call's latency is fed back to the limit when the block exits"""
+        await self._enter()
+        permit = Permit(self, self._clock())
+        try:
+            yield permit
+        finally:
+            self.in_flight -= 1
+            if not permit.throttled:
+                self._on_complete(permit)
+            self._wake()
+            self._publish()
+
+    async def _enter(self):
+        loop = asyncio.get_running_loop()
+        woken = False  # a woken waiter keeps its turn instead of queueing behind the others again
+        while True:
+            pause = self._paused_until - self._clock()
+            if pause > 0:
+                try:
+                    await asyncio.sleep(pause)
+                except asyncio.CancelledError:
+                    if woken:
+                        self._wake()
+                    raise
+                # No call may be in flight to wake the queue once the pause is over
+                self._wake()
+                continue
+            if self.in_flight < int(self.limit) and (woken or not self._waiters):
+                self.in_flight += 1
+                self._publish()
+                return
+            waiter = loop.create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                elif waiter.done() and not waiter.cancelled():
+                    self._wake()
+                raise
+            woken = True
+
+    def _wake(self):
+        free = int(self.limit) - self.in_flight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    def _on_complete(self, permit: Permit):
+        latency = self._clock() - permit.started
+        if self.latency_target is not None and latency > self.latency_target:
+            self._decrease(permit)
+        elif self.adaptive:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def on_throttle(self, permit: Permit, retry_after: Optional[float] = None):
+        """Back off after the backend rejected a call, honouring its Retry-After hint"""
+        self.throttled += 1
+        get_metrics().inc("backend_throttled_total", backend=self.name)
+        if retry_after:
+            self._paused_until = max(self._paused_until, self._clock() + retry_after)
+        self._decrease(permit)
+
+    def _decrease(self, permit: Permit):
+        if not self.adaptive or permit.started < self._last_decrease:
+            return
+        self._last_decrease = self._clock()
+        self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+        print(f"Reducing {self.name} concurrency limit to {int(self.limit)}")
+
+    def _publish(self):
+        metrics = get_metrics()
+        metrics.set_gauge("backend_concurrency_limit", int(self.limit), backend=self.name)
+        metrics.set_gauge("backend_in_flight", self.in_flight, backend=self.name)
+
+    def stats(self) -> Dict[str, float]:
+        return {"limit": int(self.limit), "in_flight": self.in_flight, "waiting": len(self._waiters),
+                "throttled": self.throttled}
+
+
+class BackendLimiter:
+    """Request-rate and token-rate buckets in front of an adaptive concurrency limit"""
+
+    def __init__(self, concurrency: AdaptiveConcurrencyLimiter, requests_per_second: float = 0,
+                 tokens_per_minute: float = 0):
+        self.concurrency = concurrency
+        self.requests = TokenBucket(requests_per_second)
+        self.tokens = TokenBucket(tokens_per_minute / 60, capacity=tokens_per_minute) if tokens_per_minute else None
+
+    @asynccontextmanager
+    async def acquire(self, tokens: float = 0) -> AsyncIterator[Permit]:
+        """
+        Admit one call once the rate buckets and the concurrency limit allow it.
+
+        Args:
+            tokens: Estimated tokens the call will consume (LLM only)
+        """
+        await self.requests.acquire()
+        if self.tokens is not None and tokens:
+            await self.tokens.acquire(tokens)
+        async with self.concurrency.acquire() as permit:
+            yield permit
+
+    def record_tokens(self, estimated: float, actual: float):
+        """Correct the token bucket once the real usage of a call is known"""
+        if self.tokens is not None:
+            self.tokens.adjust(actual - estimated)
+
+
+def retry_after_seconds(headers) -> Optional[float]:
+    """Parse Retry-After (seconds) or Azure's retry-after-ms from response headers"""
+    if headers is None:
+        return None
+    for name, scale in (("retry-after-ms", 1000), ("retry-after", 1)):
+        value = headers.get(name)
+        if value is None:
+            continue
+        try:
+            return max(0.0, float(value) / scale)
+        except ValueError:
+            continue
+    return None
+
+
+# Singleton instances, one per backend
+_limiters: Dict[str, BackendLimiter] = {}
+
+
+def get_rate_limiter(backend: str) -> BackendLimiter:
+    """Get or create the shared limiter for a backend ("llm" or "idit")"""
+    if backend not in _limiters:
+        adaptive = settings.app.enable_adaptive_concurrency
+        if backend == "llm":
+            llm_settings = settings.azure_openai
+            _limiters[backend] = BackendLimiter(
+                AdaptiveConcurrencyLimiter(
+                    "llm", llm_settings.initial_concurrency, max_limit=llm_settings.max_connections,
+                    latency_target=llm_settings.latency_target, adaptive=adaptive
+                ),
+                requests_per_second=llm_settings.requests_per_second,
+                tokens_per_minute=llm_settings.tokens_per_minute,
+            )
+        elif backend == "idit":
+            idit_settings = settings.idit_api
+            _limiters[backend] = BackendLimiter(
+                AdaptiveConcurrencyLimiter(
+                    "idit", idit_settings.initial_concurrency, max_limit=idit_settings.pool_size,
+                    latency_target=idit_settings.latency_target, adaptive=adaptive
+                ),
+                requests_per_second=idit_settings.requests_per_second,
+            )
+        else:
+            raise ValueError(f"Unknown backend: {backend}")
+    return _limiters[backend]
@@ -0,0 +1,205 @@
+"""
+Resilience
+Circuit breakers, retries with decorrelated-jitter backoff and hedged requests
+"""
+import asyncio
+import random
+import re
+import time
+from typing import Dict, Optional, Callable, Awaitable, TypeVar
+
+from config.settings import settings
+from services.metrics import get_metrics
+
+T = TypeVar("T")
+
+# Path segments that are ids: anything containing a digit, an escape or an @ ("415089", "POL-123", "a%40b.com")
+_ID_SEGMENT = re.compile(r"/[^/]*[\d%@][^/]*(?=/|$)")
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an endpoint whose circuit breaker is open"""
+
+    def __init__(self, endpoint: str, retry_in: float):
+        super().__init__(f"Circuit open for {endpoint}, retry in {retry_in:.1f}s")
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for one endpoint.
+
+    After failure_threshold consecutive failures the circuit opens and calls
+    fail fast with CircuitOpenError for reset_timeout seconds. Then a single
+    probe call is let through (half-open): success closes the circuit, failure
+    opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._clock = clock
+
+    def before_call(self):
+        """
+        Check whether a call may proceed.
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or half-open with a probe already in flight
+        """
+        if self.state == self.CLOSED:
+            return
+        retry_in = self._opened_at + self.reset_timeout - self._clock()
+        if self.state == self.OPEN and retry_in <= 0:
+            self._set_state(self.HALF_OPEN)
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return
+        raise CircuitOpenError(self.name, max(retry_in, 0.0))
+
+    def allows_call(self) -> bool:
+        """Whether before_call() would let a call through now, without claiming the half-open probe"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            return self._clock() >= self._opened_at + self.reset_timeout
+        return not self._probe_in_flight
+
+    def release_probe(self):
+        """Forget an in-flight half-open probe that ended without an outcome (e.g. it was cancelled)"""
+        self._probe_in_flight = False
+
+    def record_success(self):
+        self.failures = 0
+        self._probe_in_flight = False
+        if self.state != self.CLOSED:
+            print(f"Circuit for {self.name} closed")
+            self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                print(f"Circuit for {self.name} opened after {self.failures} failure(s)")
+            self._opened_at = self._clock()
+            self._set_state(self.OPEN)
+
+    def _set_state(self, state: str):
+        self.state = state
+        get_metrics().set_gauge("circuit_open", int(state != self.CLOSED), endpoint=self.name)
+
+
+def endpoint_key(backend: str, method: str, url: str) -> str:
+    """Breaker key for a request, with ids collapsed so all contacts (policies...) share one breaker"""
+    path = url.split("?", 1)[0].rstrip("/")
+    return f"{backend}:{method} {_ID_SEGMENT.sub('/{id}', path)}"
+
+
+def decorrelated_jitter(previous: float, base: float, cap: float, rng: random.Random = random) -> float:
+    """Next backoff delay: uniform between base and three times the previous delay, capped"""
+    return min(cap, rng.uniform(base, max(base, previous * 3)))
+
+
+async def retry_async(
+    call: Callable[[], Awaitable[T]],
+    is_retryable: Callable[[BaseException], bool],
+    attempts: Optional[int] = None,
+    base_delay: Optional[float] = None,
+    max_delay: Optional[float] = None,
+    description: str = "call",
+) -> T:
+    """
+    Await call(), retrying retryable failures with decorrelated-jitter backoff.
+
+    Args:
+        call: Zero-argument coroutine factory; invoked once per attempt
+        is_retryable: Decides whether an exception is transient
+        attempts: Total attempts, defaults to 1 + max_retries (1 if retries are disabled)
+        base_delay: Minimum backoff in seconds, defaults to settings
+        max_delay: Maximum backoff in seconds, defaults to settings
+        description: Used in log lines and metrics
+
+    Returns:
+        Result of the first successful attempt
+
+    Raises:
+        The last exception if every attempt failed or the failure is not retryable
+    """
+    app = settings.app
+    if attempts is None:
+        attempts = app.max_retries + 1 if app.enable_retry else 1
+    base_delay = app.retry_base_delay if base_delay is None else base_delay
+    max_delay = app.retry_max_delay if max_delay is None else max_delay
+    delay = base_delay
+    for attempt in range(1, attempts + 1):
+        try:
+            return await call()
+        except Exception as e:
+            if attempt == attempts or not is_retryable(e):
+                raise
+            delay = decorrelated_jitter(delay, base_delay, max_delay)
+            get_metrics().inc("retries_total", call=description)
+            print(f"{description} failed ({type(e).__name__}: {e}), retry {attempt}/{attempts - 1} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+
+async def hedged(call: Callable[[], Awaitable[T]], delay: float, max_hedges: int = 1) -> T:
+    """
+    Start call(), and if it has not finished after delay seconds start another
+    copy (up to max_hedges extra); return the first successful result and
+    cancel the rest. Only use for idempotent requests.
+
+    Raises:
+        The last exception if every copy failed
+    """
+    tasks = [asyncio.ensure_future(call())]
+    launched = 1
+    last_error: Optional[BaseException] = None
+    try:
+        while tasks:
+            can_hedge = launched <= max_hedges
+            done, _ = await asyncio.wait(tasks, timeout=delay if can_hedge else None,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                get_metrics().inc("hedged_requests_total")
+                tasks.append(asyncio.ensure_future(call()))
+                launched += 1
+                continue
+            for task in done:
+                tasks.remove(task)
+                if task.exception() is None:
+                    return task.result()
+                last_error = task.exception()
+            if not tasks and can_hedge:
+                # Failed before a hedge was due; retrying is left to the caller
+                break
+        raise last_error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+# Breakers, one per endpoint
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_circuit_breaker(endpoint: str) -> CircuitBreaker:
+    """Get or create the shared circuit breaker for an endpoint key"""
+    breaker = _breakers.get(endpoint)
+    if breaker is None:
+        breaker = _breakers[endpoint] = CircuitBreaker(
+            endpoint,
+            failure_threshold=settings.app.circuit_failure_threshold,
+            reset_timeout=settings.app.circuit_reset_timeout,
+        )
+    return breaker
@@ -0,0 +1,265 @@
+"""
+Priority Scheduler
+Priority classes with earliest-deadline-first ordering, per-class concurrency budgets and load shedding
+"""
+import asyncio
+import heapq
+import itertools
+import re
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Any, Callable, List, Optional
+
+from agents.rule_classifier import RuleClassifier, UPDATE_INTENT_PATTERN, IRRELEVANT_PATTERN
+from config.settings import settings
+from services.metrics import get_metrics
+
+PRIORITY_CLASSES = ("high", "normal", "low")
+SHED_POLICIES = ("none", "defer", "reject")
+
+URGENT_PATTERN = re.compile(r"\b(urgent|asap|immediately|emergency)\b|דחוף|מיידי|בהקדם", re.IGNORECASE)
+BULK_SENDER_PATTERN = re.compile(
+    r"^(no-?reply|do-?not-?reply|newsletter|notifications?|mailer-daemon|marketing)@", re.IGNORECASE
+)
+
+
+def parse_timestamp(value: Any) -> Optional[float]:
+    """Epoch seconds of an ISO-8601 timestamp such as "2025-11-07T12:09:35.827Z" (or of a number); None if invalid"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if not isinstance(value, str) or not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+def message_priority(message: Dict[str, Any]) -> str:
+    """
+    Priority class of a message, decided before any LLM call.
+
+    An explicit "priority" of high/normal/low wins. Otherwise urgent
+    wording or an explicit contact correction is high, bulk senders and
+    obviously unrelated mail are low, and everything else is normal.
+    """
+    explicit = message.get("priority")
+    if isinstance(explicit, str) and explicit.lower() in PRIORITY_CLASSES:
+        return explicit.lower()
+    text = f"{message.get('title') or ''}\n{message.get('content') or ''}"
+    if URGENT_PATTERN.search(text):
+        return "high"
+    if RuleClassifier.extract_contact_ids(text) and UPDATE_INTENT_PATTERN.search(text):
+        return "high"
+    if BULK_SENDER_PATTERN.match((message.get("sender") or "").strip()) or IRRELEVANT_PATTERN.search(text):
+        return "low"
+    return "normal"
+
+
+def message_deadline(message: Dict[str, Any], priority: str, deadlines: Dict[str, float], now: float) -> float:
+    """The message's dueOn, or startHandlingOn (arrival if absent) plus its class's deadline"""
+    due_on = parse_timestamp(message.get("dueOn") or message.get("due_on"))
+    if due_on is not None:
+        return due_on
+    start = parse_timestamp(message.get("startHandlingOn") or message.get("start_handling_on"))
+    return (start if start is not None else now) + deadlines[priority]
+
+
+def parse_class_limits(value: Optional[str], capacity: int) -> Dict[str, int]:
+    """
+    Per-class concurrency limits from "high=5,normal=4,low=1".
+
+    Classes left out default to: high may use every slot, normal all but
+    one fifth (kept for high), low a quarter.
+    """
+    limits = {
+        "high": capacity,
+        "normal": max(1, capacity - max(1, capacity // 5)),
+        "low": max(1, capacity // 4),
+    }
+    for item in (value or "").split(","):
+        if not item.strip():
+            continue
+        name, _, limit = item.partition("=")
+        name = name.strip().lower()
+        if name not in PRIORITY_CLASSES:
+            raise ValueError(f"Unknown priority class in SCHEDULER_CLASS_LIMITS: {name}")
+        limits[name] = max(1, min(capacity, int(limit)))
+    return limits
+
+
+@dataclass(order=True)
+class Ticket:
+    """A message's place in the scheduler; shed is "deferred"/"rejected" if it was shed instead of admitted"""
+    deadline: float
+    sequence: int
+    priority: str = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    enqueued: float = field(compare=False)
+    shed: Optional[str] = field(default=None, compare=False)
+    admitted: bool = field(default=False, compare=False)
+
+
+class PriorityScheduler:
+    """
+    Admission control in front of the pipeline.
+
+    At most capacity messages run at once, and at most class_limits[c] of
+    priority class c. A free slot goes to the highest class that has
+    waiters and is under its limit, and within a class to the earliest
+    deadline. When max_waiting messages are already waiting, the scheduler
+    is overloaded: a new low-priority or expired message is shed on
+    arrival, an expired or low-priority waiter is shed to make room for a
+    more important one, and waiters that expire are shed instead of run.
+    Shed messages are deferred (retried later) or rejected, depending on
+    shed_policy; with "none" nothing is shed.
+    """
+
+    def __init__(self, capacity: int, class_limits: Optional[Dict[str, int]] = None,
+                 deadlines: Optional[Dict[str, float]] = None, max_waiting: int = 100,
+                 shed_policy: str = "defer", clock: Callable[[], float] = time.time):
+        """
+        Args:
+            capacity: Messages processed concurrently
+            class_limits: Concurrency limit per priority class
+            deadlines: Seconds after arrival by which a message of each class should start
+            max_waiting: Waiting messages from which the scheduler sheds load
+            shed_policy: "defer", "reject" or "none"
+            clock: Time source
+        """
+        if shed_policy not in SHED_POLICIES:
+            raise ValueError(f"Unknown shed policy: {shed_policy}")
+        self.capacity = capacity
+        self.class_limits = class_limits or parse_class_limits(None, capacity)
+        self.deadlines = deadlines or {"high": 60.0, "normal": 900.0, "low": 3600.0}
+        self.max_waiting = max_waiting
+        self.shed_policy = shed_policy
+        self._clock = clock
+        self._heaps: Dict[str, List[Ticket]] = {priority: [] for priority in PRIORITY_CLASSES}
+        self._waiting: Dict[str, int] = {priority: 0 for priority in PRIORITY_CLASSES}
+        self._running: Dict[str, int] = {priority: 0 for priority in PRIORITY_CLASSES}
+        self._sequence = itertools.count()
+
+    @property
+    def waiting(self) -> int:
+        return sum(self._waiting.values())
+
+    @property
+    def running(self) -> int:
+        return sum(self._running.values())
+
+    def _overloaded(self) -> bool:
+        return self.shed_policy != "none" and self.waiting >= self.max_waiting
+
+    async def acquire(self, message: Dict[str, Any]) -> Ticket:
+        """
+        Wait for a processing slot.
+
+        Args:
+            message: Standardized message dictionary
+
+        Returns:
+            The ticket; release() it after processing unless ticket.shed is set
+        """
+        now = self._clock()
+        priority = message_priority(message)
+        ticket = Ticket(
+            deadline=message_deadline(message, priority, self.deadlines, now), sequence=next(self._sequence),
+            priority=priority, future=asyncio.get_running_loop().create_future(), enqueued=now,
+        )
+        if self._overloaded():
+            if priority == "low" or ticket.deadline < now:
+                self._shed(ticket, "overload" if ticket.deadline >= now else "expired")
+                return ticket
+            victim = self._victim(now)
+            if victim is not None:
+                self._remove(victim)
+                self._shed(victim, "evicted")
+
+        heapq.heappush(self._heaps[priority], ticket)
+        self._waiting[priority] += 1
+        self._dispatch()
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            if ticket.admitted:
+                self.release(ticket)
+            elif ticket.shed is None:
+                self._remove(ticket)
+            raise
+        finally:
+            self._report()
+        if ticket.admitted:
+            get_metrics().observe("scheduler_wait_seconds", self._clock() - now, priority=priority)
+        return ticket
+
+    def release(self, ticket: Ticket):
+        """Free the slot of an admitted ticket"""
+        if ticket.admitted:
+            ticket.admitted = False
+            self._running[ticket.priority] -= 1
+            self._dispatch()
+            self._report()
+
+    def _dispatch(self):
+        now = self._clock()
+        while self.running < self.capacity:
+            priority = next((priority for priority in PRIORITY_CLASSES
+                             if self._waiting[priority] and self._running[priority] < self.class_limits[priority]), None)
+            if priority is None:
+                return
+            ticket = heapq.heappop(self._heaps[priority])
+            if ticket.future.done():
+                continue  # cancelled or shed while waiting
+            self._waiting[priority] -= 1
+            if ticket.deadline < now and self._overloaded():
+                self._shed(ticket, "expired")
+                continue
+            ticket.admitted = True
+            self._running[priority] += 1
+            ticket.future.set_result(None)
+
+    def _victim(self, now: float) -> Optional[Ticket]:
+        """The waiter to shed for a more important arrival: the most overdue expired one, else the latest-deadline low one"""
+        live = [ticket for priority in PRIORITY_CLASSES for ticket in self._heaps[priority] if not ticket.future.done()]
+        expired = [ticket for ticket in live if ticket.deadline < now]
+        if expired:
+            return min(expired)
+        low = [ticket for ticket in live if ticket.priority == "low"]
+        return max(low) if low else None
+
+    def _remove(self, ticket: Ticket):
+        """Forget a waiting ticket (its heap entry is skipped lazily)"""
+        self._waiting[ticket.priority] -= 1
+
+    def _shed(self, ticket: Ticket, reason: str):
+        ticket.shed = "deferred" if self.shed_policy == "defer" else "rejected"
+        if not ticket.future.done():
+            ticket.future.set_result(None)
+        get_metrics().inc("scheduler_shed_total", priority=ticket.priority, reason=reason, action=ticket.shed)
+
+    def _report(self):
+        metrics = get_metrics()
+        for priority in PRIORITY_CLASSES:
+            metrics.set_gauge("scheduler_waiting", self._waiting[priority], priority=priority)
+            metrics.set_gauge("scheduler_running", self._running[priority], priority=priority)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Waiting and running messages per priority class"""
+        return {"waiting": dict(self._waiting), "running": dict(self._running)}
+
+
+def create_scheduler(capacity: int) -> Optional[PriorityScheduler]:
+    """Build a scheduler for capacity concurrent messages from AppSettings, or None if scheduling is disabled"""
+    app = settings.app
+    if not app.enable_priority_scheduling:
+        return None
+    return PriorityScheduler(
+        capacity,
+        class_limits=parse_class_limits(app.scheduler_class_limits, capacity),
+        deadlines={"high": app.scheduler_deadline_high, "normal": app.scheduler_deadline_normal,
+                   "low": app.scheduler_deadline_low},
+        max_waiting=app.scheduler_max_waiting,
+        shed_policy=app.scheduler_shed_policy,
+    )
@@ -0,0 +1,89 @@
+"""
+Speculative Execution
+Work started before it is known to be needed, with accounting of the latency it saved or wasted
+"""
+import asyncio
+import time
+from typing import Dict, Any, Awaitable, Callable, Optional
+
+from services.metrics import get_metrics
+
+
+class Speculation:
+    """
+    A coroutine started ahead of the pipeline stage that may need it.
+
+    The stage either confirms it (waits for it, having saved the time it
+    already ran) or discards it (cancels it if still running, wasting the
+    time it ran). Speculative work never fails the message: its errors are
+    swallowed and the stage simply does the work itself.
+    """
+
+    def __init__(self, kind: str, key: str, work: Awaitable[Any], clock: Callable[[], float] = time.perf_counter):
+        """
+        Args:
+            kind: What is speculated, used as metrics label (e.g. "contact_fetch")
+            key: What the work is for (e.g. "contact:415089"), to check whether it is the one needed
+            work: The coroutine to start now
+            clock: Time source
+        """
+        self.kind = kind
+        self.key = key
+        self.outcome: Optional[str] = None
+        self.saved = 0.0
+        self.wasted = 0.0
+        self._clock = clock
+        self._started = clock()
+        self._finished: Optional[float] = None
+        self._task = asyncio.ensure_future(work)
+        self._task.add_done_callback(self._on_done)
+
+    def _on_done(self, task: asyncio.Future):
+        self._finished = self._clock()
+        if not task.cancelled():
+            task.exception()  # Retrieved here so an unused failure is not logged as never retrieved
+
+    async def confirm(self):
+        """
+        The work is needed now: wait for it to finish.
+
+        saved is how long it ran before being needed, i.e. the latency taken
+        off the stage (the whole fetch if it had already finished).
+        """
+        if self.outcome is not None:
+            return
+        needed = self._clock()
+        # wait() neither raises the work's error nor cancels the work if the caller is cancelled
+        await asyncio.wait({self._task})
+        if self._task.cancelled() or self._task.exception() is not None:
+            error = "cancelled" if self._task.cancelled() else str(self._task.exception())
+            print(f"Speculative {self.kind} for {self.key} failed: {error}")
+            self._record("failed", wasted=self._finished - self._started)
+        else:
+            self._record("hit", saved=min(self._finished, needed) - self._started)
+
+    def discard(self):
+        """The work is not needed (or the message ended): cancel it if it is still running"""
+        if self.outcome is not None:
+            return
+        if self._task.done():
+            # The done callback may not have run yet
+            finished = self._finished if self._finished is not None else self._clock()
+            self._record("miss", wasted=finished - self._started)
+        else:
+            self._task.cancel()
+            self._record("cancelled", wasted=self._clock() - self._started)
+
+    def _record(self, outcome: str, saved: float = 0.0, wasted: float = 0.0):
+        self.outcome, self.saved, self.wasted = outcome, max(0.0, saved), max(0.0, wasted)
+        metrics = get_metrics()
+        metrics.inc("speculation_total", kind=self.kind, outcome=outcome)
+        if self.saved:
+            metrics.observe("speculation_saved_seconds", self.saved, kind=self.kind)
+        if self.wasted:
+            metrics.observe("speculation_wasted_seconds", self.wasted, kind=self.kind)
+
+    def report(self) -> Dict[str, Any]:
+        """Outcome and saved/wasted seconds"""
+        return {"kind": self.kind, "key": self.key, "outcome": self.outcome,
+                "saved": round(self.saved, 6), "wasted": round(self.wasted, 6)}
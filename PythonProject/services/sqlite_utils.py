@@ -0,0 +1,29 @@
+"""
+SQLite Utilities
+Helpers for the optional SQLite persistence configured via AppSettings.database_url
+"""
+import sqlite3
+from typing import Optional
+
+
+def sqlite_path_from_url(database_url: Optional[str]) -> Optional[str]:
+    """
+    Extract the database path from a sqlite URL.
+
+    Args:
+        database_url: URL such as "sqlite:///data/app.db" or "sqlite:///:memory:"
+
+    Returns:
+        The file path (or ":memory:"), or None if the URL is empty or not a sqlite URL
+    """
+    if not database_url or not database_url.startswith("sqlite:///"):
+        return None
+    return database_url[len("sqlite:///"):] or ":memory:"
+
+
+def connect_sqlite(path: str) -> sqlite3.Connection:
+    """Open a SQLite connection tuned for small concurrent reads/writes"""
+    connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
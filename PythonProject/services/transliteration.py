@@ -0,0 +1,271 @@
+"""
+Transliteration
+Cached Hebrew-to-English transliteration of names, streets and cities
+"""
+import asyncio
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from config.settings import settings
+from services.json_stream import parse_first_json_object
+from services.metrics import get_metrics
+from services.model_router import get_model_router
+from services.sqlite_utils import sqlite_path_from_url, connect_sqlite
+
+_HEBREW_WORD = re.compile("[\u05d0-\u05ea][\u05d0-\u05ea'\"\u05f3\u05f4]*")
+_NIQQUD = re.compile("[\u0591-\u05c7]")
+
+TRANSLITERATION_PROMPT = (
+    "You transliterate Hebrew words from Israeli names, streets and cities into English. "
+    "You get a JSON array of Hebrew words. Answer ONLY with a JSON object mapping every input word to its "
+    "common English spelling (e.g. \"Jerusalem\", \"Bnei\", \"Herzl\"), or a Latin-letter transliteration if it "
+    "has none. Keep Hebrew prefixes attached (\"התניא\" -> \"HaTanya\")."
+)
+
+# Established English spellings of frequent name, street and city words
+KNOWN_SPELLINGS = {
+    "ירושלים": "Jerusalem", "תל": "Tel", "אביב": "Aviv", "יפו": "Yafo", "חיפה": "Haifa", "בני": "Bnei",
+    "ברק": "Brak", "באר": "Be'er", "שבע": "Sheva", "רמת": "Ramat", "גן": "Gan", "פתח": "Petah",
+    "תקווה": "Tikva", "הרצליה": "Herzliya", "נתניה": "Netanya", "אשדוד": "Ashdod", "אשקלון": "Ashkelon",
+    "רחובות": "Rehovot", "חולון": "Holon", "בת": "Bat", "ים": "Yam", "ראשון": "Rishon", "לציון": "LeZion",
+    "כפר": "Kfar", "סבא": "Saba", "רעננה": "Ra'anana", "מודיעין": "Modiin", "טבריה": "Tiberias",
+    "נצרת": "Nazareth", "אילת": "Eilat", "עפולה": "Afula", "רחוב": "Street", "שדרות": "Sderot",
+    "הרצל": "Herzl", "רוטשילד": "Rothschild", "ויצמן": "Weizmann", "ז'בוטינסקי": "Jabotinsky",
+    "בן": "Ben", "גוריון": "Gurion", "יהודה": "Yehuda", "אלנבי": "Allenby", "דיזנגוף": "Dizengoff",
+    "בעל": "Baal", "התניא": "HaTanya", "רבי": "Rabbi", "עקיבא": "Akiva", "כהן": "Cohen", "לוי": "Levi",
+    "משה": "Moshe", "דוד": "David", "יוסף": "Yosef", "אברהם": "Avraham", "יצחק": "Yitzhak", "יעקב": "Yaakov",
+    "שרה": "Sarah", "רחל": "Rachel", "מרים": "Miriam", "מלכה": "Malka", "ישראל": "Israel",
+    "שמואל": "Shmuel", "שמעון": "Shimon", "יהודית": "Yehudit", "אורי": "Uri", "נחום": "Nachum",
+    "ביאליק": "Bialik", "אבן": "Even", "גבירול": "Gabirol", "ארלוזורוב": "Arlozorov", "בלפור": "Balfour",
+}
+
+
+def normalize_term(term: str) -> str:
+    """Cache key of a Hebrew word: NFC without niqqud and without gershayim"""
+    return _NIQQUD.sub("", unicodedata.normalize("NFC", term)).replace("\u05f4", "").replace('"', "")
+
+
+def extract_terms(text: Optional[str], limit: int = 50) -> List[str]:
+    """
+    Distinct Hebrew words of a text, in order of appearance.
+
+    Args:
+        text: Free text, e.g. an update instruction
+        limit: Maximum number of words returned
+
+    Returns:
+        Normalized Hebrew words
+    """
+    terms: List[str] = []
+    for match in _HEBREW_WORD.finditer(_NIQQUD.sub("", text or "")):
+        term = normalize_term(match.group(0))
+        if term and term not in terms:
+            terms.append(term)
+            if len(terms) == limit:
+                break
+    return terms
+
+
+def transliterate_locally(term: str) -> Optional[str]:
+    """
+    Established English spelling of a frequent name, street or city word, or
+    None if the word needs the LLM.
+
+    Unpointed Hebrew does not write most vowels, so spellings guessed
+    letter by letter ("שמואל" -> "Shamol") are wrong too often to be used.
+    """
+    return KNOWN_SPELLINGS.get(normalize_term(term))
+
+
+class Transliterator:
+    """
+    Hebrew-to-English transliteration with a persistent cache.
+
+    Words are looked up in an LRU memory cache, then in SQLite (when
+    AppSettings.database_url is a sqlite URL). Unseen words with a known
+    spelling are transliterated locally (see transliterate_locally); the
+    rest go to the LLM, all of them in a single request, and concurrent
+    calls share in-flight words. Words without a reliable spelling (the LLM
+    did not answer for them, failed or is disabled) are left out of the
+    result rather than guessed. Only LLM answers are persisted; words the
+    LLM skipped are remembered in memory as unanswered, and nothing is
+    cached when it failed, so it is asked again later.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, use_llm: bool = True, max_size: int = 50000):
+        self.use_llm = use_llm
+        self.max_size = max_size
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._db = connect_sqlite(db_path)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS transliterations ("
+                "term TEXT PRIMARY KEY, english TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+        self.hits = 0
+        self.local_terms = 0
+        self.llm_terms = 0
+        self.unresolved_terms = 0
+
+    async def transliterate_text(self, text: Optional[str]) -> Dict[str, str]:
+        """Transliterations of the Hebrew words in text that have a reliable spelling"""
+        return await self.transliterate(extract_terms(text))
+
+    async def transliterate(self, terms: List[str]) -> Dict[str, str]:
+        """
+        Transliterate Hebrew words.
+
+        Args:
+            terms: Hebrew words
+
+        Returns:
+            Mapping of (normalized) words to their English spelling; words
+            without a reliable spelling are left out
+        """
+        results: Dict[str, str] = {}
+        unseen: List[str] = []
+        waiting: Dict[str, asyncio.Future] = {}
+        for term in dict.fromkeys(normalize_term(term) for term in terms):
+            cached = self._lookup(term)
+            if cached is not None:
+                if cached:  # "" marks a word the LLM had no answer for
+                    results[term] = cached
+            elif term in self._inflight:
+                waiting[term] = self._inflight[term]
+            else:
+                unseen.append(term)
+        self.hits += len(results)
+        get_metrics().inc("transliteration_terms_total", len(results), source="cache")
+
+        if unseen:
+            loop = asyncio.get_running_loop()
+            futures = {term: loop.create_future() for term in unseen}
+            self._inflight.update(futures)
+            try:
+                translated = await self._translate(unseen)
+                for term, english in translated.items():
+                    futures[term].set_result(english)
+                    results[term] = english
+            finally:
+                for term, future in futures.items():
+                    if not future.done():
+                        future.cancel()
+                    if self._inflight.get(term) is future:
+                        del self._inflight[term]
+        for term, future in waiting.items():
+            try:
+                english = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                continue  # the call that owned this word was cancelled or got no spelling for it
+            if english:
+                results[term] = english
+        return results
+
+    async def _translate(self, terms: List[str]) -> Dict[str, str]:
+        results: Dict[str, str] = {}
+        unknown: List[str] = []
+        for term in terms:
+            english = transliterate_locally(term)
+            if english is None:
+                unknown.append(term)
+            else:
+                results[term] = english
+                self._store(term, english, persist=False)
+        self.local_terms += len(results)
+        get_metrics().inc("transliteration_terms_total", len(results), source="local")
+        if not unknown:
+            return results
+
+        answered: Dict[str, str] = {}
+        llm_failed = not self.use_llm
+        if self.use_llm:
+            try:
+                answered = await self._translate_with_llm(unknown)
+            except Exception as e:
+                print(f"LLM transliteration failed, leaving {len(unknown)} words untransliterated: {str(e)}")
+                llm_failed = True
+        for term in unknown:
+            if answered.get(term):
+                results[term] = answered[term]
+                self._store(term, answered[term], persist=True)
+            elif not llm_failed:
+                self._store(term, "", persist=False)
+        self.llm_terms += len(answered)
+        self.unresolved_terms += len(unknown) - len(answered)
+        get_metrics().inc("transliteration_terms_total", len(answered), source="llm")
+        get_metrics().inc("transliteration_terms_total", len(unknown) - len(answered), source="unresolved")
+        return results
+
+    async def _translate_with_llm(self, terms: List[str]) -> Dict[str, str]:
+        response = await get_model_router().chat_completion(
+            "translate",
+            validate=lambda text: parse_first_json_object(text) is not None,
+            messages=[
+                {"role": "system", "content": TRANSLITERATION_PROMPT},
+                {"role": "user", "content": json.dumps(terms, ensure_ascii=False)},
+            ],
+            temperature=0,
+            max_tokens=min(15 * len(terms) + 50, 1000),
+        )
+        parsed = parse_first_json_object(response) or {}
+        return {
+            normalize_term(term): english.strip() for term, english in parsed.items()
+            if isinstance(english, str) and english.strip() and normalize_term(term) in terms
+        }
+
+    def _lookup(self, term: str) -> Optional[str]:
+        with self._lock:
+            english = self._memory.get(term)
+            if english is not None:
+                self._memory.move_to_end(term)
+            elif self._db is not None:
+                row = self._db.execute("SELECT english FROM transliterations WHERE term = ?", (term,)).fetchone()
+                if row is not None:
+                    english = row[0]
+                    self._remember(term, english)
+            return english
+
+    def _store(self, term: str, english: str, persist: bool):
+        with self._lock:
+            self._remember(term, english)
+            if persist and self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO transliterations (term, english, created_at) VALUES (?, ?, ?)",
+                    (term, english, time.time())
+                )
+
+    def _remember(self, term: str, english: str):
+        self._memory[term] = english
+        self._memory.move_to_end(term)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        """Cache statistics"""
+        return {"size": len(self._memory), "hits": self.hits, "local_terms": self.local_terms,
+                "llm_terms": self.llm_terms, "unresolved_terms": self.unresolved_terms}
+
+
+# Singleton instance
+_transliterator = None
+
+
+def get_transliterator() -> Transliterator:
+    """Get or create transliterator singleton"""
+    global _transliterator
+    if _transliterator is None:
+        _transliterator = Transliterator(
+            db_path=sqlite_path_from_url(settings.app.database_url),
+            use_llm=settings.app.transliteration_llm_fallback,
+        )
+    return _transliterator
@@ -0,0 +1,390 @@
+"""
+Durable Work Queue
+Crash-safe message queue shared by several orchestrator processes, with
+visibility timeouts, acknowledgements and dead-lettering
+"""
+import asyncio
+import json
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Callable
+
+from config.settings import settings
+from services.message_sources import MessageSource
+from services.sqlite_utils import sqlite_path_from_url, connect_sqlite
+
+
+@dataclass
+class QueuedMessage:
+    """A message leased from a work queue; it must be acked or nacked before the lease expires"""
+    id: str
+    payload: Dict[str, Any]
+    attempts: int
+    lease: str
+
+
+class WorkQueue(ABC):
+    """
+    Base class for durable work queues.
+
+    receive() leases messages for visibility_timeout seconds. A message that
+    is neither acked nor nacked in time (e.g. its consumer crashed) becomes
+    visible to other consumers again. Messages delivered more than
+    max_attempts times are moved to the dead-letter store.
+    """
+
+    def __init__(self, visibility_timeout: float = 300, max_attempts: int = 5):
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+
+    @abstractmethod
+    async def enqueue(self, payload: Dict[str, Any]) -> str:
+        """Add a message and return its id"""
+
+    @abstractmethod
+    async def receive(self, max_messages: int = 10) -> List[QueuedMessage]:
+        """Lease up to max_messages visible messages (may return an empty list)"""
+
+    @abstractmethod
+    async def ack(self, message: QueuedMessage) -> bool:
+        """Delete a processed message; False if the lease had already expired"""
+
+    @abstractmethod
+    async def nack(self, message: QueuedMessage, delay: float = 0, error: Optional[str] = None,
+                   count_attempt: bool = True) -> bool:
+        """
+        Release a message for another attempt after delay seconds, or dead-letter it if out of attempts.
+
+        With count_attempt=False the delivery is not counted towards
+        max_attempts (the message was put off, not tried).
+        """
+
+    @abstractmethod
+    async def dead_letters(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """Most recent dead-lettered messages"""
+
+    async def close(self):
+        """Release the queue's connection"""
+        pass
+
+
+class SQLiteWorkQueue(WorkQueue):
+    """
+    Work queue in a SQLite table. Leasing runs in a BEGIN IMMEDIATE
+    transaction, so any number of processes on the same host can consume the
+    same database file without receiving the same message twice.
+    """
+
+    def __init__(self, path: str, queue_name: str = "messages", visibility_timeout: float = 300,
+                 max_attempts: int = 5, clock: Callable[[], float] = time.time):
+        super().__init__(visibility_timeout, max_attempts)
+        self.queue_name = queue_name
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._db = connect_sqlite(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS work_queue ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, queue TEXT NOT NULL, payload TEXT NOT NULL, "
+            "status TEXT NOT NULL DEFAULT 'ready', attempts INTEGER NOT NULL DEFAULT 0, "
+            "visible_at REAL NOT NULL, lease TEXT, enqueued_at REAL NOT NULL, last_error TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS work_queue_ready ON work_queue (queue, status, visible_at)")
+
+    async def _run(self, function, *args):
+        def locked():
+            with self._lock:
+                return function(*args)
+        return await asyncio.to_thread(locked)
+
+    async def enqueue(self, payload: Dict[str, Any]) -> str:
+        def insert():
+            now = self._clock()
+            cursor = self._db.execute(
+                "INSERT INTO work_queue (queue, payload, visible_at, enqueued_at) VALUES (?, ?, ?, ?)",
+                (self.queue_name, json.dumps(payload, ensure_ascii=False), now, now)
+            )
+            return str(cursor.lastrowid)
+        return await self._run(insert)
+
+    async def receive(self, max_messages: int = 10) -> List[QueuedMessage]:
+        def lease() -> List[QueuedMessage]:
+            now = self._clock()
+            leased = []
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._db.execute(
+                    "SELECT id, payload, attempts FROM work_queue "
+                    "WHERE queue = ? AND status = 'ready' AND visible_at <= ? ORDER BY id LIMIT ?",
+                    (self.queue_name, now, max_messages)
+                ).fetchall()
+                for row_id, payload, attempts in rows:
+                    attempts += 1
+                    if attempts > self.max_attempts:
+                        self._db.execute(
+                            "UPDATE work_queue SET status = 'dead', lease = NULL, "
+                            "last_error = COALESCE(last_error, 'visibility timeout expired') WHERE id = ?",
+                            (row_id,)
+                        )
+                        continue
+                    token = uuid.uuid4().hex
+                    self._db.execute(
+                        "UPDATE work_queue SET attempts = ?, visible_at = ?, lease = ? WHERE id = ?",
+                        (attempts, now + self.visibility_timeout, token, row_id)
+                    )
+                    leased.append(QueuedMessage(str(row_id), json.loads(payload), attempts, token))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            return leased
+        return await self._run(lease)
+
+    async def ack(self, message: QueuedMessage) -> bool:
+        def delete():
+            cursor = self._db.execute(
+                "DELETE FROM work_queue WHERE id = ? AND lease = ?", (int(message.id), message.lease)
+            )
+            return cursor.rowcount == 1
+        return await self._run(delete)
+
+    async def nack(self, message: QueuedMessage, delay: float = 0, error: Optional[str] = None,
+                   count_attempt: bool = True) -> bool:
+        def release():
+            dead = count_attempt and message.attempts >= self.max_attempts
+            cursor = self._db.execute(
+                "UPDATE work_queue SET status = ?, visible_at = ?, lease = NULL, last_error = ?, "
+                "attempts = attempts - ? WHERE id = ? AND lease = ?",
+                ("dead" if dead else "ready", self._clock() + delay, error, int(not count_attempt),
+                 int(message.id), message.lease)
+            )
+            return cursor.rowcount == 1
+        return await self._run(release)
+
+    async def dead_letters(self, limit: int = 100) -> List[Dict[str, Any]]:
+        def select():
+            rows = self._db.execute(
+                "SELECT id, payload, attempts, last_error FROM work_queue "
+                "WHERE queue = ? AND status = 'dead' ORDER BY id DESC LIMIT ?",
+                (self.queue_name, limit)
+            ).fetchall()
+            return [{"id": str(row_id), "payload": json.loads(payload), "attempts": attempts, "error": error}
+                    for row_id, payload, attempts, error in rows]
+        return await self._run(select)
+
+    async def stats(self) -> Dict[str, int]:
+        def count():
+            rows = self._db.execute(
+                "SELECT status, lease IS NOT NULL, COUNT(*) FROM work_queue WHERE queue = ? GROUP BY 1, 2",
+                (self.queue_name,)
+            ).fetchall()
+            result = {"ready": 0, "leased": 0, "dead": 0}
+            for status, leased, total in rows:
+                result["leased" if status == "ready" and leased else status] += total
+            return result
+        return await self._run(count)
+
+    async def close(self):
+        await self._run(self._db.close)
+
+
+class RedisStreamWorkQueue(WorkQueue):
+    """
+    Work queue on a Redis stream with one consumer group, so consumers on any
+    number of hosts share the load. Leased messages sit in the group's
+    pending list; entries idle for longer than visibility_timeout are
+    reclaimed with XAUTOCLAIM (Redis >= 6.2), and the pending list's delivery
+    count drives dead-lettering to "<stream>:dead".
+    """
+
+    def __init__(self, client=None, stream: str = "messages", group: str = "orchestrator",
+                 consumer: Optional[str] = None, visibility_timeout: float = 300, max_attempts: int = 5,
+                 block_ms: int = 1000):
+        """
+        Args:
+            client: redis.asyncio client (or compatible stand-in); created from AppSettings if None
+            stream: Stream key
+            group: Consumer group shared by all orchestrators
+            consumer: Name of this consumer, unique per process
+            visibility_timeout: Seconds before an unacknowledged message is redelivered
+            max_attempts: Deliveries before a message is dead-lettered
+            block_ms: How long receive() waits for new messages
+        """
+        super().__init__(visibility_timeout, max_attempts)
+        if client is None:
+            try:
+                import redis.asyncio as redis
+            except ImportError as e:
+                raise ImportError("RedisStreamWorkQueue requires the 'redis' package") from e
+            client = redis.Redis(host=settings.app.redis_host, port=settings.app.redis_port, decode_responses=True)
+        self.client = client
+        self.stream = stream
+        self.dead_stream = f"{stream}:dead"
+        self.group = group
+        self.consumer = consumer or f"consumer-{uuid.uuid4().hex[:12]}"
+        self.block_ms = block_ms
+        self._group_ready = False
+
+    @staticmethod
+    def _text(value) -> str:
+        return value.decode() if isinstance(value, bytes) else value
+
+    async def _ensure_group(self):
+        if self._group_ready:
+            return
+        try:
+            await self.client.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._group_ready = True
+
+    async def enqueue(self, payload: Dict[str, Any]) -> str:
+        message_id = await self.client.xadd(self.stream, {"payload": json.dumps(payload, ensure_ascii=False)})
+        return self._text(message_id)
+
+    async def receive(self, max_messages: int = 10) -> List[QueuedMessage]:
+        await self._ensure_group()
+        idle_ms = int(self.visibility_timeout * 1000)
+        claimed = await self.client.xautoclaim(
+            self.stream, self.group, self.consumer, min_idle_time=idle_ms, start_id="0-0", count=max_messages
+        )
+        entries = [(entry_id, fields, None) for entry_id, fields in claimed[1] if fields]
+        if len(entries) < max_messages:
+            response = await self.client.xreadgroup(
+                self.group, self.consumer, {self.stream: ">"}, count=max_messages - len(entries),
+                block=None if entries else self.block_ms
+            )
+            for _, stream_entries in response or []:
+                entries.extend((entry_id, fields, 1) for entry_id, fields in stream_entries)
+
+        messages = []
+        for entry_id, fields, attempts in entries:
+            entry_id = self._text(entry_id)
+            if attempts is None:
+                attempts = await self._delivery_count(entry_id)
+            payload = json.loads(self._text(fields.get("payload") or fields.get(b"payload")))
+            message = QueuedMessage(entry_id, payload, attempts, entry_id)
+            if attempts > self.max_attempts:
+                await self._dead_letter(message, "visibility timeout expired")
+                continue
+            messages.append(message)
+        return messages
+
+    async def _delivery_count(self, entry_id: str) -> int:
+        pending = await self.client.xpending_range(self.stream, self.group, min=entry_id, max=entry_id, count=1)
+        return pending[0]["times_delivered"] if pending else 1
+
+    async def _dead_letter(self, message: QueuedMessage, error: Optional[str]):
+        await self.client.xadd(self.dead_stream, {
+            "payload": json.dumps(message.payload, ensure_ascii=False),
+            "source_id": message.id,
+            "attempts": message.attempts,
+            "error": error or "",
+        })
+        await self._delete(message)
+
+    async def _delete(self, message: QueuedMessage) -> bool:
+        acked = await self.client.xack(self.stream, self.group, message.id)
+        await self.client.xdel(self.stream, message.id)
+        return acked == 1
+
+    async def ack(self, message: QueuedMessage) -> bool:
+        return await self._delete(message)
+
+    async def nack(self, message: QueuedMessage, delay: float = 0, error: Optional[str] = None,
+                   count_attempt: bool = True) -> bool:
+        if count_attempt and message.attempts >= self.max_attempts:
+            await self._dead_letter(message, error)
+            return True
+        # Streams have no per-entry delay: backdate the entry's idle time so XAUTOCLAIM picks it up after delay
+        idle_ms = max(0, int((self.visibility_timeout - delay) * 1000))
+        claimed = await self.client.xclaim(
+            self.stream, self.group, self.consumer, min_idle_time=0, message_ids=[message.id], idle=idle_ms,
+            retrycount=None if count_attempt else message.attempts - 1, justid=True
+        )
+        return bool(claimed)
+
+    async def dead_letters(self, limit: int = 100) -> List[Dict[str, Any]]:
+        entries = await self.client.xrevrange(self.dead_stream, count=limit)
+        result = []
+        for _, fields in entries:
+            fields = {self._text(key): self._text(value) for key, value in fields.items()}
+            result.append({"id": fields["source_id"], "payload": json.loads(fields["payload"]),
+                           "attempts": int(fields["attempts"]), "error": fields["error"] or None})
+        return result
+
+    async def close(self):
+        close = getattr(self.client, "aclose", None) or self.client.close
+        await close()
+
+
+class WorkQueueMessageSource(MessageSource):
+    """
+    Feeds the orchestrator from a durable work queue. Messages are acked once
+    processed; failed messages are nacked with exponential backoff and
+    eventually dead-lettered by the queue.
+    """
+
+    name = "work_queue"
+
+    def __init__(self, queue: WorkQueue, batch_size: int = 10, poll_interval: float = 1.0,
+                 retry_delay: float = 5.0):
+        self.queue = queue
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self._leases: Dict[int, QueuedMessage] = {}
+
+    async def fetch(self) -> List[Dict[str, Any]]:
+        batch = []
+        for leased in await self.queue.receive(self.batch_size):
+            self._leases[id(leased.payload)] = leased
+            batch.append(leased.payload)
+        return batch
+
+    async def ack(self, message: Dict[str, Any], result: Optional[Dict[str, Any]]):
+        leased = self._leases.pop(id(message), None)
+        if leased is None:
+            return
+        if result is not None and result.get("status") == "failed":
+            delay = min(self.retry_delay * 2 ** (leased.attempts - 1), self.queue.visibility_timeout)
+            await self.queue.nack(leased, delay=delay, error="processing failed")
+        elif not await self.queue.ack(leased):
+            print(f"Lease for message {leased.id} expired before it was acknowledged")
+
+    async def defer(self, message: Dict[str, Any], delay: float) -> bool:
+        leased = self._leases.pop(id(message), None)
+        if leased is None:
+            return False
+        # Release the lease now instead of holding it until the visibility timeout
+        await self.queue.nack(leased, delay=delay, error="deferred", count_attempt=False)
+        return True
+
+    async def close(self):
+        await self.queue.close()
+
+
+# Singleton instance
+_work_queue = None
+
+
+def get_work_queue() -> Optional[WorkQueue]:
+    """Get or create the configured work queue (AppSettings.work_queue_backend), or None if not configured"""
+    global _work_queue
+    if _work_queue is None:
+        app = settings.app
+        if app.work_queue_backend == "sqlite":
+            path = sqlite_path_from_url(app.database_url)
+            if path is None:
+                raise ValueError("WORK_QUEUE_BACKEND=sqlite requires a sqlite DATABASE_URL")
+            _work_queue = SQLiteWorkQueue(path, visibility_timeout=app.work_queue_visibility_timeout,
+                                          max_attempts=app.work_queue_max_attempts)
+        elif app.work_queue_backend == "redis":
+            _work_queue = RedisStreamWorkQueue(visibility_timeout=app.work_queue_visibility_timeout,
+                                               max_attempts=app.work_queue_max_attempts)
+        elif app.work_queue_backend:
+            raise ValueError(f"Unknown WORK_QUEUE_BACKEND: {app.work_queue_backend}")
+    return _work_queue
@@ -0,0 +1,285 @@
+"""
+ZIP Code Lookup
+Memory-mapped street-range index for deterministic postal code lookups
+"""
+import csv
+import mmap
+import os
+import re
+import struct
+import unicodedata
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+from config.settings import settings
+from services.metrics import get_metrics
+
+_MAGIC = b"ZIPIDX01"
+_HEADER = struct.Struct("<8sI")
+# key offset, key length, lowest house number, highest house number, parity, ZIP code
+_RECORD = struct.Struct("<IHIIB11s")
+_MAX_HOUSE_NUMBER = 0xFFFFFFFF
+_KEY_SEPARATOR = "\x1f"
+
+ANY, ODD, EVEN = 0, 1, 2
+_PARITIES = {"": ANY, "all": ANY, "both": ANY, "odd": ODD, "even": EVEN, "אי זוגי": ODD, "זוגי": EVEN}
+
+_NIQQUD = re.compile("[\u0591-\u05c7]")
+_APOSTROPHES = re.compile("['\"`\u05f3\u05f4\u2018\u2019]")
+_WORD = re.compile(r"\w+")
+_HOUSE_NUMBER = re.compile(r"\d+")
+_FINAL_LETTERS = str.maketrans("ךםןףץ", "כמנפצ")
+
+# Street type words, dropped so "Herzl St.", "Herzl Street" and "רח' הרצל" share a key
+STREET_TYPE_WORDS = {
+    "st", "str", "street", "rd", "road", "ave", "av", "avenue", "blvd", "boulevard", "ln", "lane",
+    "רחוב", "רח", "שדרות", "שד", "סמטת", "סמ",
+}
+
+# Common short city names mapped to the official names used in postal data
+CITY_ALIASES = {
+    "Tel Aviv": "Tel Aviv-Yafo", "Jaffa": "Tel Aviv-Yafo", "Yafo": "Tel Aviv-Yafo",
+    "תל אביב": "תל אביב-יפו", "יפו": "תל אביב-יפו",
+    "Modiin": "Modiin-Maccabim-Reut", "מודיעין": "מודיעין-מכבים-רעות",
+}
+
+# Contact address fields, in order of preference
+STREET_FIELDS = ("street", "streetName")
+HOUSE_NUMBER_FIELDS = ("houseNr", "houseNumber", "buildingNumber")
+CITY_FIELDS = ("city", "cityName")
+ZIP_FIELDS = ("zipCode", "zip", "postalCode")
+
+
+def normalize_name(text: Optional[str], drop_words: Iterable[str] = ()) -> str:
+    """
+    Normalize a Hebrew or English place name for matching.
+
+    Unicode-normalizes and casefolds, strips niqqud, geresh and quotes,
+    replaces Hebrew final letters with their regular forms, drops
+    drop_words and removes spaces and punctuation, so "Ha-Nasi", "HaNasi"
+    and "ha nasi" compare equal.
+    """
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    text = _APOSTROPHES.sub("", _NIQQUD.sub("", text)).translate(_FINAL_LETTERS)
+    return "".join(word for word in _WORD.findall(text) if word not in drop_words)
+
+
+_CITY_ALIASES = {normalize_name(alias): normalize_name(official) for alias, official in CITY_ALIASES.items()}
+
+
+def make_key(city: Optional[str], street: Optional[str]) -> bytes:
+    """Index key of a (city, street) pair"""
+    city_key = normalize_name(city)
+    key = _CITY_ALIASES.get(city_key, city_key) + _KEY_SEPARATOR + normalize_name(street, STREET_TYPE_WORDS)
+    return key.encode("utf-8")
+
+
+def parse_house_number(value: Any) -> Optional[int]:
+    """Leading number of a house number such as "45", "45a" or "12/3"; None if there is none"""
+    match = _HOUSE_NUMBER.search(str(value)) if value is not None else None
+    return int(match.group(0)) if match else None
+
+
+def _read_rows(dataset_path: str) -> List[Dict[str, Any]]:
+    if dataset_path.endswith(".parquet"):
+        try:
+            import pyarrow.parquet as parquet
+        except ImportError as e:
+            raise ImportError("Reading a Parquet ZIP dataset requires the 'pyarrow' package") from e
+        return parquet.read_table(dataset_path).to_pylist()
+    with open(dataset_path, newline="", encoding="utf-8-sig") as f:
+        return list(csv.DictReader(f))
+
+
+def build_index(dataset_path: str, index_path: str) -> int:
+    """
+    Build a ZIP index file from a street-range dataset.
+
+    The dataset (CSV, or Parquet with pyarrow installed) has the columns
+    city, street, zip_code and optionally house_from, house_to, parity
+    (odd/even/all) and city_en/street_en, English names indexed as aliases
+    of the same range.
+
+    Args:
+        dataset_path: CSV or .parquet file
+        index_path: Output file, replaced atomically
+
+    Returns:
+        Number of index records written
+
+    Raises:
+        ValueError: If a row has an invalid parity or ZIP code
+    """
+    records: List[Tuple[bytes, int, int, int, bytes]] = []
+    for row in _read_rows(dataset_path):
+        zip_code = str(row.get("zip_code") or "").strip().encode("ascii")
+        if not zip_code or len(zip_code) > 11:
+            raise ValueError(f"Invalid ZIP code in row {row!r}")
+        parity = _PARITIES.get(str(row.get("parity") or "").strip().casefold())
+        if parity is None:
+            raise ValueError(f"Invalid parity in row {row!r}")
+        low = parse_house_number(row.get("house_from"))
+        high = parse_house_number(row.get("house_to"))
+        low = low if low is not None else 0
+        high = high if high is not None else _MAX_HOUSE_NUMBER
+        # Every Hebrew/English combination, so mixed-language addresses match too
+        for city in (row.get("city"), row.get("city_en")):
+            for street in (row.get("street"), row.get("street_en")):
+                if city and street:
+                    records.append((make_key(city, street), low, high, parity, zip_code))
+    records = sorted(set(records))
+
+    blob = bytearray()
+    table = bytearray()
+    key_offsets: Dict[bytes, int] = {}
+    for key, low, high, parity, zip_code in records:
+        if key not in key_offsets:
+            key_offsets[key] = len(blob)
+            blob += key
+        table += _RECORD.pack(key_offsets[key], len(key), low, high, parity, zip_code)
+
+    temp_path = f"{index_path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, len(records)))
+        f.write(table)
+        f.write(blob)
+    os.replace(temp_path, index_path)
+    return len(records)
+
+
+class ZipLookup:
+    """
+    Read-only, memory-mapped ZIP index.
+
+    Records are sorted by (normalized city/street key, lowest house number),
+    so a lookup is a binary search for the first record of the street
+    followed by a scan of that street's house number ranges. Nothing is
+    parsed up front: the OS pages the index in on demand and shares it
+    between worker processes.
+    """
+
+    def __init__(self, index_path: str):
+        self.index_path = index_path
+        self._file = open(index_path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC:
+            self.close()
+            raise ValueError(f"{index_path} is not a ZIP index")
+        self._blob_start = _HEADER.size + self.count * _RECORD.size
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+    def _record(self, index: int) -> Tuple[bytes, int, int, int, bytes]:
+        key_offset, key_length, low, high, parity, zip_code = _RECORD.unpack_from(
+            self._mm, _HEADER.size + index * _RECORD.size
+        )
+        start = self._blob_start + key_offset
+        return self._mm[start:start + key_length], low, high, parity, zip_code.rstrip(b"\0")
+
+    def _first_record(self, key: bytes) -> int:
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._record(middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def lookup(self, city: Optional[str], street: Optional[str], house_number: Any = None) -> Optional[str]:
+        """
+        Find the ZIP code of an address.
+
+        Args:
+            city: City name, Hebrew or English
+            street: Street name, Hebrew or English, with or without a street type word
+            house_number: House number; without one a ZIP is only returned if the whole street has one
+
+        Returns:
+            ZIP code, or None if the address is not in the index
+        """
+        key = make_key(city, street)
+        number = parse_house_number(house_number)
+        candidates = set()
+        index = self._first_record(key)
+        while index < self.count:
+            record_key, low, high, parity, zip_code = self._record(index)
+            if record_key != key:
+                break
+            if number is None:
+                candidates.add(zip_code)
+            elif low <= number <= high and (parity == ANY or number % 2 == (1 if parity == ODD else 0)):
+                return zip_code.decode("ascii")
+            index += 1
+        if len(candidates) == 1:
+            return candidates.pop().decode("ascii")
+        return None
+
+    def fill_zip_code(self, address: Dict[str, Any], previous: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        Set the ZIP code of a contact address from its street, house number and city.
+
+        When the address is not in the index but its street, house number or
+        city differ from previous, a ZIP code still equal to the previous one
+        is stale and is cleared (set to None) rather than sent with the new
+        address. A ZIP code the instruction itself changed is kept.
+
+        Args:
+            address: Address dictionary, updated in place
+            previous: The address before the update, if it replaces one
+
+        Returns:
+            True if a ZIP code was found and set
+        """
+        city, street, house_number = self._location(address)
+        zip_code = self.lookup(city, street, house_number)
+        get_metrics().inc("zip_lookups_total", result="hit" if zip_code else "miss")
+        if zip_code is None:
+            if previous is not None and self._location(previous) != (city, street, house_number):
+                self._clear_stale_zip_code(address, previous)
+            return False
+        zip_field = next((name for name in ZIP_FIELDS if name in address), ZIP_FIELDS[0])
+        address[zip_field] = zip_code
+        return True
+
+    @staticmethod
+    def _location(address: Dict[str, Any]) -> Tuple[Optional[Any], Optional[Any], Optional[Any]]:
+        """(city, street, house number) of an address"""
+        def field(names: Tuple[str, ...]) -> Optional[Any]:
+            return next((address[name] for name in names if address.get(name)), None)
+
+        return field(CITY_FIELDS), field(STREET_FIELDS), field(HOUSE_NUMBER_FIELDS)
+
+    @staticmethod
+    def _clear_stale_zip_code(address: Dict[str, Any], previous: Dict[str, Any]):
+        for name in ZIP_FIELDS:
+            if address.get(name) and address[name] == previous.get(name):
+                print(f"No ZIP code found for the new address, clearing the previous ZIP code {address[name]}")
+                get_metrics().inc("zip_codes_cleared_total")
+                address[name] = None
+
+
+# Singleton instance
+_zip_lookup = None
+_zip_lookup_loaded = False
+
+
+def get_zip_lookup() -> Optional[ZipLookup]:
+    """
+    Get the ZIP lookup singleton, or None if no ZIP dataset/index is configured.
+    The index is (re)built from ZIP_DATASET_PATH when it is missing or older than the dataset.
+    """
+    global _zip_lookup, _zip_lookup_loaded
+    if not _zip_lookup_loaded:
+        dataset_path = settings.app.zip_dataset_path
+        index_path = settings.app.zip_index_path or (f"{dataset_path}.idx" if dataset_path else None)
+        if index_path:
+            if dataset_path and (not os.path.exists(index_path)
+                                 or os.path.getmtime(index_path) < os.path.getmtime(dataset_path)):
+                count = build_index(dataset_path, index_path)
+                print(f"Built ZIP index {index_path} with {count} records")
+            _zip_lookup = ZipLookup(index_path)
+        _zip_lookup_loaded = True
+    return _zip_lookup
@@ -0,0 +1,263 @@
+"""
+Multi-process Supervisor
+Runs N orchestrator worker processes and shards messages between them by contact
+"""
+import asyncio
+import itertools
+import multiprocessing
+import os
+import queue
+import zlib
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, Any, List, Optional, Tuple
+
+from config.settings import settings
+from orchestarator import Orchestrator, contact_key
+from services.message_sources import MessageSource
+from services.metrics import Metrics
+
+MAX_DELIVERIES = 3
+
+
+def shard_for(key: str, shards: int) -> int:
+    """Stable shard index for a contact key (identical in every process and across restarts)"""
+    return zlib.crc32(key.encode("utf-8")) % shards
+
+
+class SupervisorMetrics(Metrics):
+    """Supervisor registry whose exports include the latest snapshot of every worker process"""
+
+    def __init__(self, enabled: bool):
+        super().__init__(enabled=enabled)
+        self.worker_snapshots: Dict[Tuple[int, int], Dict[str, Any]] = {}
+        self.live_workers: Dict[int, int] = {}
+
+    def combined(self) -> Metrics:
+        combined = Metrics(enabled=True)
+        combined.merge_snapshot(super().snapshot())
+        for (worker_id, pid), snapshot in self.worker_snapshots.items():
+            # Replaced (crashed) workers keep contributing their counters, but not their stale gauges
+            combined.merge_snapshot(snapshot, gauges=self.live_workers.get(worker_id) == pid)
+        return combined
+
+    def render_prometheus(self) -> str:
+        return self.combined().render_prometheus()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return self.combined().snapshot()
+
+
+class _InboxSource(MessageSource):
+    """Worker-side source reading (token, message) envelopes from the supervisor's inbox queue"""
+
+    name = "supervisor"
+    poll_interval = 0
+
+    def __init__(self, worker_id: int, inbox, outbox, batch_size: int):
+        self.worker_id = worker_id
+        self.inbox = inbox
+        self.outbox = outbox
+        self.batch_size = batch_size
+        self._tokens: Dict[int, int] = {}
+        self._done = False
+
+    def _get_batch(self) -> List[Tuple[int, Dict[str, Any]]]:
+        # Short timeout so a cancelled fetch never leaves a thread blocked on the queue
+        try:
+            batch = [self.inbox.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size and batch[-1] is not None:
+            try:
+                batch.append(self.inbox.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    async def fetch(self) -> List[Dict[str, Any]]:
+        messages = []
+        for envelope in await asyncio.to_thread(self._get_batch):
+            if envelope is None:
+                self._done = True
+                break
+            token, message = envelope
+            self._tokens[id(message)] = token
+            messages.append(message)
+        return messages
+
+    @property
+    def exhausted(self) -> bool:
+        return self._done
+
+    async def ack(self, message: Dict[str, Any], result: Optional[Dict[str, Any]]):
+        token = self._tokens.pop(id(message), None)
+        if token is not None:
+            self.outbox.put(("result", self.worker_id, token, result))
+
+
+def _worker_main(worker_id: int, inbox, outbox, metrics_enabled: bool, metrics_interval: float):
+    """Entry point of a worker process"""
+    # Only the supervisor serves and dumps metrics
+    settings.app.enable_metrics = metrics_enabled
+    settings.app.metrics_port = None
+    settings.app.metrics_dump_path = None
+    asyncio.run(_run_worker(worker_id, inbox, outbox, metrics_interval))
+
+
+async def _run_worker(worker_id: int, inbox, outbox, metrics_interval: float):
+    source = _InboxSource(worker_id, inbox, outbox, settings.app.max_concurrent_tasks)
+    orchestrator = Orchestrator(sources=[source])
+    pid = os.getpid()
+
+    async def report_metrics():
+        while True:
+            await asyncio.sleep(metrics_interval)
+            outbox.put(("metrics", worker_id, pid, orchestrator.metrics.snapshot()))
+
+    reporter = asyncio.create_task(report_metrics()) if orchestrator.metrics.enabled else None
+    try:
+        await orchestrator.start()
+    finally:
+        if reporter is not None:
+            reporter.cancel()
+            outbox.put(("metrics", worker_id, pid, orchestrator.metrics.snapshot()))
+
+
+class Supervisor(Orchestrator):
+    """
+    Orchestrator that fans messages out to worker processes.
+
+    The supervisor runs the message sources and the bounded ingestion queue
+    as usual, but each message is handed to the worker owning its contact
+    shard, so every update to one contact is processed by the same process
+    in arrival order (workers serialize per contact as well). Crashed
+    workers are restarted and their unacknowledged messages are re-sent in
+    order; a message that crashes a worker MAX_DELIVERIES times fails.
+    Worker metrics snapshots are merged into the supervisor's metrics
+    export.
+    """
+
+    def __init__(self, workers: int, sources: Optional[List[MessageSource]] = None, metrics_interval: float = 5.0):
+        super().__init__(sources)
+        self.workers = workers
+        self.metrics_interval = metrics_interval
+        # Dispatch slots: enough to keep every worker's own concurrency busy
+        self.max_concurrent_tasks = workers * settings.app.max_concurrent_tasks
+        self.metrics = SupervisorMetrics(enabled=settings.app.enable_metrics)
+        self._context = multiprocessing.get_context("spawn")
+        self._processes: List[Optional[multiprocessing.Process]] = [None] * workers
+        self._inboxes: List[Any] = [None] * workers
+        self._outbox = None
+        self._pending: List["OrderedDict[int, list]"] = [OrderedDict() for _ in range(workers)]
+        self._tokens = itertools.count(1)
+        self._stopping = False
+        self._background: List[asyncio.Task] = []
+
+    async def start(self):
+        """Start the worker processes, then run ingestion until the sources are exhausted or stop() is called"""
+        print(f"Starting supervisor with {self.workers} worker processes")
+        self._outbox = self._context.Queue()
+        for worker_id in range(self.workers):
+            self._spawn(worker_id)
+        self._background = [asyncio.create_task(self._read_outbox()), asyncio.create_task(self._monitor())]
+        try:
+            await super().start()
+        finally:
+            await self._stop_workers()
+
+    async def _on_drained(self):
+        # Stop the workers before metrics are dumped, so their final snapshots are included
+        await self._stop_workers()
+
+    def _spawn(self, worker_id: int):
+        inbox = self._context.Queue()
+        process = self._context.Process(
+            target=_worker_main, args=(worker_id, inbox, self._outbox, self.metrics.enabled, self.metrics_interval),
+            name=f"orchestrator-worker-{worker_id}", daemon=True
+        )
+        process.start()
+        self._inboxes[worker_id] = inbox
+        self._processes[worker_id] = process
+        self.metrics.live_workers[worker_id] = process.pid
+        for token, entry in self._pending[worker_id].items():
+            entry[2] += 1
+            inbox.put((token, entry[0]))
+
+    async def process_message(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """Route a message to the worker owning its contact shard and wait for the result"""
+        shard = shard_for(contact_key(message), self.workers)
+        token = next(self._tokens)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[shard][token] = [message, future, 1]
+        self._inboxes[shard].put((token, message))
+        try:
+            return await future
+        finally:
+            self._pending[shard].pop(token, None)
+
+    @asynccontextmanager
+    async def _contact_lock(self, key: str):
+        # process_message enqueues synchronously, so shard inboxes already receive each contact's
+        # messages in order; the owning worker serializes them
+        yield
+
+    async def _read_outbox(self):
+        while True:
+            try:
+                item = await asyncio.to_thread(self._outbox.get, True, 0.5)
+            except queue.Empty:
+                continue
+            kind, worker_id = item[0], item[1]
+            if kind == "result":
+                entry = self._pending[worker_id].get(item[2])
+                if entry is not None and not entry[1].done():
+                    entry[1].set_result(item[3])
+            elif kind == "metrics":
+                self.metrics.worker_snapshots[(worker_id, item[2])] = item[3]
+
+    async def _monitor(self):
+        while True:
+            await asyncio.sleep(1)
+            for worker_id, process in enumerate(self._processes):
+                if self._stopping or process is None or process.is_alive():
+                    continue
+                print(f"Worker {worker_id} exited with code {process.exitcode}, restarting")
+                self.metrics.inc("worker_restarts_total", worker=worker_id)
+                for token, entry in list(self._pending[worker_id].items()):
+                    if entry[2] >= MAX_DELIVERIES and not entry[1].done():
+                        print(f"Message {entry[0].get('message_id')} crashed a worker {entry[2]} times, giving up")
+                        entry[1].set_result({"status": "failed", "response": None, "timings": {}})
+                        del self._pending[worker_id][token]
+                self._spawn(worker_id)
+
+    async def _stop_workers(self):
+        if self._stopping:
+            return
+        self._stopping = True
+        for inbox in self._inboxes:
+            if inbox is not None:
+                inbox.put(None)
+        # The outbox reader keeps running while joining: a worker cannot exit until its queued output is read
+        for process in self._processes:
+            if process is None:
+                continue
+            await asyncio.to_thread(process.join, self.shutdown_timeout)
+            if process.is_alive():
+                print(f"Worker {process.name} did not stop in time, terminating")
+                process.terminate()
+        for task in self._background:
+            task.cancel()
+        await asyncio.gather(*self._background, return_exceptions=True)
+        self._drain_outbox()
+        print("All workers stopped")
+
+    def _drain_outbox(self):
+        """Collect the final metrics snapshots the workers sent while shutting down"""
+        while True:
+            try:
+                item = self._outbox.get_nowait()
+            except queue.Empty:
+                return
+            if item[0] == "metrics":
+                self.metrics.worker_snapshots[(item[1], item[2])] = item[3]
@@ -0,0 +1,8 @@
+"""
+Shared test setup: puts the project root on the Python path, like the benchmarks do
+"""
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
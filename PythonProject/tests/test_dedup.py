@@ -0,0 +1,73 @@
+"""
+Tests for the MessageDeduplicator: message_id dedup, opt-in content
+fingerprints and compaction errors reported as metrics
+"""
+import asyncio
+
+import pytest
+
+import services.dedup as dedup_module
+from services.dedup import MemorySeenStore, MessageDeduplicator
+from services.metrics import Metrics
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    metrics = Metrics(enabled=True)
+    monkeypatch.setattr(dedup_module, "get_metrics", lambda: metrics)
+    return metrics
+
+
+def message(message_id, content="Please update my phone to 050-1234567"):
+    return {"message_id": message_id, "channel": "email", "sender": "malka@example.com",
+            "title": "Phone", "content": content}
+
+
+async def process(deduplicator, incoming):
+    """claim() and complete() a message; False if it was dropped as a duplicate"""
+    keys = await deduplicator.claim(incoming)
+    if keys is None:
+        return False
+    await deduplicator.complete(keys, {"status": "completed"})
+    return True
+
+
+def test_redelivered_message_id_is_a_duplicate(metrics):
+    async def scenario():
+        deduplicator = MessageDeduplicator(MemorySeenStore(), capacity=1000)
+        return [await process(deduplicator, message("m1")) for _ in range(2)]
+
+    assert asyncio.run(scenario()) == [True, False]
+
+
+def test_repeated_request_under_a_new_message_id_is_processed_by_default(metrics):
+    async def scenario():
+        deduplicator = MessageDeduplicator(MemorySeenStore(), capacity=1000)
+        return [await process(deduplicator, message(message_id)) for message_id in ("m1", "m2")]
+
+    assert asyncio.run(scenario()) == [True, True]
+
+
+def test_content_fingerprint_drops_resends_when_enabled(metrics):
+    async def scenario():
+        deduplicator = MessageDeduplicator(MemorySeenStore(), capacity=1000, by_content=True)
+        return [await process(deduplicator, message(message_id)) for message_id in ("m1", "m2")]
+
+    assert asyncio.run(scenario()) == [True, False]
+
+
+class FailingCompactionStore(MemorySeenStore):
+    async def compact(self):
+        raise OSError("disk full")
+
+
+def test_compaction_errors_are_counted(metrics, capsys):
+    async def scenario():
+        deduplicator = MessageDeduplicator(FailingCompactionStore(), capacity=1000, compaction_interval=0)
+        await process(deduplicator, message("m1"))
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+
+    assert metrics.counters["dedup_compaction_errors_total"] == {(("error", "OSError"),): 1}
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,125 @@
+"""
+Tests for IMAPMessageSource against the local StubIMAPServer: the UID
+checkpoint (advanced on ack, persisted, reset by a UIDVALIDITY change) and
+IDLE wakeups
+"""
+import asyncio
+
+import pytest
+
+from benchmarks.stub_servers import StubIMAPServer
+from services.imap_source import IMAPCheckpointStore, IMAPMessageSource
+
+
+def raw_email(subject):
+    return (f"From: Malka Blau <malka@example.com>\r\nSubject: {subject}\r\n"
+            f"Message-ID: <{subject}@example.com>\r\n\r\nBody of {subject}\r\n").encode()
+
+
+@pytest.fixture
+def checkpoint_path(tmp_path):
+    return str(tmp_path / "checkpoints.db")
+
+
+def make_source(server, checkpoint_path, **kwargs):
+    return IMAPMessageSource("127.0.0.1", "user", "password", port=server.port, use_ssl=False,
+                             checkpoints=IMAPCheckpointStore(checkpoint_path), initial_sync="all",
+                             timeout=5, **kwargs)
+
+
+def titles(batch):
+    return [message["title"] for message in batch]
+
+
+def test_checkpoint_advances_only_past_acknowledged_messages(checkpoint_path):
+    async def scenario():
+        server = await StubIMAPServer(uidvalidity=7).start()
+        for subject in ("one", "two", "three"):
+            server.append(raw_email(subject))
+        source = make_source(server, checkpoint_path)
+        try:
+            first, second, third = await source.fetch()
+            await source.ack(second, {"status": "completed"})
+            await source.ack(third, {"status": "completed"})
+            assert source.checkpoints.load(source.key) == (7, 0)
+            await source.ack(first, {"status": "failed"})
+            assert source.checkpoints.load(source.key) == (7, 3)
+        finally:
+            await source.close()
+
+        # A restarted source continues after the checkpoint
+        server.append(raw_email("four"))
+        restarted = make_source(server, checkpoint_path)
+        try:
+            assert titles(await restarted.fetch()) == ["four"]
+        finally:
+            await restarted.close()
+            await server.stop()
+    asyncio.run(scenario())
+
+
+def test_unacknowledged_messages_are_fetched_again_after_a_restart(checkpoint_path):
+    async def scenario():
+        server = await StubIMAPServer().start()
+        for subject in ("one", "two"):
+            server.append(raw_email(subject))
+        source = make_source(server, checkpoint_path)
+        try:
+            first, _ = await source.fetch()
+            await source.ack(first, {"status": "completed"})
+        finally:
+            await source.close()
+
+        restarted = make_source(server, checkpoint_path)
+        try:
+            assert titles(await restarted.fetch()) == ["two"]
+        finally:
+            await restarted.close()
+            await server.stop()
+    asyncio.run(scenario())
+
+
+def test_uidvalidity_change_resets_the_checkpoint(checkpoint_path):
+    async def scenario():
+        server = await StubIMAPServer(uidvalidity=1).start()
+        for subject in ("one", "two"):
+            server.append(raw_email(subject))
+        source = make_source(server, checkpoint_path)
+        try:
+            for message in await source.fetch():
+                await source.ack(message, {"status": "completed"})
+        finally:
+            await source.close()
+
+        # The mailbox is recreated: its UIDs 1 and 2 are new messages, not the processed ones
+        server.reset(uidvalidity=2)
+        for subject in ("new one", "new two"):
+            server.append(raw_email(subject))
+        restarted = make_source(server, checkpoint_path)
+        try:
+            batch = await restarted.fetch()
+            assert titles(batch) == ["new one", "new two"]
+            assert [message["imap_uid"] for message in batch] == [1, 2]
+        finally:
+            await restarted.close()
+            await server.stop()
+    asyncio.run(scenario())
+
+
+def test_idle_wakes_up_on_new_mail(checkpoint_path):
+    async def scenario():
+        server = await StubIMAPServer().start()
+        source = make_source(server, checkpoint_path, idle_timeout=60)
+        try:
+            fetch = asyncio.create_task(source.fetch())
+            while not server.requests["IDLE"]:
+                await asyncio.sleep(0.01)
+            server.append(raw_email("while idling"))
+            batch = await asyncio.wait_for(fetch, timeout=5)
+            assert titles(batch) == ["while idling"]
+            assert batch[0]["sender"] == "malka@example.com"
+            assert server.requests["IDLE"] == 1
+        finally:
+            await source.close()
+            await server.stop()
+    asyncio.run(scenario())
@@ -0,0 +1,161 @@
+"""
+Tests for the Orchestrator ingestion loop on an InMemoryMessageSource:
+backpressure from the bounded queue, the worker-pool concurrency limit,
+graceful drain on stop() and deferred messages on shutdown
+"""
+import asyncio
+
+import pytest
+
+from config.settings import settings
+from orchestarator import Orchestrator
+from services.message_sources import InMemoryMessageSource
+
+
+class FakePipelineOrchestrator(Orchestrator):
+    """Orchestrator whose pipeline waits on an event instead of calling the agents"""
+
+    def __init__(self, *args, statuses=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.release = asyncio.Event()
+        self.release.set()
+        self.statuses = list(statuses or [])
+        self.started = []
+        self.active = 0
+        self.max_active = 0
+
+    async def _run_pipeline(self, message, sequence=None):
+        self.started.append(message["message_id"])
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await self.release.wait()
+            await asyncio.sleep(0.001)
+        finally:
+            self.active -= 1
+        status = self.statuses.pop(0) if self.statuses else "completed"
+        return {"status": status, "response": None, "timings": {}}
+
+
+class CountingSource(InMemoryMessageSource):
+    """InMemoryMessageSource counting the messages the orchestrator has pulled"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fetched = 0
+
+    async def fetch(self):
+        batch = await super().fetch()
+        self.fetched += len(batch)
+        return batch
+
+
+def make_messages(count):
+    # A different sender each, so the per-contact lock does not serialize them
+    return [{"message_id": str(number), "title": "hello", "content": "", "sender": f"user{number}@example.com"}
+            for number in range(count)]
+
+
+@pytest.fixture(autouse=True)
+def app_settings(monkeypatch):
+    monkeypatch.setattr(settings.app, "enable_dedup", False)
+    monkeypatch.setattr(settings.app, "enable_priority_scheduling", False)
+    monkeypatch.setattr(settings.app, "enable_update_coalescing", False)
+    monkeypatch.setattr(settings.app, "metrics_port", None)
+    monkeypatch.setattr(settings.app, "metrics_dump_path", None)
+    monkeypatch.setattr(settings.app, "message_poll_interval", 0.01)
+    monkeypatch.setattr(settings.app, "shutdown_timeout", 5)
+
+    def configure(**values):
+        for name, value in values.items():
+            monkeypatch.setattr(settings.app, name, value)
+    return configure
+
+
+async def settle():
+    """Let the producers and workers run until they block"""
+    await asyncio.sleep(0.05)
+
+
+def processed_ids(source):
+    return sorted(entry["message"]["message_id"] for entry in source.processed)
+
+
+def test_workers_never_exceed_max_concurrent_tasks(app_settings):
+    app_settings(max_concurrent_tasks=3, message_queue_size=100)
+
+    async def scenario():
+        source = InMemoryMessageSource(make_messages(12), complete=True)
+        orchestrator = FakePipelineOrchestrator([source])
+        await orchestrator.start()
+        return source, orchestrator
+
+    source, orchestrator = asyncio.run(scenario())
+
+    assert orchestrator.max_active == 3
+    assert processed_ids(source) == sorted(str(number) for number in range(12))
+    assert all(entry["result"]["status"] == "completed" for entry in source.processed)
+
+
+def test_full_queue_stops_the_producer_pulling(app_settings):
+    app_settings(max_concurrent_tasks=1, message_queue_size=2)
+
+    async def scenario():
+        source = CountingSource(make_messages(10), batch_size=1)
+        orchestrator = FakePipelineOrchestrator([source])
+        orchestrator.release.clear()
+        running = asyncio.create_task(orchestrator.start())
+        await settle()
+        # One message in the worker, two queued and one waiting in the blocked producer
+        assert orchestrator.queue.full()
+        assert source.fetched == 4
+        orchestrator.release.set()
+        source.complete()
+        await running
+        return source
+
+    source = asyncio.run(scenario())
+
+    assert source.fetched == 10
+    assert len(source.processed) == 10
+
+
+def test_stop_drains_queued_messages_and_stops_fetching(app_settings):
+    app_settings(max_concurrent_tasks=1, message_queue_size=100)
+
+    async def scenario():
+        source = InMemoryMessageSource(make_messages(5))
+        orchestrator = FakePipelineOrchestrator([source])
+        orchestrator.release.clear()
+        running = asyncio.create_task(orchestrator.start())
+        await settle()
+        assert orchestrator.started == ["0"]
+        orchestrator.stop()
+        await settle()
+        source.put({"message_id": "late", "title": "hello", "content": "", "sender": "late@example.com"})
+        orchestrator.release.set()
+        await running
+        return source
+
+    source = asyncio.run(scenario())
+
+    assert processed_ids(source) == ["0", "1", "2", "3", "4"]
+
+
+def test_deferred_in_memory_message_is_retried_on_shutdown(app_settings):
+    app_settings(max_concurrent_tasks=1, message_queue_size=100, scheduler_defer_delay=60)
+
+    async def scenario():
+        source = InMemoryMessageSource(make_messages(1))
+        orchestrator = FakePipelineOrchestrator([source], statuses=["deferred"])
+        running = asyncio.create_task(orchestrator.start())
+        await settle()
+        assert source.processed == []
+        orchestrator.stop()
+        await running
+        return source, orchestrator
+
+    source, orchestrator = asyncio.run(scenario())
+
+    assert orchestrator.started == ["0", "0"]
+    assert [entry["result"]["status"] for entry in source.processed] == ["completed"]
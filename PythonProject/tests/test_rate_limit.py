@@ -0,0 +1,72 @@
+"""
+Tests for the AdaptiveConcurrencyLimiter: the concurrency limit, AIMD
+backoff and the Retry-After pause
+"""
+import asyncio
+
+from services.rate_limit import AdaptiveConcurrencyLimiter
+
+
+def run_calls(limiter, count, throttle_call=None, retry_after=None):
+    """Run count concurrent calls through the limiter; returns how many finished and the peak concurrency"""
+    finished = []
+    peak = [0]
+
+    async def call(number):
+        async with limiter.acquire() as permit:
+            peak[0] = max(peak[0], limiter.in_flight)
+            await asyncio.sleep(0.01)
+            if number == throttle_call:
+                permit.throttle(retry_after)
+        finished.append(number)
+
+    async def scenario():
+        await asyncio.wait_for(asyncio.gather(*(call(number) for number in range(count))), timeout=5)
+
+    asyncio.run(scenario())
+    return finished, peak[0]
+
+
+def test_calls_never_exceed_the_limit():
+    limiter = AdaptiveConcurrencyLimiter("test", initial_limit=4, adaptive=False)
+
+    finished, peak = run_calls(limiter, 12)
+
+    assert len(finished) == 12
+    assert peak == 4
+
+
+def test_queued_calls_finish_after_a_retry_after_pause():
+    limiter = AdaptiveConcurrencyLimiter("test", initial_limit=4)
+
+    finished, _ = run_calls(limiter, 12, throttle_call=0, retry_after=0.2)
+
+    assert sorted(finished) == list(range(12))
+    assert limiter.throttled == 1
+    assert limiter.stats()["in_flight"] == 0
+    assert limiter.stats()["waiting"] == 0
+
+
+def test_cancelled_call_during_the_pause_passes_its_turn_on():
+    limiter = AdaptiveConcurrencyLimiter("test", initial_limit=1, adaptive=False)
+    finished = []
+
+    async def call(number, hold=0.01):
+        async with limiter.acquire() as permit:
+            await asyncio.sleep(hold)
+            if number == 0:
+                permit.throttle(0.1)
+        finished.append(number)
+
+    async def scenario():
+        first = asyncio.create_task(call(0))
+        second = asyncio.create_task(call(1))
+        third = asyncio.create_task(call(2))
+        await first
+        await asyncio.sleep(0.02)
+        second.cancel()
+        await asyncio.wait_for(third, timeout=5)
+
+    asyncio.run(scenario())
+
+    assert finished == [0, 2]
@@ -0,0 +1,58 @@
+"""
+Tests for the RuleClassifier: only plain update requests with one explicit
+contact id skip the LLM
+"""
+import pytest
+
+from agents.rule_classifier import RuleClassifier, RuleVerdict
+
+
+def classify(subject, body):
+    return RuleClassifier().classify({"from": "malka.blau@example.com", "subject": subject, "body": body})
+
+
+@pytest.mark.parametrize("subject, body", [
+    ("Address update", "Please update the address of contact #415089 to 3 Herzl st, Haifa."),
+    ("Contact ID: 415089", "Hi, I moved to 5 Herzl street, Haifa. Thanks"),
+    ("Phone", "Update the phone of contact #415089 to 050-1234567"),
+    ("Contact ID: 415089", "I would like to change my email to new@example.com"),
+    ("Contact ID: 415089", "נא לעדכן כתובת: הרצל 3, חיפה"),
+])
+def test_update_requests_are_classified(subject, body):
+    result = classify(subject, body)
+
+    assert result.verdict == RuleVerdict.CLASSIFIED
+    assert result.rule == "explicit_contact_update"
+    assert result.task["contactExtId"] == "415089"
+
+
+@pytest.mark.parametrize("subject, body, rule", [
+    ("Your request", "Your address change request for contact #415089 was completed.", "confirmation"),
+    ("Done", "The phone change of contact #415089 has been processed.", "confirmation"),
+    ("Question", "How do I change the address of contact #415089?", "question"),
+    ("Contact ID: 415089", "Can you update my address?", "question"),
+    ("Re: update address contact #415089", "Thanks, please update the address as discussed.", "reply_or_forward"),
+    ("Fwd: new phone", "Please update contact #415089 phone to 050-1234567", "reply_or_forward"),
+    ("Meeting tomorrow", "Please note contact #415089 has a new email address for the invitation.", "mixed_topic"),
+    ("Phone", "Please do not update the phone of contact #415089.", "negated_request"),
+    ("Contact ID: 415089", "New phone: 050-1234567", "no_request_phrasing"),
+])
+def test_unclear_update_mail_is_left_to_the_llm(subject, body, rule):
+    result = classify(subject, body)
+
+    assert result.verdict == RuleVerdict.UNCERTAIN
+    assert result.rule == rule
+    assert result.task is None
+
+
+def test_unrelated_mail_is_rejected():
+    result = classify("Webinar invitation", "Join our product launch webinar next week")
+
+    assert result.verdict == RuleVerdict.NOT_CLASSIFIED
+
+
+def test_remarks_keep_the_request_sentences():
+    result = classify("Address update", "Hello. Please update the address of contact #415089 to 3 Herzl st, Haifa.")
+
+    assert result.task["contactExtId"] == "415089"
+    assert result.task["remarks"] == "Address update Please update the address of contact #415089 to 3 Herzl st, Haifa."
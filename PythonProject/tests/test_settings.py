@@ -0,0 +1,76 @@
+"""
+Tests for the settings sections: each reads its own prefixed environment
+variables and ignores generic ones such as TIMEOUT or API_KEY
+"""
+import pytest
+
+from config.settings_models import AppSettings, AzureOpenAISettings, EmailSettings
+
+
+@pytest.fixture(autouse=True)
+def no_env_file(monkeypatch, tmp_path):
+    # Keep a developer's .env out of the tests
+    monkeypatch.chdir(tmp_path)
+
+
+def test_azure_openai_settings_read_prefixed_variables(monkeypatch):
+    monkeypatch.setenv("AZURE_OPENAI_API_KEY", "sk-abc")
+    monkeypatch.setenv("AZURE_OPENAI_HTTP2", "1")
+    monkeypatch.setenv("AZURE_OPENAI_REQUEST_TIMEOUT", "5")
+    monkeypatch.setenv("AZURE_OPENAI_DEPLOYMENT_NAME", "gpt-4o-mini")
+
+    azure = AzureOpenAISettings()
+
+    assert azure.api_key == "sk-abc"
+    assert azure.http2 is True
+    assert azure.request_timeout == 5.0
+    assert azure.deployment_name == "gpt-4o-mini"
+
+
+def test_azure_openai_settings_ignore_unprefixed_variables(monkeypatch):
+    monkeypatch.setenv("API_KEY", "sk-other")
+    monkeypatch.setenv("TIMEOUT", "7")
+    monkeypatch.setenv("REQUEST_TIMEOUT", "7")
+
+    azure = AzureOpenAISettings()
+
+    assert azure.api_key == ""
+    assert azure.request_timeout == 60.0
+
+
+def test_email_settings_read_prefixed_variables(monkeypatch):
+    monkeypatch.setenv("EMAIL_IMAP_SERVER", "imap.example.com")
+    monkeypatch.setenv("EMAIL_USERNAME", "claims@example.com")
+    monkeypatch.setenv("EMAIL_PASSWORD", "secret")
+    monkeypatch.setenv("EMAIL_TIMEOUT", "12")
+
+    email = EmailSettings()
+
+    assert email.imap_server == "imap.example.com"
+    assert email.username == "claims@example.com"
+    assert email.password == "secret"
+    assert email.timeout == 12.0
+
+
+def test_email_settings_ignore_the_os_user_and_generic_variables(monkeypatch):
+    monkeypatch.setenv("USERNAME", "winuser")
+    monkeypatch.setenv("PASSWORD", "hunter2")
+    monkeypatch.setenv("TIMEOUT", "7")
+    monkeypatch.setenv("IMAP_SERVER", "x")
+
+    email = EmailSettings()
+
+    assert email.imap_server is None
+    assert email.username is None
+    assert email.password is None
+    assert email.timeout == 30.0
+
+
+def test_app_settings_read_their_documented_names(monkeypatch):
+    monkeypatch.setenv("MAX_CONCURRENT_TASKS", "9")
+    monkeypatch.setenv("ENABLE_ENTITY_UPDATES", "true")
+
+    app = AppSettings()
+
+    assert app.max_concurrent_tasks == 9
+    assert app.enable_entity_updates is True
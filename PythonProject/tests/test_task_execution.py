@@ -0,0 +1,205 @@
+"""
+Tests for TaskExecution.apply_entity_instructions: patch validation against
+the updatable fields, the ENABLE_ENTITY_UPDATES switch, the updateVersion
+conflict retry and ZIP codes from the local index
+"""
+import asyncio
+import copy
+import json
+
+import httpx
+import pytest
+
+import agents.task_execution_agent as task_execution_module
+from agents.task_execution_agent import MAX_CONFLICT_RETRIES, TaskExecution
+from config.settings import settings
+from services.entity_cache import EntityCache
+from services.json_patch import JsonPatchError
+from services.zip_lookup import ZipLookup, build_index
+
+
+class FakeIDIT:
+    """In-memory IDIT contact endpoint that rejects PUTs carrying a stale updateVersion with 409"""
+
+    def __init__(self, contact):
+        self.contact = contact
+        self.gets = 0
+        self.puts = []
+        self.concurrent_writes = 0
+
+    async def get_api_async(self, url):
+        self.gets += 1
+        return copy.deepcopy(self.contact)
+
+    async def put_api_async(self, url, body):
+        self.puts.append(copy.deepcopy(body))
+        if self.concurrent_writes:
+            # Someone else updated the contact just before this PUT
+            self.concurrent_writes -= 1
+            self.contact["updateVersion"] += 1
+        if body["updateVersion"] != self.contact["updateVersion"]:
+            request = httpx.Request("PUT", url)
+            response = httpx.Response(409, json={"updateVersion": self.contact["updateVersion"]}, request=request)
+            raise httpx.HTTPStatusError("409 Conflict", request=request, response=response)
+        self.contact = {**body, "updateVersion": body["updateVersion"] + 1}
+        return copy.deepcopy(self.contact)
+
+
+class FakeAgent:
+    """SimpleAIAgent returning canned JSON Patch responses"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    async def generate_response(self, prompt, context=None, **kwargs):
+        self.calls += 1
+        return self.responses.pop(0)
+
+
+@pytest.fixture
+def idit(monkeypatch):
+    fake = FakeIDIT({
+        "id": 1, "contactExtId": "415089", "updateVersion": 3,
+        "firstName": "Malka", "email": "old@example.com",
+    })
+    cache = EntityCache()
+    monkeypatch.setattr(task_execution_module, "get_api_utils", lambda: fake)
+    monkeypatch.setattr(task_execution_module, "get_entity_cache", lambda: cache)
+    monkeypatch.setattr(task_execution_module, "get_zip_lookup", lambda: None)
+    monkeypatch.setattr(settings.app, "enable_transliteration", False)
+    monkeypatch.setattr(settings.app, "enable_update_coalescing", False)
+    monkeypatch.setattr(settings.app, "enable_entity_updates", True)
+    return fake
+
+
+def use_agent(monkeypatch, agent):
+    monkeypatch.setattr(task_execution_module, "get_simple_ai_agent", lambda: agent)
+
+
+def apply(instruction="Please change my email to new@example.com"):
+    return asyncio.run(TaskExecution().apply_entity_instructions("contact", "415089", [instruction]))
+
+
+EMAIL_PATCH = json.dumps([{"op": "replace", "path": "/email", "value": "new@example.com"}])
+
+
+def test_patch_is_put_with_the_fetched_update_version(idit, monkeypatch):
+    use_agent(monkeypatch, FakeAgent(EMAIL_PATCH))
+
+    result = json.loads(apply())
+
+    assert result["email"] == "new@example.com"
+    assert [put["updateVersion"] for put in idit.puts] == [3]
+    assert idit.contact["email"] == "new@example.com"
+
+
+def test_updates_disabled_returns_patched_entity_without_put(idit, monkeypatch):
+    monkeypatch.setattr(settings.app, "enable_entity_updates", False)
+    use_agent(monkeypatch, FakeAgent(EMAIL_PATCH))
+
+    result = json.loads(apply())
+
+    assert result["email"] == "new@example.com"
+    assert idit.puts == []
+    assert idit.contact["email"] == "old@example.com"
+
+
+@pytest.mark.parametrize("path", ["/updateVersion", "/id", "/contactExtId", "/notAField"])
+def test_patch_outside_updatable_fields_is_rejected(idit, monkeypatch, path):
+    use_agent(monkeypatch, FakeAgent(json.dumps([{"op": "replace", "path": path, "value": 99}])))
+
+    with pytest.raises(JsonPatchError):
+        apply()
+    assert idit.puts == []
+
+
+def test_conflict_refetches_and_reapplies_the_same_patch(idit, monkeypatch):
+    agent = FakeAgent(EMAIL_PATCH)
+    use_agent(monkeypatch, agent)
+    idit.concurrent_writes = 1
+
+    result = json.loads(apply())
+
+    assert agent.calls == 1
+    assert [put["updateVersion"] for put in idit.puts] == [3, 4]
+    assert idit.gets == 2
+    assert result["email"] == idit.contact["email"] == "new@example.com"
+
+
+def test_conflict_asks_again_when_the_patch_no_longer_applies(idit, monkeypatch):
+    remove_phone = json.dumps([{"op": "remove", "path": "/telephone"}])
+    agent = FakeAgent(remove_phone, EMAIL_PATCH)
+    use_agent(monkeypatch, agent)
+    idit.contact["telephone"] = "03-1234567"
+    original_put = idit.put_api_async
+
+    async def put_and_drop_phone(url, body):
+        # The concurrent write removes the field the first patch removes
+        del idit.contact["telephone"]
+        idit.put_api_async = original_put
+        idit.contact["updateVersion"] += 1
+        return await original_put(url, body)
+
+    idit.put_api_async = put_and_drop_phone
+
+    result = json.loads(apply())
+
+    assert agent.calls == 2
+    assert result["email"] == "new@example.com"
+    assert [put["updateVersion"] for put in idit.puts] == [3, 4]
+
+
+def test_conflict_gives_up_after_max_retries(idit, monkeypatch):
+    use_agent(monkeypatch, FakeAgent(EMAIL_PATCH))
+    idit.concurrent_writes = MAX_CONFLICT_RETRIES + 1
+
+    with pytest.raises(httpx.HTTPStatusError) as error:
+        apply()
+    assert error.value.response.status_code == 409
+    assert len(idit.puts) == MAX_CONFLICT_RETRIES + 1
+
+
+def test_successful_put_refreshes_the_cached_entity(idit, monkeypatch):
+    use_agent(monkeypatch, FakeAgent(EMAIL_PATCH))
+    apply()
+
+    cached = asyncio.run(TaskExecution().fetch_entity("contact", "415089"))
+
+    assert cached["updateVersion"] == 4
+    assert cached["email"] == "new@example.com"
+    assert idit.gets == 1
+
+
+@pytest.fixture
+def zip_lookup(tmp_path, monkeypatch):
+    dataset = tmp_path / "zip_codes.csv"
+    dataset.write_text("city,street,zip_code\nHaifa,Herzl,3300000\n", encoding="utf-8")
+    build_index(str(dataset), str(tmp_path / "zip_codes.idx"))
+    lookup = ZipLookup(str(tmp_path / "zip_codes.idx"))
+    monkeypatch.setattr(task_execution_module, "get_zip_lookup", lambda: lookup)
+    return lookup
+
+
+def address_patch(city, street):
+    return json.dumps([{"op": "replace", "path": "/address/city", "value": city},
+                       {"op": "replace", "path": "/address/street", "value": street}])
+
+
+def test_changed_address_gets_the_indexed_zip_code(idit, zip_lookup, monkeypatch):
+    idit.contact["address"] = {"city": "Tel Aviv", "street": "Dizengoff", "houseNr": "5", "zipCode": "6400000"}
+    use_agent(monkeypatch, FakeAgent(address_patch("Haifa", "Herzl")))
+
+    result = json.loads(apply("I moved to 5 Herzl street, Haifa"))
+
+    assert result["address"]["zipCode"] == "3300000"
+
+
+def test_changed_address_missing_from_the_index_drops_the_stale_zip_code(idit, zip_lookup, monkeypatch):
+    idit.contact["address"] = {"city": "Tel Aviv", "street": "Dizengoff", "houseNr": "5", "zipCode": "6400000"}
+    use_agent(monkeypatch, FakeAgent(address_patch("Bnei Brak", "Baal Hatanya")))
+
+    result = json.loads(apply("I moved to 5 Baal Hatanya street, Bnei Brak"))
+
+    assert result["address"]["zipCode"] is None
+    assert idit.puts[0]["address"]["zipCode"] is None
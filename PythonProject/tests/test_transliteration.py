@@ -0,0 +1,98 @@
+"""
+Tests for the Transliterator: known spellings locally, one batched LLM
+request for every other word, no guessed spellings, and the LRU memory cache
+"""
+import asyncio
+
+import pytest
+
+from services.transliteration import Transliterator, transliterate_locally
+
+LLM_SPELLINGS = {"ברויאר": "Breuer", "פרלמן": "Perlman", "עברתי": "Avarti", "לרחוב": "LeRehov"}
+
+
+class RecordingTransliterator(Transliterator):
+    """Transliterator whose LLM step records its batches and answers from a fixed table"""
+
+    def __init__(self, answers=None, fail=False, **kwargs):
+        super().__init__(**kwargs)
+        self.answers = LLM_SPELLINGS if answers is None else answers
+        self.fail = fail
+        self.batches = []
+
+    async def _translate_with_llm(self, terms):
+        self.batches.append(list(terms))
+        if self.fail:
+            raise RuntimeError("LLM unavailable")
+        return {term: self.answers[term] for term in terms if term in self.answers}
+
+
+@pytest.mark.parametrize("hebrew, english", [
+    ("הרצל", "Herzl"), ("מלכה", "Malka"), ("שמואל", "Shmuel"), ("שמעון", "Shimon"), ("יהודית", "Yehudit"),
+    ("אורי", "Uri"), ("נחום", "Nachum"), ("ביאליק", "Bialik"), ("ז'בוטינסקי", "Jabotinsky"),
+])
+def test_known_names_have_their_established_spelling(hebrew, english):
+    assert transliterate_locally(hebrew) == english
+
+
+@pytest.mark.parametrize("hebrew", ["ברויאר", "פרלמן", "דירה", "עברתי"])
+def test_other_words_are_not_guessed_locally(hebrew):
+    assert transliterate_locally(hebrew) is None
+
+
+def test_words_without_a_known_spelling_go_to_the_llm_in_one_batch():
+    transliterator = RecordingTransliterator()
+
+    result = asyncio.run(transliterator.transliterate_text("עברתי לרחוב הרצל, מלכה ברויאר"))
+
+    assert transliterator.batches == [["עברתי", "לרחוב", "ברויאר"]]
+    assert result == {"עברתי": "Avarti", "לרחוב": "LeRehov", "הרצל": "Herzl", "מלכה": "Malka",
+                      "ברויאר": "Breuer"}
+
+
+def test_local_only_text_makes_no_llm_call():
+    transliterator = RecordingTransliterator()
+
+    result = asyncio.run(transliterator.transliterate(["תל", "אביב", "דיזנגוף"]))
+
+    assert transliterator.batches == []
+    assert result == {"תל": "Tel", "אביב": "Aviv", "דיזנגוף": "Dizengoff"}
+
+
+def test_llm_failure_leaves_words_out_without_caching():
+    transliterator = RecordingTransliterator(fail=True)
+
+    first = asyncio.run(transliterator.transliterate(["מלכה", "ברויאר"]))
+    asyncio.run(transliterator.transliterate(["ברויאר"]))
+
+    assert first == {"מלכה": "Malka"}
+    assert transliterator.batches == [["ברויאר"], ["ברויאר"]]
+
+
+def test_words_the_llm_skips_are_left_out_and_not_asked_again():
+    transliterator = RecordingTransliterator(answers={"פרלמן": "Perlman"})
+
+    first = asyncio.run(transliterator.transliterate(["פרלמן", "ברויאר"]))
+    second = asyncio.run(transliterator.transliterate(["ברויאר"]))
+
+    assert first == {"פרלמן": "Perlman"}
+    assert second == {}
+    assert transliterator.batches == [["פרלמן", "ברויאר"]]
+
+
+def test_without_the_llm_only_known_spellings_are_returned():
+    transliterator = RecordingTransliterator(use_llm=False)
+
+    result = asyncio.run(transliterator.transliterate(["הרצל", "ברויאר"]))
+
+    assert result == {"הרצל": "Herzl"}
+    assert transliterator.batches == []
+
+
+def test_memory_cache_evicts_least_recently_used():
+    transliterator = RecordingTransliterator(max_size=2)
+    asyncio.run(transliterator.transliterate(["הרצל", "אביב"]))
+    asyncio.run(transliterator.transliterate(["הרצל"]))
+    asyncio.run(transliterator.transliterate(["פרלמן"]))
+
+    assert list(transliterator._memory) == ["הרצל", "פרלמן"]
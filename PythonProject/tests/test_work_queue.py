@@ -0,0 +1,177 @@
+"""
+Tests for the durable work queues (SQLite and Redis streams, the latter on
+the in-process StubRedisStreams) and WorkQueueMessageSource
+"""
+import asyncio
+
+import pytest
+
+from benchmarks.stub_servers import StubRedisStreams
+from services.work_queue import RedisStreamWorkQueue, SQLiteWorkQueue, WorkQueue, WorkQueueMessageSource
+
+VISIBILITY_TIMEOUT = 30
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def make_queue(request, tmp_path, clock):
+    def make(max_attempts: int = 5) -> WorkQueue:
+        if request.param == "sqlite":
+            return SQLiteWorkQueue(str(tmp_path / "queue.db"), visibility_timeout=VISIBILITY_TIMEOUT,
+                                   max_attempts=max_attempts, clock=clock)
+        return RedisStreamWorkQueue(StubRedisStreams(clock=clock), visibility_timeout=VISIBILITY_TIMEOUT,
+                                    max_attempts=max_attempts, block_ms=0)
+    return make
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        WorkQueue()
+
+
+def test_ack_removes_the_message(make_queue, clock):
+    async def scenario():
+        queue = make_queue()
+        await queue.enqueue({"message_id": "m1"})
+        [message] = await queue.receive()
+        assert message.payload == {"message_id": "m1"}
+        assert message.attempts == 1
+        assert await queue.ack(message)
+        clock.advance(VISIBILITY_TIMEOUT + 1)
+        assert await queue.receive() == []
+    run(scenario())
+
+
+def test_leased_message_is_hidden_until_the_visibility_timeout(make_queue, clock):
+    async def scenario():
+        queue = make_queue()
+        await queue.enqueue({"message_id": "m1"})
+        [first] = await queue.receive()
+        clock.advance(VISIBILITY_TIMEOUT - 1)
+        assert await queue.receive() == []
+        clock.advance(2)
+        [second] = await queue.receive()
+        assert second.id == first.id
+        assert second.attempts == 2
+    run(scenario())
+
+
+def test_nack_with_delay_redelivers_after_the_delay(make_queue, clock):
+    async def scenario():
+        queue = make_queue()
+        await queue.enqueue({"message_id": "m1"})
+        [message] = await queue.receive()
+        assert await queue.nack(message, delay=10, error="busy")
+        clock.advance(9)
+        assert await queue.receive() == []
+        clock.advance(2)
+        [retried] = await queue.receive()
+        assert retried.payload == {"message_id": "m1"}
+        assert retried.attempts == 2
+    run(scenario())
+
+
+def test_nack_without_delay_is_visible_at_once(make_queue):
+    async def scenario():
+        queue = make_queue()
+        await queue.enqueue({"message_id": "m1"})
+        [message] = await queue.receive()
+        await queue.nack(message)
+        [retried] = await queue.receive()
+        assert retried.attempts == 2
+    run(scenario())
+
+
+def test_nack_dead_letters_after_max_attempts(make_queue):
+    async def scenario():
+        queue = make_queue(max_attempts=2)
+        await queue.enqueue({"message_id": "m1"})
+        for attempt in (1, 2):
+            [message] = await queue.receive()
+            assert message.attempts == attempt
+            await queue.nack(message, error="processing failed")
+        assert await queue.receive() == []
+        [dead] = await queue.dead_letters()
+        assert dead["payload"] == {"message_id": "m1"}
+        assert dead["attempts"] == 2
+        assert dead["error"] == "processing failed"
+    run(scenario())
+
+
+def test_expired_leases_dead_letter_after_max_attempts(make_queue, clock):
+    async def scenario():
+        queue = make_queue(max_attempts=2)
+        await queue.enqueue({"message_id": "m1"})
+        for _ in range(2):
+            assert len(await queue.receive()) == 1
+            clock.advance(VISIBILITY_TIMEOUT + 1)
+        assert await queue.receive() == []
+        [dead] = await queue.dead_letters()
+        assert dead["payload"] == {"message_id": "m1"}
+        assert dead["error"] == "visibility timeout expired"
+    run(scenario())
+
+
+def test_messages_are_leased_once(make_queue):
+    async def scenario():
+        queue = make_queue()
+        for number in range(5):
+            await queue.enqueue({"message_id": f"m{number}"})
+        first = await queue.receive(3)
+        second = await queue.receive(3)
+        ids = [message.payload["message_id"] for message in first + second]
+        assert sorted(ids) == [f"m{number}" for number in range(5)]
+    run(scenario())
+
+
+def test_message_source_acks_successes_and_backs_off_failures(make_queue, clock):
+    async def scenario():
+        queue = make_queue()
+        source = WorkQueueMessageSource(queue, batch_size=10, retry_delay=5)
+        await queue.enqueue({"message_id": "ok"})
+        await queue.enqueue({"message_id": "fails"})
+        batch = await source.fetch()
+        assert len(batch) == 2
+        for message in batch:
+            status = "failed" if message["message_id"] == "fails" else "completed"
+            await source.ack(message, {"status": status})
+        clock.advance(4)
+        assert await source.fetch() == []
+        clock.advance(2)
+        assert [message["message_id"] for message in await source.fetch()] == ["fails"]
+    run(scenario())
+
+
+def test_deferred_message_is_released_without_using_an_attempt(make_queue, clock):
+    async def scenario():
+        queue = make_queue(max_attempts=1)
+        source = WorkQueueMessageSource(queue, batch_size=10)
+        await queue.enqueue({"message_id": "m1"})
+        for _ in range(3):
+            [message] = await source.fetch()
+            assert await source.defer(message, delay=10)
+            assert await source.fetch() == []
+            clock.advance(11)
+        [message] = await source.fetch()
+        assert message == {"message_id": "m1"}
+        assert await queue.dead_letters() == []
+    run(scenario())